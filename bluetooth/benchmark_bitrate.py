@@ -0,0 +1,108 @@
+"""
+Exercises BitrateController against a throttled local socket.
+
+A socketpair with small kernel buffers stands in for the RFCOMM link: a reader
+thread drains it at a fixed rate that changes every phase. A sender thread
+plays the capture/encode/transmit stages of bluetooth_server.handle_video_feed,
+taking quality, scale and interval from the controller, writing frames whose
+size follows a simple JPEG size model, and reporting each send back to the
+controller. Once a second the link rate, the chosen parameters and the achieved
+latency and frame rate are printed.
+
+Usage:
+    python benchmark_bitrate.py [--rates 60,15,40] [--phase 10] [--target 0.3]
+"""
+import argparse
+import socket
+import threading
+import time
+
+from bitrate_controller import BitrateController
+
+FULL_FRAME_BYTES = 30000  # 420x340 JPEG at quality 80
+
+
+def frame_size(quality, scale):
+    # Rough JPEG size model: proportional to pixel count, growing with quality
+    return int(FULL_FRAME_BYTES * scale * scale * (0.25 + 0.75 * (quality / 80) ** 2))
+
+
+class ThrottledReader:
+    """
+    Drains a socket at `rate` bytes per second, like a slow radio link would.
+    """
+
+    def __init__(self, sock, rate):
+        self.sock = sock
+        self.rate = rate
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        chunk = bytearray(1024)
+        while True:
+            start = time.monotonic()
+            try:
+                count = self.sock.recv_into(chunk)
+            except OSError:
+                return
+            if count == 0:
+                return
+            time.sleep(max(0.0, count / self.rate - (time.monotonic() - start)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rates", default="60,15,40", help="link rate per phase, in kB/s")
+    parser.add_argument("--phase", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--target", type=float, default=0.3, help="target latency in seconds")
+    args = parser.parse_args()
+    rates = [float(rate) * 1000 for rate in args.rates.split(",")]
+
+    sender, receiver = socket.socketpair()
+    for sock in (sender, receiver):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    reader = ThrottledReader(receiver, rates[0])
+    reader.thread.start()
+
+    controller = BitrateController(target_latency=args.target)
+    stop = threading.Event()
+    sent_frames = [0]
+
+    def transmit():
+        while not stop.is_set():
+            captured_at = time.time()
+            quality, scale, interval = controller.params()
+            message = bytes(frame_size(quality, scale))
+            start = time.time()
+            sender.sendall(message)
+            sent = time.time()
+            controller.record(len(message), sent - start, sent - captured_at)
+            sent_frames[0] += 1
+            time.sleep(max(0.0, interval - (time.time() - captured_at)))
+
+    sender_thread = threading.Thread(target=transmit, daemon=True)
+    sender_thread.start()
+
+    print(f"{'t':>4} {'link kB/s':>10} {'quality':>8} {'scale':>6} {'interval':>9} {'fps':>5} "
+          f"{'latency':>8} {'kB/s est':>9}")
+    last_frames = 0
+    elapsed = 0
+    for rate in rates:
+        reader.rate = rate
+        for _ in range(int(args.phase)):
+            time.sleep(1)
+            elapsed += 1
+            stats = controller.stats()
+            fps = sent_frames[0] - last_frames
+            last_frames = sent_frames[0]
+            print(f"{elapsed:>4} {rate / 1000:>10.0f} {stats['quality']:>8} {stats['scale']:>6} "
+                  f"{stats['interval_ms']:>7}ms {fps:>5} {stats['latency_ms']:>6}ms {stats['throughput_kBps']!s:>9}")
+
+    stop.set()
+    sender.close()
+    receiver.close()
+
+
+if __name__ == "__main__":
+    main()
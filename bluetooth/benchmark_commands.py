@@ -0,0 +1,136 @@
+"""
+Drives bursts of commands through bluetooth_server's command channel and checks the results.
+
+Runs bluetooth_server.handle_commands on the simulated backend over a local
+socketpair and checks that:
+
+    framing     commands sent back to back and split at random byte offsets
+                are all parsed, in order
+    coalescing  a burst of drive commands sent during a maneuver collapses into
+                the latest one, which is the one that runs next
+    stop        "stop" sent behind a burst preempts the running maneuver and
+                drops the queue; reports the latency until the motors are off
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python benchmark_commands.py [--bursts 20] [--burst-size 20]
+"""
+import argparse
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+DRIVE_COMMANDS = ["move_forward", "move_backwards", "move_left", "move_right"]
+EXPECTED_MOVING = {"move_forward": "forward", "move_backwards": "backward", "move_left": "left", "move_right": "right"}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def random_commands(count):
+    return [f"{random.choice(DRIVE_COMMANDS)}({random.randint(10, 60)})" for _ in range(count)]
+
+
+def send_split(sock, commands):
+    # Send the commands back to back, cut into pieces at random offsets
+    stream = "".join(commands).encode("utf-8")
+    offset = 0
+    while offset < len(stream):
+        size = random.randint(1, 24)
+        sock.sendall(stream[offset:offset + size])
+        offset += size
+        time.sleep(0.0005)
+
+
+def wait_until(predicate, timeout=10.0):
+    end = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.0005)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bursts", type=int, default=20)
+    parser.add_argument("--burst-size", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault("PICAR_BACKEND", "sim")
+    import bluetooth_server
+
+    px = bluetooth_server.px
+    motion = bluetooth_server.motion
+    received = []
+    move_car = bluetooth_server.move_car
+
+    def recording_move_car(command):
+        received.append(command)
+        move_car(command)
+
+    bluetooth_server.move_car = recording_move_car
+    motion.start()
+    server_end, client_end = socket.socketpair()
+    threading.Thread(target=bluetooth_server.handle_commands, args=(server_end,), daemon=True).start()
+    failures = 0
+
+    # Framing
+    sent = random_commands(args.bursts * args.burst_size) + ["stop"]
+    send_split(client_end, sent)
+    wait_until(lambda: len(received) >= len(sent))
+    ok = received == sent
+    failures += not ok
+    print(f"framing     {'ok' if ok else 'FAILED'}: {len(received)} of {len(sent)} commands parsed in order")
+    wait_until(lambda: motion.pending() == 0)
+
+    # Coalescing
+    wrong = 0
+    before = motion.stats()
+    for _ in range(args.bursts):
+        client_end.sendall(b"move_left(30)")
+        wait_until(lambda: motion.pending() == 1 and px.dir_angle != 0)
+        burst = random_commands(args.burst_size)
+        client_end.sendall("".join(burst).encode("utf-8"))
+        wait_until(lambda: bluetooth_server.car_stats["MOVING"] == EXPECTED_MOVING[burst[-1].split("(")[0]]
+                   and motion.pending() == 0, timeout=15.0)
+        if bluetooth_server.car_stats["MOVING"] != EXPECTED_MOVING[burst[-1].split("(")[0]]:
+            wrong += 1
+    after = motion.stats()
+    replaced = after["replaced"] - before["replaced"]
+    ok = wrong == 0 and replaced == args.bursts * (args.burst_size - 1)
+    failures += not ok
+    print(f"coalescing  {'ok' if ok else 'FAILED'}: {replaced} superseded commands dropped, "
+          f"{wrong} bursts ran something other than their last command")
+
+    # Stop
+    latencies = []
+    leftovers = 0
+    for _ in range(args.bursts):
+        client_end.sendall("".join(random_commands(args.burst_size)).encode("utf-8"))
+        time.sleep(random.uniform(0.05, 1.0))
+        start = time.perf_counter()
+        client_end.sendall(b"stop")
+        wait_until(lambda: px.speed == 0 and bluetooth_server.servos.target("steering") == 0
+                   and bluetooth_server.car_stats["MOVING"] == "stopped")
+        latencies.append(time.perf_counter() - start)
+        wait_until(lambda: motion.pending() == 0, timeout=1.0)
+        leftovers += motion.pending()
+    ok = leftovers == 0 and max(latencies) < 0.05
+    failures += not ok
+    print(f"stop        {'ok' if ok else 'FAILED'}: latency p50 {percentile(latencies, 50) * 1000:.2f} ms   "
+          f"p99 {percentile(latencies, 99) * 1000:.2f} ms, {leftovers} maneuvers left after stop")
+
+    client_end.close()
+    motion.shutdown()
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
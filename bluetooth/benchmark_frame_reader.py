@@ -0,0 +1,107 @@
+"""
+Compares the old `frame_data += recv()` receive loop with frame_reader.FrameReader.
+
+Streams frame + stats message pairs shaped like bluetooth_server's video feed
+over a local socketpair, with sends split into RFCOMM-sized chunks so the
+receiver sees many short reads. Reports receive throughput, bytes copied per
+frame and peak memory allocated while receiving (tracemalloc) for both readers.
+
+Usage:
+    python benchmark_frame_reader.py [--frames 500] [--sizes 20000,40000] [--chunk 1008]
+"""
+import argparse
+import socket
+import threading
+import time
+import tracemalloc
+
+from frame_reader import FrameReader
+
+STATS = b'{"MOVING": "stopped", "SPEED": 0, "TURNING": "no", "DISTANCE": 42.0, "BATTERY": 93.1}'
+
+
+def legacy_read(sock, counters):
+    # The original loop from bluetooth_client.receive_video_feed, counting the bytes it copies:
+    # each recv into a new bytes object, then the whole frame so far into the concatenation
+    size_data = sock.recv(4)
+    frame_size = int.from_bytes(size_data, 'big')
+    frame_data = b""
+    while len(frame_data) < frame_size:
+        packet = sock.recv(frame_size - len(frame_data))
+        frame_data += packet
+        counters["copied"] += len(packet) + len(frame_data)
+    stats_size = int.from_bytes(sock.recv(4), 'big')
+    stats_data = b""
+    while len(stats_data) < stats_size:
+        packet = sock.recv(stats_size - len(stats_data))
+        stats_data += packet
+        counters["copied"] += len(packet) + len(stats_data)
+    return frame_data
+
+
+def build_stream(frames, sizes):
+    messages = []
+    for i in range(frames):
+        frame = bytes(sizes[i % len(sizes)])
+        messages.append(b"".join([len(frame).to_bytes(4, 'big'), frame, len(STATS).to_bytes(4, 'big'), STATS]))
+    return memoryview(b"".join(messages))
+
+
+def send_stream(sock, stream, chunk):
+    for offset in range(0, len(stream), chunk):
+        sock.sendall(stream[offset:offset + chunk])
+
+
+def run(mode, stream, frames, chunk, trace):
+    sender, receiver = socket.socketpair()
+    # A small receive buffer keeps reads short, like RFCOMM packets
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * chunk)
+    thread = threading.Thread(target=send_stream, args=(sender, stream, chunk))
+    reader = FrameReader(receiver)
+    counters = {"copied": 0}
+
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    thread.start()
+    total = 0
+    for _ in range(frames):
+        if mode == "legacy":
+            total += len(legacy_read(receiver, counters))
+        else:
+            total += len(reader.read_message())
+            reader.read_message()
+    elapsed = time.perf_counter() - start
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    thread.join()
+    sender.close()
+    receiver.close()
+
+    if trace:
+        return peak
+    # FrameReader writes every byte once, straight from the socket into its buffer
+    copied = counters["copied"] if mode == "legacy" else len(stream)
+    return total / elapsed, elapsed / frames, copied / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--sizes", default="20000,30000,40000", help="frame sizes in bytes, cycled")
+    parser.add_argument("--chunk", type=int, default=1008, help="bytes per send, e.g. the RFCOMM MTU")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    stream = build_stream(args.frames, sizes)
+
+    print(f"{'reader':<8}{'MB/s':>8}{'us/frame':>10}{'kB copied/frame':>17}{'peak kB':>9}")
+    for mode in ("legacy", "reader"):
+        throughput, per_frame, copied = run(mode, stream, args.frames, args.chunk, trace=False)
+        peak = run(mode, stream, args.frames, args.chunk, trace=True)
+        print(f"{mode:<8}{throughput / 1e6:>8.1f}{per_frame * 1e6:>10.1f}{copied / 1024:>17.1f}{peak / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures idle CPU use and command latency of the RPC event loops.
+
+Runs pi_socket.serve_client (on the simulated hardware backend) and
+windows_socket.run_client in one process, connected by a local socketpair
+instead of RFCOMM. Reports the process CPU use while both loops sit idle,
+then the round trip of set_camera_pan_angle calls as seen through rx_retvals.
+
+Usage:
+    python benchmark_idle_cpu.py [--idle 5] [--calls 200]
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--idle", type=float, default=5.0, help="seconds to measure idle CPU over")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault("PICAR_BACKEND", "sim")
+    import pi_socket
+    import windows_socket
+
+    server_end, client_end = socket.socketpair()
+    server = threading.Thread(target=pi_socket.serve_client, args=(server_end,))
+    client = threading.Thread(target=windows_socket.run_client, args=(client_end,))
+    server.start()
+    client.start()
+    time.sleep(0.5)  # Let the protocol negotiation finish
+
+    cpu_start, wall_start = time.process_time(), time.monotonic()
+    time.sleep(args.idle)
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+    print(f"idle CPU: {cpu / wall * 100:.2f}% of one core over {wall:.1f} s")
+
+    rtts = []
+    for i in range(args.calls):
+        angle = i % 90 - 45
+        start = time.perf_counter()
+        windows_socket.send_supported_func("set_camera_pan_angle", angle)
+        while windows_socket.rx_retvals["camera_pan_angle"] != angle:
+            time.sleep(0.0001)
+        rtts.append(time.perf_counter() - start)
+        windows_socket.rx_retvals["camera_pan_angle"] = None
+    print(f"round trip: p50 {percentile(rtts, 50) * 1000:.2f} ms   p99 {percentile(rtts, 99) * 1000:.2f} ms")
+
+    windows_socket.stop_client()
+    client.join()
+    pi_socket.stop_client()
+    server.join()
+
+
+if __name__ == "__main__":
+    main()
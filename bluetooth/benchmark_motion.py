@@ -0,0 +1,79 @@
+"""
+Checks that maneuvers don't stall the video feed and that stop preempts them quickly.
+
+Runs bluetooth_server.handle_video_feed on the simulated backend into a local
+socketpair and counts the frames received while the car is idle and while it
+is turning back and forth through move_car. Then starts turns and sends "stop"
+at random points, measuring how long it takes until the motors are off and the
+steering is heading back to straight.
+
+Usage:
+    python benchmark_motion.py [--seconds 5] [--stops 50]
+"""
+import argparse
+import os
+import random
+import socket
+import threading
+import time
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0, help="seconds to count frames over, per phase")
+    parser.add_argument("--stops", type=int, default=50)
+    args = parser.parse_args()
+
+    os.environ.setdefault("PICAR_BACKEND", "sim")
+    import bluetooth_server
+    from frame_reader import FrameReader
+
+    px = bluetooth_server.px
+    bluetooth_server.motion.start()
+    server_end, client_end = socket.socketpair()
+    threading.Thread(target=bluetooth_server.handle_video_feed, args=(server_end,), daemon=True).start()
+
+    frames = [0]
+
+    def receive():
+        reader = FrameReader(client_end)
+        while True:
+            reader.read_message()
+            reader.read_message()
+            frames[0] += 1
+
+    threading.Thread(target=receive, daemon=True).start()
+    time.sleep(1.0)
+
+    def count_frames(busy):
+        start_frames = frames[0]
+        end = time.monotonic() + args.seconds
+        while time.monotonic() < end:
+            if busy and bluetooth_server.motion.pending() == 0:
+                bluetooth_server.move_car(random.choice(["move_left(30)", "move_right(30)"]))
+            time.sleep(0.01)
+        return (frames[0] - start_frames) / args.seconds
+
+    print(f"video fps idle:    {count_frames(False):.1f}")
+    print(f"video fps turning: {count_frames(True):.1f}")
+
+    latencies = []
+    for _ in range(args.stops):
+        bluetooth_server.move_car(random.choice(["move_left(30)", "move_right(30)", "move_forward(30)"]))
+        time.sleep(random.uniform(0.05, 1.5))
+        start = time.perf_counter()
+        bluetooth_server.move_car("stop")
+        while px.speed != 0 or bluetooth_server.servos.target("steering") != 0:
+            time.sleep(0.0005)
+        latencies.append(time.perf_counter() - start)
+    print(f"stop latency: p50 {percentile(latencies, 50) * 1000:.2f} ms   "
+          f"p99 {percentile(latencies, 99) * 1000:.2f} ms   max {max(latencies) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
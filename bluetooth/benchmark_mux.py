@@ -0,0 +1,168 @@
+"""
+Measures control-call latency over mux_transport with video saturating the link.
+
+Runs both ends in one process: pi_socket.serve_client (simulated hardware) and
+a video producer writing back-to-back JPEG-sized frames on the car side, and
+windows_socket.run_client plus a video reader on the app side. The two
+Multiplexers are joined by a relay that limits each direction to --rate, with
+small socket buffers so that queueing happens in the transport rather than in
+the kernel, as it does on RFCOMM.
+
+The round trip of call("stop") is measured with the link idle, with video and
+priority scheduling, and with video but chunks sent in arrival order. For the
+video, each frame carries the time it was sent; the report gives the p50
+latency until the reader has it, and how much of that the producer never saw
+because sendall had already returned (what bitrate_controller would miss).
+
+Usage:
+    python benchmark_mux.py [--rate 100] [--calls 100] [--frame-size 30000]
+"""
+import argparse
+import os
+import socket
+import struct
+import threading
+import time
+
+from frame_reader import FrameReader
+from mux_transport import Multiplexer, CONTROL, TELEMETRY, VIDEO, CHUNK_SIZE
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def small_buffers(sock):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * CHUNK_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * CHUNK_SIZE)
+
+
+def relay(source, destination, rate):
+    # Copies source to destination at no more than rate bytes per second
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    try:
+        while True:
+            start = time.monotonic()
+            count = source.recv_into(buffer)
+            if count == 0:
+                break
+            destination.sendall(view[:count])
+            time.sleep(max(0.0, count / rate - (time.monotonic() - start)))
+    except OSError:
+        pass
+    for sock in (source, destination):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+def throttled_link(rate):
+    car_link, car_relay = socket.socketpair()
+    app_link, app_relay = socket.socketpair()
+    for sock in (car_link, car_relay, app_link, app_relay):
+        small_buffers(sock)
+    for source, destination in ((car_relay, app_relay), (app_relay, car_relay)):
+        threading.Thread(target=relay, args=(source, destination, rate), daemon=True).start()
+    return car_link, app_link
+
+
+STAMP = struct.Struct("<d")
+
+
+def produce_video(sock, frame_size, stop, video):
+    frame = bytearray(frame_size)
+    stats = b'{"MOVING": "stopped"}'
+    try:
+        while not stop.is_set():
+            sent = time.perf_counter()
+            STAMP.pack_into(frame, 0, sent)
+            sock.sendall(b"".join([len(frame).to_bytes(4, 'big'), frame, len(stats).to_bytes(4, 'big'), stats]))
+            video["blocked"][sent] = time.perf_counter() - sent
+    except OSError:
+        pass
+
+
+def consume_video(sock, video):
+    reader = FrameReader(sock)
+    try:
+        while True:
+            frame = reader.read_message()
+            sent, = STAMP.unpack_from(frame)
+            video["latency"][sent] = time.perf_counter() - sent
+            video["bytes"] += len(frame)
+            reader.read_message()
+    except OSError:
+        pass
+
+
+def run(pi_socket, windows_socket, mode, args):
+    pi_socket.exit_event.clear()
+    windows_socket.exit_event.clear()
+    car_link, app_link = throttled_link(args.rate * 1000)
+    car = Multiplexer(car_link, prioritize=(mode != "fifo"))
+    app = Multiplexer(app_link, prioritize=(mode != "fifo"))
+    car.start()
+    app.start()
+
+    server = threading.Thread(target=pi_socket.serve_client, args=(car.channel(CONTROL), car.channel(TELEMETRY)))
+    client = threading.Thread(target=windows_socket.run_client, args=(app.channel(CONTROL), app.channel(TELEMETRY)))
+    server.start()
+    client.start()
+    windows_socket.call("stop").result(5)  # Protocol negotiation done
+
+    stop_video = threading.Event()
+    video = {"bytes": 0, "blocked": {}, "latency": {}}  # Per frame, by its send time
+    if mode != "idle":
+        threading.Thread(target=produce_video, args=(car.channel(VIDEO), args.frame_size, stop_video, video),
+                         daemon=True).start()
+        threading.Thread(target=consume_video, args=(app.channel(VIDEO), video), daemon=True).start()
+        time.sleep(1.0)  # Let the video fill every queue
+        video["bytes"] = 0
+        video["latency"].clear()
+
+    rtts = []
+    start = time.monotonic()
+    for _ in range(args.calls):
+        sent = time.perf_counter()
+        windows_socket.call("stop", timeout=30).result()
+        rtts.append(time.perf_counter() - sent)
+        time.sleep(0.02)
+    elapsed = time.monotonic() - start
+    video_rate = video["bytes"] / elapsed / 1000
+    latency = dict(video["latency"])
+    unseen = [latency[sent] - blocked for sent, blocked in list(video["blocked"].items()) if sent in latency]
+    latency = percentile(list(latency.values()), 50) * 1000 if latency else 0.0
+    unseen = percentile(unseen, 50) * 1000 if unseen else 0.0
+
+    stop_video.set()
+    windows_socket.stop_client()
+    client.join()
+    pi_socket.stop_client()
+    server.join()
+    car.close()
+    app.close()
+    print(f"{mode:<14}{percentile(rtts, 50) * 1000:>9.1f}{percentile(rtts, 99) * 1000:>9.1f}{video_rate:>12.1f}"
+          f"{latency:>10.0f}{unseen:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=100.0, help="link rate per direction, in kB/s")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--frame-size", type=int, default=30000)
+    args = parser.parse_args()
+
+    os.environ.setdefault("PICAR_BACKEND", "sim")
+    import pi_socket
+    import windows_socket
+
+    print(f"{'mode':<14}{'p50 ms':>9}{'p99 ms':>9}{'video kB/s':>12}{'video ms':>10}{'unseen ms':>11}")
+    for mode in ("idle", "priority", "fifo"):
+        run(pi_socket, windows_socket, mode, args)
+
+
+if __name__ == "__main__":
+    main()
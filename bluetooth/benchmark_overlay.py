@@ -0,0 +1,94 @@
+"""
+Measures the per-frame cost of drawing the car stats onto video frames.
+
+Compares calling cv2.putText for every stat on every frame, as annotate_frame
+used to, with the cached StatsOverlay used now, at the Bluetooth camera size
+and at 640x480, after checking that both draw the same pixels. The stats
+change every --change-every frames (at 15 fps the sensor poll updates them
+about every 8 frames), and the overlay is also timed at a position moving
+across the frame, partly clipped at the edges.
+
+Usage:
+    python benchmark_overlay.py [--frames 2000] [--change-every 8]
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from stats_overlay import StatsOverlay
+
+SIZES = [(420, 340), (640, 480)]
+
+
+def stats_layout(stats):
+    return [
+        (f"Moving: {stats['MOVING']}", (10, 30)),
+        (f"Speed: {stats['SPEED']}", (210, 30)),
+        (f"Turning: {stats['TURNING']}", (10, 60)),
+        (f"Distance: {stats['DISTANCE']} cm", (210, 60)),
+        (f"Battery: {stats['BATTERY']:.1f} %", (10, 90)),
+    ]
+
+
+def draw_put_text(frame, stats):
+    for text, position in stats_layout(stats):
+        cv2.putText(frame, text, position, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
+
+
+def stats_sequence(count, change_every):
+    stats = {"MOVING": "forward", "SPEED": 30, "TURNING": "no", "DISTANCE": 42.0, "BATTERY": 87.0}
+    sequence = []
+    for i in range(count):
+        if i % change_every == 0:
+            stats = dict(stats, DISTANCE=round(float(np.random.uniform(5, 200)), 2),
+                         BATTERY=float(np.random.uniform(80, 90)))
+        sequence.append(stats)
+    return sequence
+
+
+def time_frames(frames, sequence, draw):
+    start = time.perf_counter()
+    for i, stats in enumerate(sequence):
+        draw(frames[i % len(frames)], stats, i)
+    return (time.perf_counter() - start) / len(sequence)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--change-every", type=int, default=8, help="frames between stats changes")
+    args = parser.parse_args()
+    sequence = stats_sequence(args.frames, args.change_every)
+
+    print(f"{'size':<10}{'method':<24}{'us/frame':>10}{'renders':>9}")
+    for width, height in SIZES:
+        frames = [np.random.randint(0, 256, (height, width, 3), np.uint8) for _ in range(8)]
+        label = f"{width}x{height}"
+
+        overlay = StatsOverlay(stats_layout)
+        for stats in sequence[::args.change_every][:20]:
+            expected, actual = frames[0].copy(), frames[0].copy()
+            draw_put_text(expected, stats)
+            overlay.draw(actual, stats)
+            assert np.array_equal(expected, actual), "overlay differs from putText"
+
+        elapsed = time_frames(frames, sequence, lambda frame, stats, i: draw_put_text(frame, stats))
+        print(f"{label:<10}{'putText per frame':<24}{elapsed * 1e6:>10.1f}{'-':>9}")
+
+        overlay = StatsOverlay(stats_layout)
+        elapsed = time_frames(frames, sequence, lambda frame, stats, i: overlay.draw(frame, stats))
+        print(f"{label:<10}{'cached overlay':<24}{elapsed * 1e6:>10.1f}{overlay.renders:>9}")
+
+        overlay = StatsOverlay(stats_layout)
+
+        def moving(frame, stats, i):
+            overlay.draw(frame, stats, position=(i % width - 100, (i * 3) % height - 40))
+
+        elapsed = time_frames(frames, sequence, moving)
+        print(f"{label:<10}{'cached, moving':<24}{elapsed * 1e6:>10.1f}{overlay.renders:>9}")
+
+
+if __name__ == "__main__":
+    main()
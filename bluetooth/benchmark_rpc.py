@@ -0,0 +1,146 @@
+"""
+Benchmarks the text and binary RPC protocols used by pi_socket.py and windows_socket.py.
+
+Reports bytes on the wire per call for every getter and setter, in-process
+encode + parse throughput, and end-to-end calls per second against
+pi_socket.serve_client running on the simulated hardware backend over a local
+socketpair (no Bluetooth needed).
+
+Usage:
+    python benchmark_rpc.py [--calls 20000] [--batch 32]
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+
+import rpc_protocol
+
+# The request/response calls; subscribe starts server pushes, which would skew the call counts
+CALLS = [entry for entry in rpc_protocol.FUNCS if entry[0] not in ("subscribe", "unsubscribe")]
+
+# Representative arguments for each function
+SAMPLE_ARGS = {
+    "set_camera_pan_angle": (-45,),
+    "set_camera_tilt_angle": (30,),
+    "set_direction_servo_angle": (-30,),
+    "forward": (50,),
+    "backward": (50,),
+}
+SAMPLE_RETVALS = {
+    "battery_voltage": 7.83,
+    "cliff_status": False,
+    "ultrasonic_distance": 123.45,
+    "motor_pwm_percentage": 50.0,
+}
+
+
+def sample_call(func_name, retval_name):
+    return SAMPLE_ARGS.get(func_name, ()), SAMPLE_RETVALS.get(retval_name, -30)
+
+
+def report_bytes():
+    print(f"{'function':<28}{'text B':>8}{'binary B':>10}")
+    total_text = total_binary = 0
+    for func_name, _, retval_name, _ in CALLS:
+        args, value = sample_call(func_name, retval_name)
+        text = (len(rpc_protocol.encode_text_request(func_name, *args))
+                + len(rpc_protocol.encode_text_response(retval_name, value)))
+        binary = (len(rpc_protocol.encode_request(func_name, 1, *args))
+                  + len(rpc_protocol.encode_response(func_name, 1, value)))
+        total_text += text
+        total_binary += binary
+        print(f"{func_name:<28}{text:>8}{binary:>10}")
+    count = len(CALLS)
+    print(f"{'mean per call':<28}{total_text / count:>8.1f}{total_binary / count:>10.1f}")
+
+
+def report_codec(calls):
+    for mode in ("text", "binary"):
+        requests = []
+        for i in range(calls):
+            func_name, _, retval_name, _ = CALLS[i % len(CALLS)]
+            args, _ = sample_call(func_name, retval_name)
+            requests.append((func_name, args))
+
+        start = time.perf_counter()
+        if mode == "text":
+            stream = b"".join(rpc_protocol.encode_text_request(f, *a) for f, a in requests)
+            parser = rpc_protocol.MessageParser(False, rpc_protocol.HELLO_BINARY)
+        else:
+            stream = b"".join(rpc_protocol.encode_request(f, i & 0xFFFF, *a) for i, (f, a) in enumerate(requests))
+            parser = rpc_protocol.MessageParser(False, rpc_protocol.HELLO_BINARY)
+            parser.binary = True
+        parsed = 0
+        for offset in range(0, len(stream), 1024):
+            parsed += len(parser.feed(stream[offset:offset + 1024]))
+        elapsed = time.perf_counter() - start
+        assert parsed == calls
+        print(f"codec {mode:<7} {calls / elapsed:>12.0f} calls/s encode+parse")
+
+
+def run_end_to_end(pi_socket, mode, calls, batch):
+    server_end, client_end = socket.socketpair()
+    pi_socket.exit_event.clear()
+    server = threading.Thread(target=pi_socket.serve_client, args=(server_end,))
+    server.start()
+
+    parser = rpc_protocol.MessageParser(True, rpc_protocol.ACK_BINARY)
+    received = 0
+    wire_bytes = 0
+
+    def read_until(count):
+        nonlocal received, wire_bytes
+        while received < count:
+            data = client_end.recv(65536)
+            wire_bytes += len(data)
+            received += sum(1 for name, _, _ in parser.feed(data) if name != rpc_protocol.ACK_BINARY)
+
+    if mode == "binary":
+        client_end.sendall(rpc_protocol.encode_text_request(rpc_protocol.HELLO_BINARY))
+        while not parser.binary:
+            parser.feed(client_end.recv(1024))
+
+    start = time.perf_counter()
+    sent = 0
+    while sent < calls:
+        chunk = []
+        for i in range(sent, min(calls, sent + batch)):
+            func_name = CALLS[i % len(CALLS)][0]
+            args = SAMPLE_ARGS.get(func_name, ())
+            if mode == "binary":
+                chunk.append(rpc_protocol.encode_request(func_name, i & 0xFFFF, *args))
+            else:
+                chunk.append(rpc_protocol.encode_text_request(func_name, *args))
+        payload = b"".join(chunk)
+        wire_bytes += len(payload)
+        client_end.sendall(payload)
+        sent += len(chunk)
+        read_until(sent)
+    elapsed = time.perf_counter() - start
+
+    client_end.close()
+    server.join()
+    print(f"socket {mode:<7} {calls / elapsed:>11.0f} calls/s   {wire_bytes / calls:6.1f} B/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=32, help="calls written per send in the end-to-end run")
+    args = parser.parse_args()
+
+    os.environ.setdefault("PICAR_BACKEND", "sim")
+    import pi_socket
+
+    report_bytes()
+    print()
+    report_codec(args.calls)
+    print()
+    for mode in ("text", "binary"):
+        run_end_to_end(pi_socket, mode, args.calls, args.batch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares servo bus writes and motion time of servo_motion trajectories with the old stepped loops.
+
+The old steering code in bluetooth_server.move_car wrote every degree with a
+50 ms sleep, one axis after another. This replays a sequence of steering, pan
+and tilt moves both ways against a simulated car that counts servo writes, and
+for the trajectory engine also with setpoints changed mid-motion (slider drags).
+
+Usage:
+    python benchmark_servo.py [--moves 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import hardware
+import servo_motion
+
+
+class CountingCar(hardware.SimulatedCar):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+
+    def set_dir_servo_angle(self, angle):
+        self.writes += 1
+        super().set_dir_servo_angle(angle)
+
+    def set_cam_pan_angle(self, angle):
+        self.writes += 1
+        super().set_cam_pan_angle(angle)
+
+    def set_cam_tilt_angle(self, angle):
+        self.writes += 1
+        super().set_cam_tilt_angle(angle)
+
+
+def random_moves(count):
+    return [{"steering": random.randint(-30, 30), "pan": random.randint(-90, 90), "tilt": random.randint(-30, 60)}
+            for _ in range(count)]
+
+
+def run_stepped(moves, step_time):
+    car = CountingCar()
+    setters = {"steering": car.set_dir_servo_angle, "pan": car.set_cam_pan_angle, "tilt": car.set_cam_tilt_angle}
+    current = {name: 0 for name in setters}
+    start = time.monotonic()
+    for move in moves:
+        for name, target in move.items():
+            step = 1 if target >= current[name] else -1
+            for angle in range(current[name], target + step, step):
+                setters[name](angle)
+                time.sleep(step_time)
+            current[name] = target
+    return car.writes, time.monotonic() - start
+
+
+def run_engine(moves, retarget):
+    car = CountingCar()
+    engine = servo_motion.create_engine(car)
+    start = time.monotonic()
+    for move in moves:
+        if retarget:
+            # Change every axis' mind half way, like a dragged slider
+            for name, target in move.items():
+                engine.set_target(name, -target // 2)
+            time.sleep(0.1)
+        for name, target in move.items():
+            engine.set_target(name, target)
+        for name in move:
+            engine.wait(name)
+    elapsed = time.monotonic() - start
+    ticks = engine.stats()["ticks"]
+    engine.shutdown()
+    return car.writes, elapsed, ticks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--moves", type=int, default=20)
+    parser.add_argument("--step-time", type=float, default=0.05, help="sleep per degree in the stepped loop")
+    args = parser.parse_args()
+    moves = random_moves(args.moves)
+
+    print(f"{'mode':<22}{'writes':>8}{'seconds':>9}{'ticks':>7}")
+    writes, elapsed = run_stepped(moves, args.step_time)
+    print(f"{'stepped, sequential':<22}{writes:>8}{elapsed:>9.2f}{'-':>7}")
+    for retarget in (False, True):
+        servo_motion.engines.clear()
+        writes, elapsed, ticks = run_engine(moves, retarget)
+        label = "trajectory, retarget" if retarget else "trajectory"
+        print(f"{label:<22}{writes:>8}{elapsed:>9.2f}{ticks:>7}")
+
+
+if __name__ == "__main__":
+    main()
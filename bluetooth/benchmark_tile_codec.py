@@ -0,0 +1,108 @@
+"""
+Compares full-JPEG and delta (changed-tile) encoding of the Bluetooth video stream.
+
+Replays a recorded frame sequence through tile_codec.TileEncoder and
+TileDecoder and reports the mean bytes per frame, encode and decode time per
+frame, and the keyframe/delta split, next to plain cv2.imencode/imdecode.
+
+Frames come from a video file or a directory of images; without either, a
+sequence is captured from the simulated camera in hardware.py.
+
+Usage:
+    python benchmark_tile_codec.py [--video drive.mp4 | --images frames/] [--frames 300] [--quality 60]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from tile_codec import TileEncoder, TileDecoder
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def load_frames(args):
+    frames = []
+    if args.video:
+        capture = cv2.VideoCapture(args.video)
+        while len(frames) < args.frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+        capture.release()
+    elif args.images:
+        for name in sorted(os.listdir(args.images))[:args.frames]:
+            frame = cv2.imread(os.path.join(args.images, name), cv2.IMREAD_COLOR)
+            if frame is not None:
+                frames.append(frame)
+    else:
+        import hardware
+        camera = hardware.SimulatedCamera((420, 340), fps=1000)
+        frames = [camera.capture_array() for _ in range(args.frames)]
+    if args.size:
+        width, height = (int(value) for value in args.size.split("x"))
+        frames = [cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA) for frame in frames]
+    return frames
+
+
+def run_jpeg(frames, quality):
+    sizes, encode_time, decode_time = [], 0.0, 0.0
+    for frame in frames:
+        start = time.perf_counter()
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        data = buffer.tobytes()
+        encode_time += time.perf_counter() - start
+        start = time.perf_counter()
+        cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        decode_time += time.perf_counter() - start
+        sizes.append(len(data))
+    return sizes, encode_time, decode_time, None
+
+
+def run_delta(frames, quality):
+    encoder, decoder = TileEncoder(), TileDecoder()
+    sizes, encode_time, decode_time, error = [], 0.0, 0.0, 0.0
+    for frame in frames:
+        start = time.perf_counter()
+        data = encoder.encode(frame, quality)
+        encode_time += time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = decoder.decode(data)
+        decode_time += time.perf_counter() - start
+        sizes.append(len(data))
+        error += cv2.absdiff(decoded, frame).mean()
+    return sizes, encode_time, decode_time, (error / len(frames), encoder.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="video file to read frames from")
+    parser.add_argument("--images", help="directory of frame images, read in name order")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--size", help="resize frames to WIDTHxHEIGHT first, e.g. 420x340")
+    parser.add_argument("--quality", type=int, default=60)
+    args = parser.parse_args()
+
+    frames = load_frames(args)
+    if not frames:
+        parser.error("no frames loaded")
+    height, width = frames[0].shape[:2]
+    print(f"{len(frames)} frames of {width}x{height}, JPEG quality {args.quality}")
+    print(f"{'mode':<8}{'B/frame':>10}{'encode ms':>11}{'decode ms':>11}")
+    for mode, run in (("jpeg", run_jpeg), ("delta", run_delta)):
+        sizes, encode_time, decode_time, extra = run(frames, args.quality)
+        count = len(frames)
+        line = (f"{mode:<8}{sum(sizes) / count:>10.0f}{encode_time / count * 1000:>11.2f}"
+                f"{decode_time / count * 1000:>11.2f}")
+        if extra is not None:
+            error, stats = extra
+            line += f"   mean abs error {error:.2f}   {stats['keyframes']} keyframes, {stats['deltas']} deltas"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Stress test for the transmit queues used by pi_socket.py and windows_socket.py.
+
+First hammers a TxQueue directly from several producer threads against a slow
+consumer, for each overflow policy, and checks that every message is accounted
+for (sent, or coalesced or dropped and passed to on_drop) and that BLOCK
+delivers every unkeyed message exactly once, in per-producer order. Then, round
+after round, several threads wait on a full BLOCK queue to put the same key,
+and every one of their messages must be sent or passed to on_drop.
+
+Then fires thousands of RPC calls from several threads through
+windows_socket.run_client to pi_socket.serve_client (simulated hardware,
+local socketpair) and checks that every getter is answered, every superseded
+setter is cancelled rather than lost, and the last setter value reaches the car.
+
+Usage:
+    python benchmark_tx_queue.py [--threads 8] [--messages 5000]
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+from concurrent.futures import wait
+
+from tx_queue import TxQueue, BLOCK, DROP_OLDEST
+
+
+def stress_queue(policy, threads, messages):
+    discarded = []
+    queue = TxQueue(maxsize=64, policy=policy, on_drop=discarded.append)
+    done = threading.Event()
+    received = []
+
+    def producer(index):
+        for i in range(messages):
+            # Every fourth message is a coalescable setter update
+            if i % 4 == 0:
+                queue.put(("setter", index, i), key=("setter", index))
+            else:
+                queue.put(("call", index, i))
+
+    def consumer():
+        while not done.is_set() or len(queue) > 0:
+            received.extend(queue.drain())
+            time.sleep(0.0005)
+
+    start = time.perf_counter()
+    consumer_thread = threading.Thread(target=consumer)
+    consumer_thread.start()
+    producers = [threading.Thread(target=producer, args=(i,)) for i in range(threads)]
+    for thread in producers:
+        thread.start()
+    for thread in producers:
+        thread.join()
+    done.set()
+    consumer_thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = queue.stats()
+    accounted = stats["sent"] + stats["coalesced"] + stats["dropped"] + stats["queued"]
+    assert stats["enqueued"] == threads * messages == accounted, stats
+    assert stats["sent"] == len(received)
+    assert len(received) + len(discarded) == threads * messages, "message neither sent nor passed to on_drop"
+
+    if policy == BLOCK:
+        assert stats["dropped"] == 0
+        for index in range(threads):
+            calls = [i for kind, producer_index, i in received if kind == "call" and producer_index == index]
+            assert calls == [i for i in range(messages) if i % 4 != 0], f"producer {index} lost or reordered calls"
+            setters = [i for kind, producer_index, i in received if kind == "setter" and producer_index == index]
+            assert setters[-1] == max(i for i in range(messages) if i % 4 == 0), "latest setter value lost"
+
+    print(f"{policy:<12} {stats['enqueued'] / elapsed:>10.0f} msg/s   {stats}")
+
+
+def stress_blocked_key(threads, rounds):
+    discarded = []
+    queue = TxQueue(maxsize=8, policy=BLOCK, on_drop=discarded.append)
+    received = []
+    for round_index in range(rounds):
+        for i in range(queue.maxsize):
+            queue.put(("fill", round_index, i))
+        # None of them finds the key queued, so all wait for room, then race to put it
+        putters = [threading.Thread(target=queue.put, args=(("keyed", round_index, i),), kwargs={"key": "keyed"})
+                   for i in range(threads)]
+        for thread in putters:
+            thread.start()
+        time.sleep(0.005)
+        received.extend(queue.drain())
+        for thread in putters:
+            thread.join()
+        received.extend(queue.drain())
+
+    stats = queue.stats()
+    keyed = [message for message in received if message[0] == "keyed"]
+    assert len(keyed) + len(discarded) == threads * rounds, "keyed message neither sent nor passed to on_drop"
+    assert stats["enqueued"] == stats["sent"] + stats["coalesced"], stats
+    print(f"{'blocked key':<12} {rounds} rounds   keyed sent {len(keyed)}, replaced {len(discarded)}")
+
+
+def stress_rpc(threads, messages):
+    os.environ.setdefault("PICAR_BACKEND", "sim")
+    import pi_socket
+    import windows_socket
+
+    server_end, client_end = socket.socketpair()
+    server = threading.Thread(target=pi_socket.serve_client, args=(server_end,))
+    client = threading.Thread(target=windows_socket.run_client, args=(client_end,))
+    server.start()
+    client.start()
+
+    # Shut both ends down even if a check fails, or their threads keep the process alive
+    try:
+        getters = []
+        setters = []
+        lock = threading.Lock()
+
+        def producer(index):
+            mine_getters = []
+            mine_setters = []
+            for i in range(messages):
+                if i % 2:
+                    mine_getters.append(windows_socket.call("get_ultrasonic_distance", timeout=None))
+                else:
+                    mine_setters.append(windows_socket.send_supported_func("set_camera_pan_angle", i % 90))
+            with lock:
+                getters.extend(mine_getters)
+                setters.extend(mine_setters)
+
+        start = time.perf_counter()
+        producers = [threading.Thread(target=producer, args=(i,)) for i in range(threads)]
+        for thread in producers:
+            thread.start()
+        for thread in producers:
+            thread.join()
+        final = windows_socket.call("set_camera_pan_angle", 7, timeout=None)
+        wait(getters + [final], timeout=30)
+        elapsed = time.perf_counter() - start
+
+        answered = sum(1 for future in getters
+                       if future.done() and not future.cancelled() and future.exception() is None)
+        coalesced = sum(1 for future in setters if future.cancelled())
+        delivered = sum(1 for future in setters if future.done() and not future.cancelled())
+        assert answered == len(getters), f"{len(getters) - answered} getters unanswered"
+        assert coalesced + delivered == len(setters), "setter neither sent nor coalesced"
+        # The reply comes as soon as the target is set; the servo then moves there at its own rate
+        assert final.result() == 7 and pi_socket.servos.target("pan") == 7
+        assert pi_socket.servos.wait("pan", timeout=5) and pi_socket.picar.pan_angle == 7
+
+        print(f"rpc          {(len(getters) + len(setters)) / elapsed:>10.0f} calls/s   "
+              f"getters answered {answered}/{len(getters)}, setters sent {delivered}, coalesced {coalesced}")
+        print(f"             client queue {windows_socket.tx_queue.stats()}")
+    finally:
+        windows_socket.stop_client()
+        client.join()
+        pi_socket.stop_client()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--messages", type=int, default=5000, help="messages per thread")
+    args = parser.parse_args()
+
+    for policy in (BLOCK, DROP_OLDEST):
+        stress_queue(policy, args.threads, args.messages)
+    stress_blocked_key(args.threads, rounds=100)
+    stress_rpc(args.threads, args.messages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Adaptive encoding parameters for the Bluetooth video stream.
+
+The transmit stage reports every frame it sends: its encoded size, how long
+sendall blocked, and the delay since the frame was captured. From those the
+controller keeps moving averages of link throughput and frame latency and
+steers three knobs towards a target latency:
+
+    quality    JPEG quality passed to cv2.imencode
+    scale      downscale factor applied before encoding
+    interval   minimum seconds between captured frames
+
+When latency is above target it degrades quality first, then resolution, then
+frame rate; when latency is well below target it restores them in the reverse
+order. Changes are spaced out by a hold time so each one shows up in the
+averages before the next is made.
+"""
+import threading
+import time
+
+SCALES = (1.0, 0.75, 0.5, 0.35)
+
+
+class BitrateController:
+    """
+    Args:
+        target_latency (float): Capture-to-sent latency to aim for, in seconds.
+        min_quality (int): Lowest JPEG quality used.
+        max_quality (int): Highest JPEG quality used.
+        quality_step (int): Quality change per adjustment.
+        scales (tuple): Downscale factors, from full resolution down.
+        min_interval (float): Shortest frame interval, i.e. 1 / max fps.
+        max_interval (float): Longest frame interval.
+        hold (float): Seconds between adjustments.
+    """
+
+    def __init__(self, target_latency=0.3, min_quality=20, max_quality=80, quality_step=10,
+                 scales=SCALES, min_interval=1 / 15, max_interval=1.0, hold=0.5):
+        self.target_latency = target_latency
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.quality_step = quality_step
+        self.scales = scales
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.hold = hold
+
+        self.quality = max_quality
+        self.scale_index = 0
+        self.interval = min_interval
+
+        self.lock = threading.Lock()
+        self.throughput = None  # Bytes per second while sending, moving average
+        self.latency = None  # Seconds from capture until sent, moving average
+        self.frame_size = None  # Bytes per frame, moving average
+        self.last_change = time.monotonic()
+        self.frames = 0
+
+    @property
+    def scale(self):
+        return self.scales[self.scale_index]
+
+    def params(self):
+        """
+        Returns:
+            tuple: (quality, scale, interval) to use for the next frame.
+        """
+        with self.lock:
+            return self.quality, self.scale, self.interval
+
+    def record(self, size, send_time, latency):
+        """
+        Reports a sent frame and adjusts the parameters if it is time to.
+
+        Args:
+            size (int): Bytes written for the frame.
+            send_time (float): Seconds sendall blocked for.
+            latency (float): Seconds from capture until sendall returned.
+        """
+        with self.lock:
+            self.frames += 1
+            self.frame_size = average(self.frame_size, size)
+            self.latency = average(self.latency, latency)
+            # A send that didn't block only says the link is at least this fast
+            if send_time > 0.001:
+                self.throughput = average(self.throughput, size / send_time)
+                # Never capture faster than the link can carry the current frame size
+                self.interval = min(self.max_interval, max(self.interval, self.link_interval()))
+
+            now = time.monotonic()
+            if now - self.last_change < self.hold:
+                return
+            if self.latency > self.target_latency:
+                changed = self.degrade()
+            elif self.latency < self.target_latency / 2:
+                changed = self.improve()
+            else:
+                changed = False
+            if changed:
+                self.last_change = now
+
+    def degrade(self):
+        if self.quality > self.min_quality:
+            self.quality = max(self.min_quality, self.quality - self.quality_step)
+        elif self.scale_index < len(self.scales) - 1:
+            self.scale_index += 1
+        elif self.interval < self.max_interval:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        else:
+            return False
+        return True
+
+    def link_interval(self):
+        return self.frame_size / self.throughput if self.throughput else 0.0
+
+    def improve(self):
+        # Below the link's own limit a shorter interval would only be raised again
+        if self.interval > max(self.min_interval, self.link_interval() * 1.1):
+            self.interval = max(self.min_interval, self.interval / 1.25)
+        elif self.scale_index > 0:
+            self.scale_index -= 1
+        elif self.quality < self.max_quality:
+            self.quality = min(self.max_quality, self.quality + self.quality_step)
+        else:
+            return False
+        return True
+
+    def stats(self):
+        """
+        Returns:
+            dict: Current parameters and the measurements they were chosen from.
+        """
+        with self.lock:
+            return {
+                "quality": self.quality,
+                "scale": self.scale,
+                "interval_ms": round(self.interval * 1000, 1),
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "throughput_kBps": round(self.throughput / 1000, 1) if self.throughput else None,
+                "frame_kB": round(self.frame_size / 1000, 1) if self.frame_size is not None else None,
+            }
+
+
+def average(current, sample, weight=0.2):
+    return sample if current is None else (1 - weight) * current + weight * sample
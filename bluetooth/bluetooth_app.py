@@ -1,13 +1,18 @@
 import sys
 import threading
-import time
 from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QVBoxLayout, QLabel, QSlider, QWidget
-from PyQt5.QtCore import Qt
-from windows_socket import send_supported_func, rx_retvals, start_client, exit_event
+from PyQt5.QtCore import Qt, pyqtSignal
+from windows_socket import send_supported_func, call, start_client, stop_client
+
+RPC_TIMEOUT = 1.0 # Seconds to wait for a status value before showing N/A
  
 class BluetoothControlWindow(QMainWindow):
+    # Delivers RPC results from the Bluetooth thread to the UI thread
+    rpc_result = pyqtSignal(object, object, str)
+
     def __init__(self):
         super().__init__()
+        self.rpc_result.connect(self.show_rpc_result)
  
         self.initUI()
         self.start_bluetooth_thread()
@@ -104,29 +109,38 @@ class BluetoothControlWindow(QMainWindow):
         print(f"Set tilt angle to {angle}")
  
     def get_battery_voltage(self):
-        send_supported_func('get_battery_voltage')
-        time.sleep(2)  
-        self.battery_label.setText(f"Battery Voltage: {rx_retvals['get_battery_voltage']}")
-        print(f"Battery Voltage: {rx_retvals['get_battery_voltage']}")
+        self.request_value('get_battery_voltage', self.battery_label, "Battery Voltage")
  
     def get_ultrasonic_distance(self):
-        send_supported_func('get_ultrasonic_distance')
-        time.sleep(2)  
-        self.ultrasonic_label.setText(f"Ultrasonic Distance: {rx_retvals['get_ultrasonic_distance']}")
-        print(f"Ultrasonic Distance: {rx_retvals['get_ultrasonic_distance']}")
+        self.request_value('get_ultrasonic_distance', self.ultrasonic_label, "Ultrasonic Distance")
  
     def get_cliff_status(self):
-        send_supported_func('get_cliff_status')
-        time.sleep(2)  
-        self.cliff_label.setText(f"Cliff Status: {rx_retvals['get_cliff_status']}")
-        print(f"Cliff Status: {rx_retvals['get_cliff_status']}")
+        self.request_value('get_cliff_status', self.cliff_label, "Cliff Status")
+ 
+    # Sends a getter without blocking the UI; the label is updated when the answer arrives
+    def request_value(self, func_name, label, caption):
+        future = call(func_name, timeout=RPC_TIMEOUT)
+        future.add_done_callback(lambda f: self.rpc_result.emit(f, label, caption))
+ 
+    def show_rpc_result(self, future, label, caption):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            text = f"{caption}: N/A ({error})"
+        elif isinstance(future.result(), float):
+            text = f"{caption}: {future.result():.2f}"
+        else:
+            text = f"{caption}: {future.result()}"
+        label.setText(text)
+        print(text)
  
     def start_bluetooth_thread(self):
         self.bt_thread = threading.Thread(target=start_client)
         self.bt_thread.start()
  
     def closeEvent(self, event):
-        exit_event.set()
+        stop_client()
         self.bt_thread.join()
         event.accept()
  
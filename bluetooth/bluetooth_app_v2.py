@@ -1,17 +1,29 @@
 import sys
 import threading
-import time
 import socket
-import numpy as np
 import cv2
 from PyQt5.QtWidgets import QApplication, QMainWindow, QPushButton, QVBoxLayout, QLabel, QSlider, QWidget
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, pyqtSignal
 from PyQt5.QtGui import QPixmap, QImage
-from windows_socket import send_supported_func, rx_retvals, start_client, exit_event
+from windows_socket import send_supported_func, call, run_client, stop_client
+from video_receiver import VideoReceiver
+from mux_transport import Multiplexer, CONTROL, TELEMETRY, VIDEO
+
+RPC_TIMEOUT = 1.0 # Seconds to wait for a status value before showing N/A
+RENDER_TIMEOUT = 1.0 # Seconds the decode thread waits for the UI to show a frame
 
 class BluetoothControlWindow(QMainWindow):
+    # Delivers RPC results from the Bluetooth thread to the UI thread
+    rpc_result = pyqtSignal(object, object, str)
+    # Delivers decoded frames from the video decode thread to the UI thread
+    frame_ready = pyqtSignal(QImage)
+
     def __init__(self):
         super().__init__()
+        self.rpc_result.connect(self.show_rpc_result)
+        self.frame_ready.connect(self.show_frame)
+        # Set by the UI thread once the last frame is on screen
+        self.frame_shown = threading.Event()
 
         self.initUI()
         self.start_bluetooth_thread()
@@ -116,68 +128,74 @@ class BluetoothControlWindow(QMainWindow):
 
     # Status functions for getting sensor data
     def get_battery_voltage(self):
-        send_supported_func('get_battery_voltage')
-        time.sleep(2)  # Simulating a delay to receive the data
-        self.battery_label.setText(f"Battery Voltage: {rx_retvals['battery_voltage']}")
-        print(f"Battery Voltage: {rx_retvals['battery_voltage']}")
+        self.request_value('get_battery_voltage', self.battery_label, "Battery Voltage")
 
     def get_ultrasonic_distance(self):
-        send_supported_func('get_ultrasonic_distance')
-        time.sleep(2)
-        self.ultrasonic_label.setText(f"Ultrasonic Distance: {rx_retvals['ultrasonic_distance']}")
-        print(f"Ultrasonic Distance: {rx_retvals['ultrasonic_distance']}")
+        self.request_value('get_ultrasonic_distance', self.ultrasonic_label, "Ultrasonic Distance")
 
     def get_cliff_status(self):
-        send_supported_func('get_cliff_status')
-        time.sleep(2)
-        self.cliff_label.setText(f"Cliff Status: {rx_retvals['cliff_status']}")
-        print(f"Cliff Status: {rx_retvals['cliff_status']}")
-
-    # Video feed handling
-    def update_video_feed(self, frame_data):
-        # Convert the byte data to an image
-        np_arr = np.frombuffer(frame_data, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+        self.request_value('get_cliff_status', self.cliff_label, "Cliff Status")
+
+    # Sends a getter without blocking the UI; the label is updated when the answer arrives
+    def request_value(self, func_name, label, caption):
+        future = call(func_name, timeout=RPC_TIMEOUT)
+        future.add_done_callback(lambda f: self.rpc_result.emit(f, label, caption))
+
+    def show_rpc_result(self, future, label, caption):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            text = f"{caption}: N/A ({error})"
+        elif isinstance(future.result(), float):
+            text = f"{caption}: {future.result():.2f}"
+        else:
+            text = f"{caption}: {future.result()}"
+        label.setText(text)
+        print(text)
+
+    # Video feed handling. Frames are received and decoded off the UI thread (see video_receiver.py).
+    def convert_frame(self, frame):
+        # Runs on the decode thread; the QImage copy owns its pixels, so the frame can change afterwards
         rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         h, w, ch = rgb_image.shape
         bytes_per_line = ch * w
-        qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
+        return QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888).copy()
+
+    def render_frame(self, qt_image, stats):
+        # Hand one frame at a time to the UI; frames arriving meanwhile are merged by the receiver
+        self.frame_shown.clear()
+        self.frame_ready.emit(qt_image)
+        self.frame_shown.wait(RENDER_TIMEOUT)
 
+    def show_frame(self, qt_image):
         # Update QLabel with the new frame
         self.video_label.setPixmap(QPixmap.fromImage(qt_image))
-
-    def receive_video_feed(self, client_socket):
-        while True:
-            try:
-                # Receive the frame size
-                frame_size = int.from_bytes(client_socket.recv(4), 'big')
-                # Receive the actual frame data
-                frame_data = b""
-                while len(frame_data) < frame_size:
-                    packet = client_socket.recv(frame_size - len(frame_data))
-                    if not packet:
-                        return  # Connection closed
-                    frame_data += packet
-
-                # Update video feed with the received frame
-                self.update_video_feed(frame_data)
-
-            except Exception as e:
-                print(f"Error receiving video feed: {e}")
-                break
+        self.frame_shown.set()
 
     def start_bluetooth_thread(self):
-        # Connect to the Bluetooth server and start receiving video
+        # Connect to multiplexed_server.py on the car. RPC calls, telemetry and video share
+        # the one RFCOMM connection as prioritised channels (see mux_transport.py).
         server_addr = 'D8:3A:DD:E9:35:3E'
         server_port = 1
         client_socket = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
         client_socket.connect((server_addr, server_port))  # Make sure these match your PiCar-X setup
-        self.video_thread = threading.Thread(target=self.receive_video_feed, args=(client_socket,))
-        self.video_thread.start()
+        self.link = client_socket
+        self.mux = Multiplexer(client_socket)
+        self.mux.start()
+
+        self.rpc_thread = threading.Thread(target=run_client, args=(self.mux.channel(CONTROL), self.mux.channel(TELEMETRY)))
+        self.rpc_thread.start()
+        self.video_receiver = VideoReceiver(self.mux.channel(VIDEO), self.render_frame, self.convert_frame)
+        self.video_receiver.start()
 
     def closeEvent(self, event):
-        exit_event.set()
-        self.video_thread.join()
+        stop_client()
+        self.rpc_thread.join()
+        self.video_receiver.close()
+        self.frame_shown.set()
+        self.mux.close()
+        self.link.close()
         event.accept()
 
 def main():
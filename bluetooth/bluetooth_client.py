@@ -1,9 +1,9 @@
 import bluetooth
 import cv2
-import numpy as np
-import json
 import threading
 import tkinter as tk
+from video_pipeline import LatestQueue
+from video_receiver import VideoReceiver
 
 # Variables to hold the command state
 current_command = ""
@@ -17,53 +17,25 @@ def connect_to_server():
     return socket_
 
 def receive_video_feed(socket_):
+    # Frames are received and decoded on background threads (see video_receiver.py);
+    # this thread only shows the newest decoded frame and its stats
+    frames = LatestQueue(1)
+    receiver = VideoReceiver(socket_, lambda frame, stats: frames.put((frame, stats)), on_close=frames.close)
+    receiver.start()
     while True:
-        try:
-            # Receive the frame size
-            size_data = socket_.recv(4)
-            if not size_data:
-                print("No data received, closing the connection.")
-                break
-
-            # Read the frame size
-            frame_size = int.from_bytes(size_data, 'big')
-
-            # Receive the frame data
-            frame_data = b""
-            while len(frame_data) < frame_size:
-                frame_data += socket_.recv(frame_size - len(frame_data))
-
-            # Decode the frame
-            np_arr = np.frombuffer(frame_data, np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-
-            # Display the frame
-            cv2.imshow('Camera Feed', frame)
-
-            # After the frame, receive the car stats JSON size
-            stats_size_data = socket_.recv(4)
-            if not stats_size_data:
-                print("No stats data received, closing connection.")
-                break
-
-            # Read the stats size
-            stats_size = int.from_bytes(stats_size_data, 'big')
-
-            # Receive the car stats data
-            stats_data = b""
-            while len(stats_data) < stats_size:
-                stats_data += socket_.recv(stats_size - len(stats_data))
-
-            # Decode and print car stats
-            car_stats = json.loads(stats_data.decode('utf-8'))
-            print("Car Stats:", car_stats)
-
-            # Handle keypress events
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-
-        except Exception as e:
-            print("Error receiving video feed:", e)
+        item = frames.get()
+        if item is None:
+            print("Error receiving video feed:", receiver.error)
+            break
+        frame, car_stats = item
+
+        # Display the frame and print car stats
+        cv2.imshow('Camera Feed', frame)
+        print("Car Stats:", car_stats)
+
+        # Handle keypress events
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            receiver.close()
             break
 
 
@@ -96,6 +68,10 @@ class CarControlApp:
         self.right_button = tk.Button(self.root, text="Move Right", command=self.move_right)
         self.right_button.pack(pady=5)
 
+        # Stop interrupts whatever maneuver the car is running
+        self.stop_button = tk.Button(self.root, text="Stop", command=self.stop)
+        self.stop_button.pack(pady=5)
+
         # Create speed control slider
         self.speed_scale = tk.Scale(self.root, from_=10, to=60, orient=tk.HORIZONTAL, label="Speed", command=self.update_speed)
         self.speed_scale.set(current_speed)  # Set the default speed
@@ -128,6 +104,11 @@ class CarControlApp:
         current_command = f"move_right({current_speed})"
         send_command(self.socket_)
 
+    def stop(self):
+        global current_command
+        current_command = "stop"
+        send_command(self.socket_)
+
     def on_close(self):
         self.socket_.close()  # Close the socket connection
         cv2.destroyAllWindows()  # Close all OpenCV windows
@@ -1,14 +1,24 @@
-import bluetooth
+import os
+import sys
 import cv2
 import json
-from picamera2 import Picamera2
-from picarx import Picarx
-from robot_hat import utils
 from time import sleep, time
 import threading
 
-# Initialize Picarx
-px = Picarx()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import hardware
+from video_pipeline import VideoPipeline
+from bitrate_controller import BitrateController
+from tile_codec import TileEncoder
+from motion_executor import MotionExecutor
+from command_parser import CommandParser
+from stats_overlay import StatsOverlay
+import servo_motion
+
+# Initialize the car (PiCar-X by default; set PICAR_BACKEND=sim to run off the car)
+px = hardware.create_car("picarx")
+# Steering moves along rate-limited trajectories (see servo_motion.py)
+servos = servo_motion.create_engine(px)
 
 # Define car stats
 car_stats = {
@@ -21,20 +31,27 @@ car_stats = {
 car_stats_lock = threading.Lock()
 last_command_time = time()  # Track the time of the last car command
 
-# Initialize Picamera2
-picam2 = Picamera2()
-camera_config = picam2.create_preview_configuration(main={"size": (420, 340), "format": "RGB888"})
-picam2.configure(camera_config)
-picam2.start()
+# Initialize the camera
+picam2 = px.open_camera((420, 340))
+
+SENSOR_INTERVAL = 0.5 # Seconds between battery/distance reads for the overlay
+MAX_FPS = 15 # Upper bound on captured frames per second
+TARGET_LATENCY = 0.3 # Seconds from capture until a frame is sent that the bitrate controller aims for
+# "jpeg" sends every frame as a full JPEG, "delta" sends changed tiles between keyframes (see tile_codec.py)
+VIDEO_ENCODING = os.environ.get("PICAR_VIDEO_ENCODING", "jpeg")
+
+# Chooses JPEG quality, downscale and frame interval from the measured link throughput
+bitrate = BitrateController(target_latency=TARGET_LATENCY, min_interval=1 / MAX_FPS)
 
 def update_battery_and_distance():
-    distance = round(px.ultrasonic.read(), 2)
-    battery_level = (utils.get_battery_voltage() / 8.4) * 100
+    distance = round(px.get_distance(), 2)
+    battery_level = (px.get_battery_voltage() / 8.4) * 100
     with car_stats_lock:
         car_stats["DISTANCE"] = distance
         car_stats["BATTERY"] = battery_level
 
 def start_bluetooth_server():
+    import bluetooth  # PyBluez is only needed to accept the connection, not with the simulated backend
     server_socket = bluetooth.BluetoothSocket(bluetooth.RFCOMM)
     port = bluetooth.PORT_ANY
     server_socket.bind(("", port))
@@ -44,103 +61,179 @@ def start_bluetooth_server():
     print("Accepted connection from", client_info)
     return client_socket
 
-def handle_video_feed(client_socket):
+# Keeps the overlay's battery and distance current without blocking the video pipeline
+def poll_battery_and_distance():
     while True:
-        try:
-            # Capture frame from Picamera2
-            frame = picam2.capture_array()
+        update_battery_and_distance()
+        sleep(SENSOR_INTERVAL)
 
-            # Update battery and distance
-            update_battery_and_distance()
+# Text and baseline position of each stat on the overlay
+def stats_layout(stats):
+    return [
+        (f"Moving: {stats['MOVING']}", (10, 30)),
+        (f"Speed: {stats['SPEED']}", (210, 30)),
+        (f"Turning: {stats['TURNING']}", (10, 60)),
+        (f"Distance: {stats['DISTANCE']} cm", (210, 60)),
+        (f"Battery: {stats['BATTERY']:.1f} %", (10, 90)),
+    ]
 
-            # Lock to read car stats safely
-            with car_stats_lock:
-                # Define positions for each stat
-                moving_text = f"Moving: {car_stats['MOVING']}"
-                speed_text = f"Speed: {car_stats['SPEED']}"
-                turning_text = f"Turning: {car_stats['TURNING']}"
-                distance_text = f"Distance: {car_stats['DISTANCE']} cm"
-                battery_text = f"Battery: {car_stats['BATTERY']:.1f} %"
-
-            # Draw each text on the frame at different positions
-            cv2.putText(frame, moving_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)   # Moving
-            cv2.putText(frame, speed_text, (210, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)    # Speed
-            cv2.putText(frame, turning_text, (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)   # Turning
-            cv2.putText(frame, distance_text, (210, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)  # Distance
-            cv2.putText(frame, battery_text, (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)   # Battery
-
-            # Encode the frame as JPEG with reduced quality (to optimize for Bluetooth)
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 60])
-            frame_data = buffer.tobytes()
-
-            # Send the frame size followed by the frame data
-            client_socket.sendall(len(frame_data).to_bytes(4, 'big'))  # Send frame size first
-            client_socket.sendall(frame_data)  # Then send frame data
-
-            # Send the car stats as JSON separately
-            with car_stats_lock:
-                car_stats_json = json.dumps(car_stats).encode('utf-8')  # Encode JSON stats
-            client_socket.sendall(len(car_stats_json).to_bytes(4, 'big'))  # Send JSON size first
-            client_socket.sendall(car_stats_json)  # Then send JSON data
+# Stats text is only rasterised when it changes, then copied onto each frame
+overlay = StatsOverlay(stats_layout)
 
-        except Exception as e:
-            print(f"Error receiving video feed: {e}")
-            break
+def capture_frame():
+    start = time()
+    frame = picam2.capture_array()
+    # Don't capture faster than the controller's interval; frames the link can't carry would only be dropped
+    _, _, interval = bitrate.params()
+    sleep(max(0.0, interval - (time() - start)))
+    return frame, start
 
-        # Sleep to control frame rate (lower rate for Bluetooth bandwidth)
-        sleep(0.2)
+def annotate_frame(item):
+    frame, captured_at = item
+    # Lock to read car stats safely
+    with car_stats_lock:
+        stats = dict(car_stats)
 
-def move_car(command):
+    overlay.draw(frame, stats)
+    return frame, stats, captured_at
+
+def encode_frame(item, encoder=None):
+    frame, stats, captured_at = item
+    # Quality and resolution follow the link (see bitrate_controller.py)
+    quality, scale, _ = bitrate.params()
+    if scale < 1.0:
+        frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if encoder is not None:
+        return encoder.encode(frame, quality), stats, captured_at
+    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes(), stats, captured_at
+
+# Streams frames through a capture -> annotate -> encode -> transmit pipeline.
+# Each stage has its own thread and the transmit stage always gets the newest encoded
+# frame, so the frame rate is set by the slowest stage (usually the Bluetooth link).
+def handle_video_feed(client_socket):
+    pipeline = None
+    # Each connection starts from a keyframe
+    encoder = TileEncoder() if VIDEO_ENCODING == "delta" else None
+
+    def transmit_frame(item):
+        frame_data, stats, captured_at = item
+        # Car stats are sent with the per-stage pipeline metrics and the current encoding parameters
+        stats = {**stats, "PIPELINE": pipeline.stats(), "BITRATE": bitrate.stats()}
+        if encoder is not None:
+            stats["ENCODING"] = encoder.stats()
+        stats_json = json.dumps(stats).encode('utf-8')
+
+        # Frame size, frame data, JSON size and JSON data in a single write
+        message = b"".join([
+            len(frame_data).to_bytes(4, 'big'),
+            frame_data,
+            len(stats_json).to_bytes(4, 'big'),
+            stats_json,
+        ])
+        start = time()
+        client_socket.sendall(message)
+        sent = time()
+        bitrate.record(len(message), sent - start, sent - captured_at)
+
+    pipeline = VideoPipeline([
+        ("capture", capture_frame),
+        ("annotate", annotate_frame),
+        ("encode", lambda item: encode_frame(item, encoder)),
+        ("transmit", transmit_frame),
+    ])
+    pipeline.start()
+    pipeline.wait()
+    print(f"Error sending video feed: {pipeline.error}")
+
+def update_stats(**values):
+    # Short critical section, so the overlay never waits for a maneuver
     global last_command_time
     with car_stats_lock:
-        if command.startswith("move_forward"):
-            speed = int(command.split("(")[1].strip(')'))
-            car_stats["MOVING"] = "forward"
-            car_stats["SPEED"] = speed
-            car_stats["TURNING"] = "no"
-            last_command_time = time()  # Update last command time
-            px.forward(speed)
-            sleep(0.5)
-            px.stop()
-        elif command.startswith("move_left"):
-            speed = int(command.split("(")[1].strip(')'))
-            car_stats["MOVING"] = "left"
-            car_stats["SPEED"] = speed
-            car_stats["TURNING"] = "yes"
-            last_command_time = time()
-            for angle in range(0, -31, -1):
-                px.set_dir_servo_angle(angle)
-                sleep(0.05)
-            px.forward(speed)
-            sleep(0.5)
-            px.stop()
-            for angle in range(-30, 1):
-                px.set_dir_servo_angle(angle)
-                sleep(0.05)
-        elif command.startswith("move_right"):
-            speed = int(command.split("(")[1].strip(')'))
-            car_stats["MOVING"] = "right"
-            car_stats["SPEED"] = speed
-            car_stats["TURNING"] = "yes"
-            last_command_time = time()
-            for angle in range(0, 31):
-                px.set_dir_servo_angle(angle)
-                sleep(0.05)
-            px.forward(speed)
-            sleep(0.5)
-            px.stop()
-            for angle in range(30, -1, -1):
-                px.set_dir_servo_angle(angle)
-                sleep(0.05)
-        elif command.startswith("move_backwards"):
-            speed = int(command.split("(")[1].strip(')'))
-            car_stats["MOVING"] = "backward"
-            car_stats["SPEED"] = speed
-            car_stats["TURNING"] = "no"
-            last_command_time = time()
+        car_stats.update(values)
+    last_command_time = time()
+
+# Maneuvers run on the motion executor (see motion_executor.py). Each yields the
+# seconds to hold after a step; the finally blocks leave the car stopped and
+# straight if a newer command preempts them.
+def drive(speed, backwards=False):
+    update_stats(MOVING="backward" if backwards else "forward", SPEED=speed, TURNING="no")
+    try:
+        if backwards:
             px.backward(speed)
-            sleep(0.5)
-            px.stop()
+        else:
+            px.forward(speed)
+        yield 0.5
+    finally:
+        px.stop()
+
+def steer(angle):
+    # Holds until the steering servo reaches the angle
+    servos.set_target("steering", angle)
+    while not servos.settled("steering"):
+        yield 0.02
+
+def turn(speed, direction):
+    # direction is -1 for left, 1 for right
+    update_stats(MOVING="left" if direction < 0 else "right", SPEED=speed, TURNING="yes")
+    try:
+        yield from steer(direction * 30)
+        px.forward(speed)
+        yield 0.5
+        px.stop()
+        yield from steer(0)
+    finally:
+        px.stop()
+        servos.set_target("steering", 0)
+
+def stop_car():
+    px.stop()
+    servos.set_target("steering", 0)
+    update_stats(MOVING="stopped", SPEED=0, TURNING="no")
+    yield 0
+
+motion = MotionExecutor()
+
+def move_car(command):
+    """
+    Schedules a command on the motion executor and returns without waiting for it.
+
+    Drive commands wait for the running maneuver, but only the latest one is kept;
+    "stop" preempts the running maneuver and drops anything queued.
+    """
+    if command.startswith("stop"):
+        motion.submit(stop_car(), preempt=True)
+        return
+    try:
+        speed = int(command.split("(")[1].strip(')'))
+    except (IndexError, ValueError):
+        print(f"Ignoring malformed command: {command!r}")
+        return
+    if command.startswith("move_forward"):
+        motion.submit(drive(speed), replace=True)
+    elif command.startswith("move_left"):
+        motion.submit(turn(speed, -1), replace=True)
+    elif command.startswith("move_right"):
+        motion.submit(turn(speed, 1), replace=True)
+    elif command.startswith("move_backwards"):
+        motion.submit(drive(speed, backwards=True), replace=True)
+    else:
+        print(f"Ignoring unknown command: {command!r}")
+
+def handle_commands(client_socket):
+    """
+    Runs received commands until the client disconnects.
+
+    Commands can arrive several to a recv() or split across two, so they are
+    framed by CommandParser rather than taken one per recv().
+    """
+    parser = CommandParser()
+    while True:
+        data = client_socket.recv(1024)
+        if not data:
+            break   # Client closed the connection
+        for command in parser.feed(data):
+            move_car(command)
 
 def reset_stats_after_idle():
     """Reset car stats if the car has been idle"""
@@ -158,24 +251,32 @@ def reset_stats_after_idle():
 def main():
     client_socket = start_bluetooth_server()
 
+    # Read the overlay sensors in the background
+    sensor_thread = threading.Thread(target=poll_battery_and_distance)
+    sensor_thread.daemon = True
+    sensor_thread.start()
+
     # Start the video feed in a separate thread
     video_thread = threading.Thread(target=handle_video_feed, args=(client_socket,))
     video_thread.start()
 
+    # Run maneuvers in the background so the command loop never blocks
+    motion.start()
+
     # Start a thread to reset stats after 2 seconds of inactivity
     idle_reset_thread = threading.Thread(target=reset_stats_after_idle)
     idle_reset_thread.daemon = True  # Ensure this thread stops when the main program ends
     idle_reset_thread.start()
 
     try:
-        while True:
-            # Receive command from client
-            command = client_socket.recv(1024).decode('utf-8')
-            if command:
-                move_car(command)
+        # Receive commands from client
+        handle_commands(client_socket)
     except Exception as e:
         print("Error:", e)
     finally:
+        motion.shutdown()
+        px.stop()
+        servos.shutdown()
         client_socket.close()
         picam2.close()
 
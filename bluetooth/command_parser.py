@@ -0,0 +1,42 @@
+"""
+Framing for the text command channel of bluetooth_server.py.
+
+Commands are sent without a delimiter ("move_forward(30)"), so several can
+arrive in one recv() and one can be split across two. The parser keeps the
+bytes received so far and extracts every complete command by its syntax,
+skipping whitespace and separators between them and discarding anything
+that cannot be the start of a command.
+"""
+import re
+
+COMMAND = re.compile(r"(move_forward|move_backwards|move_left|move_right)\((-?\d+)\)|stop(?:\(\))?")
+# Longest tail kept while waiting for the rest of a split command
+MAX_PARTIAL = 32
+
+
+class CommandParser:
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, data):
+        """
+        Adds received data and returns every command it completes.
+
+        Args:
+            data (bytes): Received bytes.
+
+        Returns:
+            list: Complete commands in order, e.g. ["move_forward(30)", "stop"].
+        """
+        self.buffer += data.decode("utf-8", errors="ignore")
+        commands = []
+        end = 0
+        for match in COMMAND.finditer(self.buffer):
+            garbage = self.buffer[end:match.start()].strip(" \t\r\n;,")
+            if garbage:
+                print(f"Ignoring malformed command data: {garbage!r}")
+            commands.append(match.group(0))
+            end = match.end()
+        # Whatever follows the last command may be the beginning of the next one
+        self.buffer = self.buffer[end:].lstrip(" \t\r\n;,")[-MAX_PARTIAL:]
+        return commands
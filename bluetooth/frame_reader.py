@@ -0,0 +1,57 @@
+"""
+Reader for the length-prefixed video stream sent by bluetooth_server.handle_video_feed.
+
+Every message is a 4-byte big-endian length followed by that many bytes. The
+reader fills one preallocated bytearray with recv_into through a memoryview,
+growing it only when a larger message arrives, and loops until each length
+header and body is complete, so short reads can't desynchronise the stream.
+"""
+
+
+class FrameReader:
+    """
+    Args:
+        sock: Connected stream socket.
+        initial_size (int): Initial buffer size in bytes; grows to fit the largest message.
+    """
+
+    def __init__(self, sock, initial_size=64 * 1024):
+        self.sock = sock
+        self.buffer = bytearray(initial_size)
+        self.view = memoryview(self.buffer)
+        self.header = bytearray(4)
+        self.header_view = memoryview(self.header)
+        # PyBluez sockets may not implement recv_into
+        self.recv_into = getattr(sock, "recv_into", None) or self.copy_recv_into
+
+    def copy_recv_into(self, view, size):
+        data = self.sock.recv(size)
+        view[:len(data)] = data
+        return len(data)
+
+    def read_into(self, view, size):
+        received = 0
+        while received < size:
+            count = self.recv_into(view[received:size], size - received)
+            if count == 0:
+                raise ConnectionError("Connection closed by the server")
+            received += count
+
+    def read_message(self):
+        """
+        Reads one length-prefixed message.
+
+        Returns:
+            memoryview: The message bytes. They live in the reader's buffer and
+            are overwritten by the next read, so decode or copy them first.
+
+        Raises:
+            ConnectionError: The connection was closed.
+        """
+        self.read_into(self.header_view, 4)
+        size = int.from_bytes(self.header, 'big')
+        if size > len(self.buffer):
+            self.buffer = bytearray(max(size, 2 * len(self.buffer)))
+            self.view = memoryview(self.buffer)
+        self.read_into(self.view, size)
+        return self.view[:size]
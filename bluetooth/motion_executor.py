@@ -0,0 +1,106 @@
+"""
+Runs car maneuvers on their own thread, one time slice at a time.
+
+A maneuver is a generator: it performs a step (e.g. one servo write), then
+yields how many seconds to hold before the next step. The executor waits out
+each hold on a condition variable instead of sleeping, so a newly submitted
+command is noticed immediately. A preempting command closes the running
+maneuver, which raises GeneratorExit at its current yield so `finally`
+blocks can stop the motors, and starts at once; other commands queue behind
+the current one. A replacing command also queues, but drops the maneuvers
+still waiting, so a backlog of superseded drive commands collapses into the
+latest one.
+"""
+import threading
+import time
+from collections import deque
+
+
+class MotionExecutor:
+    def __init__(self):
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.current = None
+        self.preempted = False
+        self.running = False
+        self.thread = None
+        self.counters = {"submitted": 0, "replaced": 0, "preempted": 0, "completed": 0}
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="motion", daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        with self.cond:
+            self.running = False
+            self.queue.clear()
+            self.preempted = True
+            self.cond.notify()
+        self.thread.join()
+
+    def submit(self, maneuver, preempt=False, replace=False):
+        """
+        Schedules a maneuver.
+
+        Args:
+            maneuver (generator): Maneuver to run, e.g. `drive(30)`.
+            preempt (bool): Abort the running maneuver and drop queued ones, then run this one.
+            replace (bool): Drop queued maneuvers and run this one after the running one.
+        """
+        with self.cond:
+            self.counters["submitted"] += 1
+            if preempt or replace:
+                self.counters["replaced"] += len(self.queue)
+                self.queue.clear()
+            if preempt and self.current is not None:
+                self.counters["preempted"] += 1
+                self.preempted = True
+            self.queue.append(maneuver)
+            self.cond.notify()
+
+    def pending(self):
+        with self.cond:
+            return len(self.queue) + (self.current is not None)
+
+    def stats(self):
+        """
+        Returns:
+            dict: submitted, replaced (dropped from the queue unrun), preempted and completed counts.
+        """
+        with self.cond:
+            return dict(self.counters)
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.queue or not self.running)
+                if not self.running:
+                    return
+                maneuver = self.current = self.queue.popleft()
+                self.preempted = False
+
+            completed = self.run_maneuver(maneuver)
+            with self.cond:
+                self.current = None
+                self.counters["completed"] += completed
+
+    def run_maneuver(self, maneuver):
+        try:
+            for hold in maneuver:
+                # Hold until the step's time is up, waking early if preempted
+                deadline = time.monotonic() + (hold or 0)
+                with self.cond:
+                    while not self.preempted:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.cond.wait(remaining)
+                    if self.preempted:
+                        return False
+            return True
+        except Exception as e:
+            print(f"Maneuver failed: {e}")
+            return False
+        finally:
+            maneuver.close()
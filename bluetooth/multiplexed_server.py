@@ -0,0 +1,61 @@
+"""
+Serves RPC, pushed telemetry and the video feed to one client over a single RFCOMM connection.
+
+Replaces running pi_socket.py and bluetooth_server.py side by side, which made
+two RFCOMM channels compete for the link with no prioritisation. The streams
+are carried as channels of a mux_transport.Multiplexer; the client side is
+bluetooth_app_v2.py.
+
+Usage (on the Pi):
+    python multiplexed_server.py
+"""
+import socket
+import threading
+
+import pi_socket
+import bluetooth_server
+from mux_transport import Multiplexer, CONTROL, TELEMETRY, VIDEO
+
+
+def serve(link):
+    """
+    Runs one client session on a connected socket until the client disconnects or SIGINT.
+    """
+    mux = Multiplexer(link)
+    mux.start()
+
+    rpc_thread = threading.Thread(target=pi_socket.serve_client, args=(mux.channel(CONTROL), mux.channel(TELEMETRY)))
+    video_thread = threading.Thread(target=bluetooth_server.handle_video_feed, args=(mux.channel(VIDEO),))
+    video_thread.daemon = True
+    rpc_thread.start()
+    video_thread.start()
+
+    # The session ends with the RPC connection
+    rpc_thread.join()
+    mux.close()
+    link.close()
+
+
+def main():
+    server_sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
+    server_sock.bind((pi_socket.server_addr, pi_socket.server_port))
+    server_sock.listen(1)
+    print("Waiting for Bluetooth connection...")
+    link, address = server_sock.accept()
+    print(f"Connected to client at {address}")
+
+    # Read the overlay sensors in the background
+    sensor_thread = threading.Thread(target=bluetooth_server.poll_battery_and_distance)
+    sensor_thread.daemon = True
+    sensor_thread.start()
+
+    try:
+        serve(link)
+    finally:
+        server_sock.close()
+        bluetooth_server.picam2.close()
+    print("Disconnected.")
+
+
+if __name__ == "__main__":
+    main()
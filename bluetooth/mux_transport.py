@@ -0,0 +1,215 @@
+"""
+Multiplexes the control (RPC), telemetry and video streams over one RFCOMM connection.
+
+Each stream is a channel. On the link every chunk of a channel's bytes is framed as:
+
+    channel  uint8    CONTROL, TELEMETRY or VIDEO
+    length   uint16   number of payload bytes that follow, at most CHUNK_SIZE
+    payload
+
+Outgoing chunks are scheduled by channel priority (CONTROL first, VIDEO last),
+so a `stop` call never queues behind the rest of a 30 kB JPEG, only behind the
+video already handed to the link: up to 4 chunks in the link's send buffer,
+plus whatever the link itself still holds (on RFCOMM, the adapter's own
+buffers). benchmark_mux.py measures a `stop` round trip of about 60 ms p50
+under video at 100 kB/s, against about 1 ms idle and about 95 ms with chunks
+sent in arrival order. A smaller send buffer doesn't remove that latency
+(most of it is in the link), and it costs video throughput.
+
+A channel is only read from its producer while fewer than `max_queued` of its
+chunks are waiting, and the channel sockets have buffers of a few chunks, so
+only a few kB can sit between a producer and the link. Once the link falls
+behind, the producer's sendall blocks as it would on a dedicated RFCOMM socket,
+and bitrate_controller sees the latency.
+
+Existing code keeps working unchanged: channel() returns one end of a local
+socketpair that behaves like a dedicated connection for that stream, e.g. for
+pi_socket.serve_client, windows_socket.run_client or VideoReceiver.
+"""
+import socket
+import struct
+import threading
+from collections import deque
+from queue import Queue
+
+from frame_reader import FrameReader
+
+CONTROL = 0
+TELEMETRY = 1
+VIDEO = 2
+CHANNELS = (CONTROL, TELEMETRY, VIDEO)  # Highest priority first
+
+HEADER = struct.Struct("<BH")
+CHUNK_SIZE = 1000  # Bytes of payload per chunk, about one RFCOMM packet
+MAX_QUEUED_CHUNKS = 4
+
+
+class Multiplexer:
+    """
+    Args:
+        link: Connected socket shared by all channels.
+        prioritize (bool): Schedule chunks by channel priority; False sends them in arrival order.
+        chunk_size (int): Maximum payload bytes per chunk.
+        max_queued (int): Chunks per channel waiting for the link before its producer is pushed back.
+    """
+
+    def __init__(self, link, prioritize=True, chunk_size=CHUNK_SIZE, max_queued=MAX_QUEUED_CHUNKS):
+        self.link = link
+        self.prioritize = prioritize
+        self.chunk_size = chunk_size
+        self.max_queued = max_queued
+        # Keep little unsent data in the kernel, where it can't be overtaken by control chunks
+        try:
+            link.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * chunk_size)
+        except OSError:
+            pass
+
+        self.local = {}  # Our end of each channel's socketpair
+        self.remote = {}  # The end handed out by channel()
+        self.outgoing = {}  # Chunks waiting for the link, per channel
+        self.incoming = {}  # Payloads waiting to be delivered to the local socket, per channel
+        for channel in CHANNELS:
+            self.local[channel], self.remote[channel] = socket.socketpair()
+            # Small buffers, like a dedicated RFCOMM socket's. With the defaults a producer's
+            # sendall returns while hundreds of kB still wait in front of the link
+            for sock in (self.local[channel], self.remote[channel]):
+                for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+                    try:
+                        sock.setsockopt(socket.SOL_SOCKET, option, 4 * chunk_size)
+                    except OSError:
+                        pass
+            self.outgoing[channel] = deque()
+            self.incoming[channel] = Queue()
+        self.arrival = deque()  # Channel of every queued chunk, in order, when not prioritizing
+        self.cond = threading.Condition()
+        self.closed = False
+        self.counters = {channel: {"sent": 0, "received": 0} for channel in CHANNELS}
+        self.threads = []
+
+    def channel(self, channel):
+        """
+        Returns:
+            socket.socket: Socket carrying the given channel's stream.
+        """
+        return self.remote[channel]
+
+    def start(self):
+        targets = [(self.write_link, ()), (self.read_link, ())]
+        for channel in CHANNELS:
+            targets.append((self.read_channel, (channel,)))
+            targets.append((self.deliver, (channel,)))
+        for target, args in targets:
+            thread = threading.Thread(target=target, args=args, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def close(self):
+        """
+        Ends the session: the link and every channel socket see the connection close.
+        """
+        with self.cond:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+        for sock in (self.link, *self.local.values()):
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for channel in CHANNELS:
+            self.incoming[channel].put(None)
+
+    def wait(self):
+        """
+        Blocks until the session is closed.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.closed)
+
+    def read_channel(self, channel):
+        sock = self.local[channel]
+        queue = self.outgoing[channel]
+        try:
+            while True:
+                data = sock.recv(self.chunk_size)
+                if not data:
+                    break
+                with self.cond:
+                    self.cond.wait_for(lambda: len(queue) < self.max_queued or self.closed)
+                    if self.closed:
+                        break
+                    queue.append(data)
+                    if not self.prioritize:
+                        self.arrival.append(channel)
+                    self.cond.notify_all()
+        except OSError:
+            pass
+        self.close()
+
+    def next_chunk(self):
+        if self.prioritize:
+            for channel in CHANNELS:
+                if self.outgoing[channel]:
+                    return channel, self.outgoing[channel].popleft()
+            return None, None
+        if self.arrival:
+            channel = self.arrival.popleft()
+            return channel, self.outgoing[channel].popleft()
+        return None, None
+
+    def write_link(self):
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: any(self.outgoing.values()) or self.closed)
+                    if self.closed:
+                        break
+                    channel, data = self.next_chunk()
+                    self.counters[channel]["sent"] += len(data)
+                    self.cond.notify_all()
+                self.link.sendall(HEADER.pack(channel, len(data)) + data)
+        except OSError:
+            pass
+        self.close()
+
+    def read_link(self):
+        # Only its exact-read loop is used; chunks go into their own buffers
+        reader = FrameReader(self.link, initial_size=0)
+        header = bytearray(HEADER.size)
+        payload = bytearray(0xFFFF)
+        header_view, payload_view = memoryview(header), memoryview(payload)
+        try:
+            while not self.closed:
+                reader.read_into(header_view, HEADER.size)
+                channel, length = HEADER.unpack(header)
+                reader.read_into(payload_view, length)
+                if channel in self.incoming:
+                    self.incoming[channel].put(bytes(payload_view[:length]))
+                    self.counters[channel]["received"] += length
+        except OSError:
+            pass
+        self.close()
+
+    def deliver(self, channel):
+        # One thread per channel, so a slow video consumer never holds up control replies
+        sock = self.local[channel]
+        queue = self.incoming[channel]
+        try:
+            while True:
+                data = queue.get()
+                if data is None:
+                    break
+                sock.sendall(data)
+        except OSError:
+            pass
+        self.close()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Bytes sent and received and chunks queued, per channel.
+        """
+        with self.cond:
+            return {channel: {**self.counters[channel], "queued": len(self.outgoing[channel])}
+                    for channel in CHANNELS}
@@ -1,10 +1,16 @@
 import socket
+import selectors
 import threading
-from collections import deque
 import signal
 import time
-from picarx import Picarx
-from robot_hat import utils
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import hardware
+import rpc_protocol
+import servo_motion
+from tx_queue import TxQueue, BLOCK
 
 server_addr = 'D8:3A:DD:E9:35:3E'
 server_port = 1
@@ -17,16 +23,27 @@ sock = None
 
 exit_event = threading.Event()
 
-tx_message_deque = deque([])
-rx_message_deque = deque([])
-output = ""
+# Writing to wakeup_send interrupts the select() in serve_client, e.g. for shutdown
+wakeup_recv, wakeup_send = socket.socketpair()
+wakeup_send.setblocking(False)
+select_timeout = 1.0 # Backstop for a missed wakeup, in seconds
+
+# Pushed telemetry, set up by the client calling subscribe()
+telemetry_subscription = None
+telemetry_heartbeat = 5.0 # Seconds after which every subscribed value is re-sent
+min_telemetry_interval_ms = 20
 
-tx_lock = threading.Lock()
-rx_lock = threading.Lock()
+# Results waiting to be sent. The loop stops reading requests while it holds
+# tx_high_water or more, so replies are never dropped and the client is pushed
+# back on through the socket instead.
+tx_queue = TxQueue(maxsize=1024, policy=BLOCK)
+tx_high_water = 256
 
-# Instantiate Picar-X
-picar = Picarx()
+# Instantiate Picar-X (set PICAR_BACKEND=sim to run off the car)
+picar = hardware.create_car("picarx")
 picar.stop()    # This instantiates the motors' PWM percentage to 0
+# Steering, pan and tilt move along rate-limited trajectories (see servo_motion.py)
+servos = servo_motion.create_engine(picar)
 
 # TODO: *args is used to ensure that the function accepts null (ie. '') args, but unsure if this is needed.
 def get_battery_voltage(*args) -> float:
@@ -36,7 +53,7 @@ def get_battery_voltage(*args) -> float:
     Returns:
         float: Battery voltage.
     """
-    return utils.get_battery_voltage()
+    return picar.get_battery_voltage()
 
 def get_cliff_status(*args) -> bool:
     """
@@ -45,7 +62,7 @@ def get_cliff_status(*args) -> bool:
     Returns:
         bool: Cliff detection status.
     """
-    return picar.get_cliff_status(picar.get_grayscale_data())
+    return picar.get_cliff_status()
 
 def get_direction_servo_angle(*args) -> int:
     """
@@ -54,7 +71,7 @@ def get_direction_servo_angle(*args) -> int:
     Returns:
         int: Direction servo's angle, in degrees.
     """
-    return picar.dir_current_angle
+    return picar.get_dir_servo_angle()
 
 def get_motor_pwm_percentage(*args) -> int:
     """
@@ -66,7 +83,7 @@ def get_motor_pwm_percentage(*args) -> int:
     Returns:
         int: Motor pulse width modulation percentage
     """
-    return picar.motor_speed_pins[1].pulse_width_percent()
+    return picar.get_motor_pwm_percentage()
 
 def get_ultrasonic_distance(*args) -> float:
     """
@@ -79,44 +96,44 @@ def get_ultrasonic_distance(*args) -> float:
 
 def set_camera_pan_angle(angle) -> int:
     """
-    Sets camera pan angle.
+    Sets camera pan angle. The servo moves there along a trajectory.
 
     Args:
         angle (int): Camera pan angle, in degrees.
 
     Returns:
-        int: New servo angle, in degrees.
+        int: Target servo angle, in degrees.
     """
-    picar.set_cam_pan_angle(int(angle))
+    servos.set_target("pan", int(angle))
     # We do not have access to the pan servo's angle, so we echo the set value
     return int(angle)
 
 def set_camera_tilt_angle(angle) -> int:
     """
-    Sets camera tilt angle.
+    Sets camera tilt angle. The servo moves there along a trajectory.
 
     Args:
         angle (int): Camera tilt angle, in degrees.
 
     Returns:
-        int: New servo angle, in degrees.
+        int: Target servo angle, in degrees.
     """
-    picar.set_cam_tilt_angle(int(angle))
+    servos.set_target("tilt", int(angle))
     # We do not have access to the tilt servo's angle, so we echo the set value
     return int(angle)
 
 def set_direction_servo_angle(angle) -> int:
     """
-    Sets direction servo angle.
+    Sets direction servo angle. The servo moves there along a trajectory.
 
     Args:
         angle (int): Direction servo angle, in degrees.
 
     Returns:
-        int: New servo angle, in degrees.
+        int: Target servo angle, in degrees.
     """
-    picar.set_dir_servo_angle(int(angle))
-    return get_direction_servo_angle()
+    servos.set_target("steering", int(angle))
+    return int(angle)
 
 def forward(speed):
     """
@@ -154,30 +171,161 @@ def stop(*args):
     picar.stop()
     return get_motor_pwm_percentage()
 
-def call_supported_func(func_name, *args):
-    supported_funcs = {
-        "get_battery_voltage": (get_battery_voltage, "battery_voltage"),
-        "get_cliff_status": (get_cliff_status, "cliff_status"),
-        "get_direction_servo_angle": (get_direction_servo_angle, "direction_servo_angle"),
-        "get_motor_pwm_percentage": (get_motor_pwm_percentage, "motor_pwm_percentage"),
-        "get_ultrasonic_distance": (get_ultrasonic_distance, "ultrasonic_distance"),
-        "set_camera_pan_angle": (set_camera_pan_angle, "camera_pan_angle"),
-        "set_camera_tilt_angle": (set_camera_tilt_angle, "camera_tilt_angle"),
-        "set_direction_servo_angle": (set_direction_servo_angle, "direction_servo_angle"),
-        "forward": (forward, "motor_pwm_percentage"),
-        "backward": (backward, "motor_pwm_percentage"),
-        "stop": (stop, "motor_pwm_percentage"),
+def subscribe(mask, interval_ms, deadband=0) -> int:
+    """
+    Subscribes the client to pushed telemetry.
+
+    The subscribed values are sampled every interval_ms. A telemetry message with
+    the values that moved by more than deadband since they were last pushed is
+    sent after each sample, and every value is re-sent at least every
+    telemetry_heartbeat seconds. Replaces any previous subscription.
+
+    Args:
+        mask (int): rpc_protocol.telemetry_mask of the values to push.
+        interval_ms (int): Sampling interval, in milliseconds.
+        deadband (float): Minimum change of a numeric value worth pushing.
+
+    Returns:
+        int: Mask of the values that will be pushed.
+    """
+    global telemetry_subscription
+    names = [name for name in rpc_protocol.telemetry_names(int(mask)) if name in telemetry_sources]
+    telemetry_subscription = {
+        "names": names,
+        "interval": max(int(interval_ms), min_telemetry_interval_ms) / 1000,
+        "deadband": float(deadband),
+        "last_values": {},
+        "last_sent": 0.0,
+        "next_sample": time.monotonic(),
+        "seq": 0,
     }
+    return rpc_protocol.telemetry_mask(names)
 
+def unsubscribe(*args) -> int:
+    """
+    Stops pushed telemetry.
+
+    Returns:
+        int: Mask of the values that will be pushed, always 0.
+    """
+    global telemetry_subscription
+    telemetry_subscription = None
+    return 0
+
+supported_funcs = {
+    "get_battery_voltage": (get_battery_voltage, "battery_voltage"),
+    "get_cliff_status": (get_cliff_status, "cliff_status"),
+    "get_direction_servo_angle": (get_direction_servo_angle, "direction_servo_angle"),
+    "get_motor_pwm_percentage": (get_motor_pwm_percentage, "motor_pwm_percentage"),
+    "get_ultrasonic_distance": (get_ultrasonic_distance, "ultrasonic_distance"),
+    "set_camera_pan_angle": (set_camera_pan_angle, "camera_pan_angle"),
+    "set_camera_tilt_angle": (set_camera_tilt_angle, "camera_tilt_angle"),
+    "set_direction_servo_angle": (set_direction_servo_angle, "direction_servo_angle"),
+    "forward": (forward, "motor_pwm_percentage"),
+    "backward": (backward, "motor_pwm_percentage"),
+    "stop": (stop, "motor_pwm_percentage"),
+    "subscribe": (subscribe, "subscription"),
+    "unsubscribe": (unsubscribe, "subscription"),
+}
+
+# Getters for the values a client can subscribe to
+telemetry_sources = {
+    "battery_voltage": get_battery_voltage,
+    "ultrasonic_distance": get_ultrasonic_distance,
+    "cliff_status": get_cliff_status,
+    "motor_pwm_percentage": get_motor_pwm_percentage,
+    "direction_servo_angle": get_direction_servo_angle,
+}
+
+def poll_telemetry(binary):
+    """
+    Samples the subscribed values if the subscription interval has elapsed.
+
+    Returns:
+        bytes: Encoded telemetry to push, or None if nothing needs sending.
+    """
+    subscription = telemetry_subscription
+    now = time.monotonic()
+    if subscription is None or now < subscription["next_sample"]:
+        return None
+    subscription["next_sample"] = now + subscription["interval"]
+
+    heartbeat = now - subscription["last_sent"] >= telemetry_heartbeat
+    last_values = subscription["last_values"]
+    changed = {}
+    for name in subscription["names"]:
+        value = telemetry_sources[name]()
+        last = last_values.get(name)
+        if heartbeat or last is None:
+            changed[name] = value
+        elif isinstance(value, bool) or isinstance(last, bool):
+            if value != last:
+                changed[name] = value
+        elif abs(value - last) > subscription["deadband"]:
+            changed[name] = value
+
+    if not changed:
+        return None
+    last_values.update(changed)
+    subscription["last_sent"] = now
+    subscription["seq"] = (subscription["seq"] + 1) & 0xFFFF
+    if binary:
+        return rpc_protocol.encode_telemetry(changed, subscription["seq"])
+    return rpc_protocol.encode_text_telemetry(changed)
+
+def call_supported_func(func_name, *args):
+    """
+    Calls a supported function.
+
+    Returns:
+        tuple: (return value name, return value), or None if the function is unsupported.
+    """
     func, retval_name = supported_funcs.get(func_name, (None, None))
     if func is None:
         print(f"Received unsupported function call: {func_name}({args})")
         return None
 
-    return f"{retval_name} {func(*args)}\r\n"
+    return retval_name, func(*args)
 
-def handler(signum, frame):
+def handle_message(message, binary):
+    """
+    Runs one parsed request and encodes its response.
+
+    Args:
+        message (tuple): (func_name, req_id, args) from rpc_protocol.MessageParser.
+        binary (bool): Whether the connection is in binary mode.
+
+    Returns:
+        bytes: Encoded response, or None if there is nothing to send.
+    """
+    func_name, req_id, args = message
+    try:
+        result = call_supported_func(func_name, *args)
+    except Exception as e:
+        # E.g. bad arguments, or a function the car backend doesn't implement:
+        # answer as for an unsupported call rather than end the connection
+        print(f"Function call failed: {func_name}({args}): {e!r}")
+        result = None
+    if binary:
+        if result is None:
+            return rpc_protocol.encode_response(None, req_id, None)
+        return rpc_protocol.encode_response(func_name, req_id, result[1])
+    if result is None:
+        return None
+    return rpc_protocol.encode_text_response(*result)
+
+def wakeup():
+    try:
+        wakeup_send.send(b"\0")
+    except OSError:
+        pass    # A wakeup is already pending
+
+def stop_client():
     exit_event.set()
+    wakeup()
+
+def handler(signum, frame):
+    stop_client()
 
 signal.signal(signal.SIGINT, handler)
 
@@ -186,11 +334,6 @@ def start_client():
     global server_port
     global server_sock
     global sock
-    global exit_event
-    global tx_message_deque
-    global output
-    global tx_lock
-    global rx_lock
 
     server_sock = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
     server_sock.bind((server_addr, server_port))
@@ -201,75 +344,125 @@ def start_client():
     print(f"Connected to client at {address}")
 
     server_sock.settimeout(None)
-    sock.setblocking(0)
+    serve_client(sock)
 
-    # Server loop
-    while not exit_event.is_set():
+    # Cleanup
+    server_sock.close()
+    print("Client thread closed")
 
-        # Receive message from the client
-        if rx_lock.acquire(blocking=False):
-            data = ""
-            try:
-                data = sock.recv(1024).decode('utf-8')
+def serve_client(sock, telemetry_sock=None):
+    """
+    Serves RPC requests on a connected socket until exit_event is set or the client disconnects.
 
-            # If no data received, continue to status reporting
-            except socket.error:
-                pass
+    The loop sleeps in select() until the socket is readable, writable with
+    responses pending, or woken for shutdown, so it uses no CPU while idle.
 
-            except Exception as e:
-                exit_event.set()
-                continue
+    Requests are text until the client sends rpc_protocol.HELLO_BINARY; the server
+    acknowledges and both sides switch to binary frames.
 
-            # Add received messages to corresponding deque
-            output += data
-            output_split = output.split("\r\n")
+    Args:
+        sock: Connected socket carrying requests and responses.
+        telemetry_sock: Socket for pushed telemetry, e.g. the TELEMETRY channel of a
+            mux_transport.Multiplexer. By default telemetry is sent on sock.
+    """
+    global exit_event
 
-            # Only add messages to the deque if the termination sequence was received
-            if len(output_split) > 1:
-                rx_message_deque.extend(output_split[:len(output_split) - 1])
+    parser = rpc_protocol.MessageParser(responses=False, switch_line=rpc_protocol.HELLO_BINARY)
+    binary = False
+    sock.setblocking(0)
 
-            # Update received output to any remaining message fragment
-            # Will be an empty string if there is no remaining message fragment
-            output = output_split[-1]
-            rx_lock.release()
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    selector.register(wakeup_recv, selectors.EVENT_READ)
+    events = selectors.EVENT_READ
+    pending = b""
 
-        # Parse function and args to call from message
-        if len(rx_message_deque) > 0:
-            rx_message_parts = rx_message_deque.popleft().split(" ")
-            func_name = rx_message_parts.pop(0)
+    # Server loop
+    while not exit_event.is_set():
+        # Only wait for writability while there is something to send, and only
+        # read more requests while the backlog of results is below the high water mark
+        wanted = selectors.EVENT_WRITE if pending or len(tx_queue) > 0 else 0
+        if len(tx_queue) < tx_high_water:
+            wanted |= selectors.EVENT_READ
+        if wanted != events:
+            selector.modify(sock, wanted)
+            events = wanted
+
+        # Wake up in time for the next telemetry sample
+        timeout = select_timeout
+        if telemetry_subscription is not None:
+            timeout = max(0.0, min(timeout, telemetry_subscription["next_sample"] - time.monotonic()))
+
+        for key, mask in selector.select(timeout):
+            if key.fileobj is wakeup_recv:
+                try:
+                    wakeup_recv.recv(buf_size)
+                except BlockingIOError:
+                    pass
+                continue
 
-            # Call function with args
-            ret_val = call_supported_func(func_name, *rx_message_parts)
+            # Receive messages from the client
+            if mask & selectors.EVENT_READ:
+                try:
+                    data = sock.recv(buf_size)
+                except BlockingIOError:
+                    data = None
+                except Exception:
+                    exit_event.set()
+                    break
 
-            # Queue results of called function for transmission
-            if tx_lock.acquire(blocking=False):
-                tx_message_deque.append(ret_val)
-                tx_lock.release()
+                # Client closed the connection
+                if data == b"":
+                    exit_event.set()
+                    break
 
-        # Send each message in the deque
-        if tx_lock.acquire(blocking=False):
-            if(len(tx_message_deque) > 0):
-                # Attempt sending the current message
+                # Call each complete message, any trailing fragment stays in the parser
                 try:
-                    bytes_sent = sock.send(bytes(tx_message_deque[0], 'utf-8'))
-
-                # Close server when exception is raised
+                    messages = parser.feed(data or b"")
+                except Exception as e:
+                    print(f"Closing connection on a malformed request: {e!r}")
+                    exit_event.set()
+                    break
+                for message in messages:
+                    if message[0] == rpc_protocol.HELLO_BINARY:
+                        ret_val = rpc_protocol.ACK_BINARY.encode('utf-8') + rpc_protocol.TERMINATOR
+                        binary = True
+                    else:
+                        ret_val = handle_message(message, binary)
+
+                    # Queue results of called function for transmission
+                    if ret_val is not None:
+                        tx_queue.put(ret_val)
+
+            # Send as much of the queued results as the socket accepts
+            if not pending and len(tx_queue) > 0:
+                pending = b"".join(tx_queue.drain())
+            if pending:
+                try:
+                    bytes_sent = sock.send(pending)
+                except BlockingIOError:
+                    bytes_sent = 0
                 except Exception:
                     exit_event.set()
-                    continue
+                    break
 
-                # If the socket did not send the entire message, set the current message to the remaining bytes
-                if bytes_sent < len(tx_message_deque[0]):
-                    print(tx_message_deque, tx_message_deque[0][bytes_sent:])
-                    tx_message_deque[0] = tx_message_deque[0][bytes_sent:]
-                else:
-                    tx_message_deque.popleft()
-            tx_lock.release()
+                # Keep whatever the socket did not accept for the next write
+                pending = pending[bytes_sent:]
 
-    # Cleanup
-    server_sock.close()
+        # Queue telemetry for the client's subscription, sent on the next pass
+        telemetry = poll_telemetry(binary)
+        if telemetry is not None:
+            if telemetry_sock is None:
+                tx_queue.put(telemetry)
+            else:
+                try:
+                    telemetry_sock.sendall(telemetry)
+                except Exception:
+                    exit_event.set()
+
+    unsubscribe()
+    selector.close()
     sock.close()
-    print("Client thread closed")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,281 @@
+"""
+Wire protocol for the RFCOMM RPC between pi_socket.py and windows_socket.py.
+
+Text mode (the default) sends "func arg1 arg2\\r\\n" requests and
+"retval_name value\\r\\n" responses.
+
+Binary mode is negotiated by the client sending HELLO_BINARY as a text message
+and the server answering ACK_BINARY; everything after those lines is framed as:
+
+    length   uint16   number of bytes that follow (opcode + request id + payload)
+    opcode   uint8    index into FUNCS, with RESPONSE_FLAG set on responses
+    req_id   uint16   chosen by the client and echoed back in the response
+    payload           packed arguments (requests) or return value (responses)
+
+All fields are little-endian. Arguments and return values are packed as listed
+in FUNCS (int16 unless noted). A binary call is about a third of the bytes of a
+text one, and with every frame's struct and encoder looked up from tables
+built at import, it is also cheaper to encode and parse (see benchmark_rpc.py).
+
+Telemetry pushed by the server after a "subscribe" call is sent as a response
+with TELEMETRY_OPCODE and a sequence number in place of the request id; its
+payload is a uint16 mask of the TELEMETRY_VALUES present followed by those
+values in order. In text mode it is "telemetry name=value name=value\r\n".
+"""
+import struct
+
+HELLO_BINARY = "hello binary"
+ACK_BINARY = "protocol binary"
+TERMINATOR = b"\r\n"
+
+RESPONSE_FLAG = 0x80
+ERROR_OPCODE = 0x7F  # Response opcode (with RESPONSE_FLAG) for an unsupported request
+TELEMETRY_OPCODE = 0x7E  # Response opcode (with RESPONSE_FLAG) for pushed telemetry
+TELEMETRY = "telemetry"
+
+LENGTH = struct.Struct("<H")
+HEADER = struct.Struct("<BH")
+FRAME_HEADER = struct.Struct("<HBH")  # LENGTH + HEADER, unpacked in one call
+
+# (function name, argument format, return value name, return value format), indexed by opcode
+FUNCS = [
+    ("get_battery_voltage", "", "battery_voltage", "f"),
+    ("get_cliff_status", "", "cliff_status", "?"),
+    ("get_direction_servo_angle", "", "direction_servo_angle", "h"),
+    ("get_motor_pwm_percentage", "", "motor_pwm_percentage", "f"),
+    ("get_ultrasonic_distance", "", "ultrasonic_distance", "f"),
+    ("set_camera_pan_angle", "h", "camera_pan_angle", "h"),
+    ("set_camera_tilt_angle", "h", "camera_tilt_angle", "h"),
+    ("set_direction_servo_angle", "h", "direction_servo_angle", "h"),
+    ("forward", "h", "motor_pwm_percentage", "f"),
+    ("backward", "h", "motor_pwm_percentage", "f"),
+    ("stop", "", "motor_pwm_percentage", "f"),
+    # Arguments: value mask, sample interval in ms, deadband. Returns the accepted mask.
+    ("subscribe", "HHf", "subscription", "H"),
+    ("unsubscribe", "", "subscription", "H"),
+]
+
+# Values a client can subscribe to, in bit order of the subscription mask
+TELEMETRY_VALUES = [
+    ("battery_voltage", "f"),
+    ("ultrasonic_distance", "f"),
+    ("cliff_status", "?"),
+    ("motor_pwm_percentage", "f"),
+    ("direction_servo_angle", "h"),
+]
+TELEMETRY_MASK = struct.Struct("<H")
+
+ARG_STRUCTS = [struct.Struct("<" + arg_format) for _, arg_format, _, _ in FUNCS]
+RETVAL_STRUCTS = [struct.Struct("<" + retval_format) for _, _, _, retval_format in FUNCS]
+
+# Whole frames (length, opcode, req_id, payload) packed in a single call
+REQUEST_FRAMES = [struct.Struct("<HBH" + arg_format) for _, arg_format, _, _ in FUNCS]
+RESPONSE_FRAMES = [struct.Struct("<HBH" + retval_format) for _, _, _, retval_format in FUNCS]
+
+CONVERTERS = {"h": int, "H": int, "f": float, "?": bool}
+ARG_CONVERTERS = [[CONVERTERS[code] for code in arg_format] for _, arg_format, _, _ in FUNCS]
+RETVAL_CONVERTERS = [CONVERTERS[retval_format] for _, _, _, retval_format in FUNCS]
+
+# Everything encode_request and encode_response need, found with one dict lookup per call:
+# (bound pack, frame length field, opcode, converters)
+REQUEST_ENCODERS = {func_name: (packer.pack, packer.size - LENGTH.size, opcode, ARG_CONVERTERS[opcode])
+                    for opcode, ((func_name, _, _, _), packer) in enumerate(zip(FUNCS, REQUEST_FRAMES))}
+RESPONSE_ENCODERS = {func_name: (packer.pack, packer.size - LENGTH.size, opcode | RESPONSE_FLAG,
+                                 RETVAL_CONVERTERS[opcode])
+                     for opcode, ((func_name, _, _, _), packer) in enumerate(zip(FUNCS, RESPONSE_FRAMES))}
+
+
+def frame(opcode, req_id, payload=b""):
+    return LENGTH.pack(HEADER.size + len(payload)) + HEADER.pack(opcode, req_id) + payload
+
+
+def encode_text_request(func_name, *args):
+    """
+    Returns:
+        bytes: "func arg1 arg2\\r\\n" request.
+    """
+    return " ".join([func_name, *(str(arg) for arg in args)]).encode("utf-8") + TERMINATOR
+
+
+def encode_text_response(retval_name, value):
+    """
+    Returns:
+        bytes: "retval_name value\\r\\n" response.
+    """
+    return f"{retval_name} {value}".encode("utf-8") + TERMINATOR
+
+
+def encode_request(func_name, req_id, *args):
+    """
+    Packs a binary request frame.
+
+    Args:
+        func_name (str): Name of the function to call, from FUNCS.
+        req_id (int): Request id, 0-65535.
+        *args: Function arguments.
+
+    Returns:
+        bytes: Framed request.
+    """
+    pack, length, opcode, converters = REQUEST_ENCODERS[func_name]
+    if not args:
+        return pack(length, opcode, req_id)
+    return pack(length, opcode, req_id, *[convert(arg) for convert, arg in zip(converters, args)])
+
+
+def encode_response(func_name, req_id, value):
+    """
+    Packs a binary response frame, or an error frame if func_name is unsupported.
+
+    Returns:
+        bytes: Framed response.
+    """
+    encoder = RESPONSE_ENCODERS.get(func_name)
+    if encoder is None:
+        return frame(ERROR_OPCODE | RESPONSE_FLAG, req_id)
+    pack, length, opcode, convert = encoder
+    return pack(length, opcode, req_id, convert(value))
+
+
+def telemetry_mask(names):
+    """
+    Returns:
+        int: Subscription mask for the given TELEMETRY_VALUES names.
+    """
+    return sum(1 << index for index, (name, _) in enumerate(TELEMETRY_VALUES) if name in names)
+
+
+def telemetry_names(mask):
+    """
+    Returns:
+        list: TELEMETRY_VALUES names selected by a subscription mask, in bit order.
+    """
+    return [name for index, (name, _) in enumerate(TELEMETRY_VALUES) if mask & (1 << index)]
+
+
+def telemetry_struct(mask):
+    return struct.Struct("<" + "".join(code for index, (_, code) in enumerate(TELEMETRY_VALUES) if mask & (1 << index)))
+
+
+def encode_telemetry(values, seq):
+    """
+    Packs a binary telemetry frame.
+
+    Args:
+        values (dict): Values by TELEMETRY_VALUES name.
+        seq (int): Frame sequence number, 0-65535.
+
+    Returns:
+        bytes: Framed telemetry.
+    """
+    mask = telemetry_mask(values)
+    packer = telemetry_struct(mask)
+    converted = [CONVERTERS[code](values[name]) for name, code in TELEMETRY_VALUES if name in values]
+    return frame(TELEMETRY_OPCODE | RESPONSE_FLAG, seq, TELEMETRY_MASK.pack(mask) + packer.pack(*converted))
+
+
+def encode_text_telemetry(values):
+    """
+    Returns:
+        bytes: "telemetry name=value ...\r\n" message.
+    """
+    fields = [f"{name}={values[name]}" for name, _ in TELEMETRY_VALUES if name in values]
+    return " ".join([TELEMETRY, *fields]).encode("utf-8") + TERMINATOR
+
+
+class MessageParser:
+    """
+    Incremental parser for one direction of the RPC stream.
+
+    Received bytes accumulate in a single reusable bytearray; complete messages
+    are decoded in place with struct.unpack_from and consumed bytes are dropped
+    once per feed, so the accumulated stream is never re-split.
+
+    Every message is returned as a (name, req_id, values) tuple: requests are
+    named after the function, responses after the return value, and text
+    messages have a req_id of None and string values. Bytes in a text line that
+    aren't UTF-8 are decoded as U+FFFD, so a corrupt line arrives as an
+    unsupported call. When the text line `switch_line` is seen it is returned
+    as a message and the parser switches to binary mode for everything that
+    follows.
+
+    Args:
+        responses (bool): True to parse responses (client side), False for requests.
+        switch_line (str): Text line after which the stream is binary.
+    """
+
+    def __init__(self, responses, switch_line):
+        self.buffer = bytearray()
+        self.responses = responses
+        self.switch_line = switch_line
+        self.binary = False
+
+    def feed(self, data):
+        """
+        Adds received bytes and returns every message they complete.
+
+        Args:
+            data (bytes-like): Received bytes.
+
+        Returns:
+            list: Parsed (name, req_id, values) tuples, in order.
+        """
+        self.buffer += data
+        messages = []
+        offset = 0
+        while True:
+            if self.binary:
+                message, offset = self.parse_frame(offset)
+            else:
+                message, offset = self.parse_line(offset)
+            if message is None:
+                break
+            messages.append(message)
+        del self.buffer[:offset]
+        return messages
+
+    def parse_line(self, offset):
+        end = self.buffer.find(TERMINATOR, offset)
+        if end < 0:
+            return None, offset
+        # A corrupt byte must not raise: the line would stay in the buffer and jam every later feed
+        line = self.buffer[offset:end].decode("utf-8", errors="replace")
+        if line == self.switch_line:
+            self.binary = True
+            return (line, None, []), end + len(TERMINATOR)
+        parts = line.split(" ")
+        return (parts[0], None, parts[1:]), end + len(TERMINATOR)
+
+    def parse_frame(self, offset):
+        buffer = self.buffer
+        if len(buffer) - offset < FRAME_HEADER.size:
+            # Every frame has at least the opcode and request id after its length
+            return None, offset
+        length, opcode, req_id = FRAME_HEADER.unpack_from(buffer, offset)
+        end = offset + LENGTH.size + length
+        if len(buffer) < end:
+            return None, offset
+
+        payload_offset = offset + FRAME_HEADER.size
+        if self.responses:
+            opcode &= ~RESPONSE_FLAG
+            if opcode == TELEMETRY_OPCODE:
+                return (TELEMETRY, req_id, self.parse_telemetry(payload_offset, end)), end
+        packers = RETVAL_STRUCTS if self.responses else ARG_STRUCTS
+        if opcode >= len(FUNCS) or end - payload_offset < packers[opcode].size:
+            # Unsupported opcode or truncated payload
+            return (None, req_id, ()), end
+
+        values = packers[opcode].unpack_from(buffer, payload_offset)
+        func_name, _, retval_name, _ = FUNCS[opcode]
+        return (retval_name if self.responses else func_name, req_id, values), end
+
+    def parse_telemetry(self, offset, end):
+        if end - offset < TELEMETRY_MASK.size:
+            return {}
+        mask, = TELEMETRY_MASK.unpack_from(self.buffer, offset)
+        packer = telemetry_struct(mask)
+        if end - offset - TELEMETRY_MASK.size < packer.size:
+            return {}
+        values = packer.unpack_from(self.buffer, offset + TELEMETRY_MASK.size)
+        return dict(zip(telemetry_names(mask), values))
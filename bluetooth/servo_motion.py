@@ -0,0 +1,180 @@
+"""
+Rate-limited servo trajectories for steering and camera pan/tilt.
+
+Every axis follows a trapezoidal velocity profile towards its target: it
+accelerates at up to `max_accel`, cruises at up to `max_velocity`, and brakes
+in time to stop on the target. The profile is recomputed from the current
+position and velocity on every tick, so a new target set mid-motion blends in
+smoothly instead of restarting the move.
+
+All axes are advanced together from one fixed-rate control tick, so steering,
+pan and tilt can move at the same time. An angle is only written to the servo
+when its rounded value changes, and the tick thread sleeps while every axis is
+at rest, so the bus sees one write per degree moved rather than one per tick.
+"""
+import math
+import threading
+import time
+
+TICK_RATE = 50 # Control ticks per second
+
+# Axis name: (car setter name, max velocity in deg/s, max acceleration in deg/s^2)
+SERVO_AXES = {
+    "steering": ("set_dir_servo_angle", 60.0, 300.0),
+    "pan": ("set_cam_pan_angle", 120.0, 600.0),
+    "tilt": ("set_cam_tilt_angle", 120.0, 600.0),
+}
+
+
+class ServoAxis:
+    """
+    Args:
+        write (callable): Sets the servo angle, in degrees.
+        max_velocity (float): Degrees per second.
+        max_accel (float): Degrees per second squared.
+        angle (float): Starting angle.
+    """
+
+    def __init__(self, write, max_velocity, max_accel, angle=0.0):
+        self.write = write
+        self.max_velocity = max_velocity
+        self.max_accel = max_accel
+        self.position = float(angle)
+        self.velocity = 0.0
+        self.target = float(angle)
+        self.written = None
+        self.writes = 0
+
+    def at_rest(self):
+        return self.position == self.target and self.velocity == 0.0
+
+    def step(self, dt):
+        error = self.target - self.position
+        # Fastest speed from which the axis can still brake to a stop on the target
+        braking_velocity = math.sqrt(2 * self.max_accel * abs(error))
+        desired = math.copysign(min(self.max_velocity, braking_velocity), error)
+        change = max(-self.max_accel * dt, min(self.max_accel * dt, desired - self.velocity))
+        self.velocity += change
+        self.position += self.velocity * dt
+
+        # Braking ends on (or just past) the target; settle there
+        remaining = self.target - self.position
+        if abs(remaining) < 0.01 or (remaining > 0) != (error > 0):
+            self.position = self.target
+            self.velocity = 0.0
+
+        angle = round(self.position)
+        if angle != self.written:
+            self.write(angle)
+            self.written = angle
+            self.writes += 1
+
+
+class ServoEngine:
+    """
+    Runs the trajectories of several servo axes from one control tick.
+
+    Args:
+        axes (dict): ServoAxis by name.
+        rate (float): Control ticks per second.
+    """
+
+    def __init__(self, axes, rate=TICK_RATE):
+        self.axes = axes
+        self.period = 1.0 / rate
+        self.cond = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.ticks = 0
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name="servo-motion", daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+    def set_target(self, name, angle):
+        """
+        Moves an axis towards a new angle; replaces any target it is still moving to.
+        """
+        with self.cond:
+            self.axes[name].target = float(angle)
+            self.cond.notify_all()
+
+    def target(self, name):
+        with self.cond:
+            return self.axes[name].target
+
+    def settled(self, name):
+        with self.cond:
+            return self.axes[name].at_rest()
+
+    def wait(self, name, timeout=None):
+        """
+        Blocks until an axis reaches its target.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        with self.cond:
+            return self.cond.wait_for(lambda: self.axes[name].at_rest(), timeout)
+
+    def run(self):
+        next_tick = time.monotonic()
+        while True:
+            with self.cond:
+                if not self.running:
+                    return
+                if all(axis.at_rest() for axis in self.axes.values()):
+                    # Nothing to do until a new target arrives
+                    self.cond.wait_for(lambda: not self.running or not all(a.at_rest() for a in self.axes.values()))
+                    next_tick = time.monotonic()
+                    continue
+                for axis in self.axes.values():
+                    if not axis.at_rest():
+                        axis.step(self.period)
+                self.ticks += 1
+                self.cond.notify_all()
+
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()    # Fell behind; don't try to catch up
+
+    def stats(self):
+        """
+        Returns:
+            dict: Control ticks run and servo writes made, per axis.
+        """
+        with self.cond:
+            return {"ticks": self.ticks, **{name: axis.writes for name, axis in self.axes.items()}}
+
+
+# Engines created so far, by id of the car they drive
+engines = {}
+
+
+def create_engine(car):
+    """
+    Returns the running servo engine for a car, creating it on first use.
+
+    The engine is shared, like the car from hardware.create_car, so every
+    module in a process moves the servos through the same trajectories.
+    """
+    if id(car) not in engines:
+        axes = {name: ServoAxis(getattr(car, setter), velocity, accel)
+                for name, (setter, velocity, accel) in SERVO_AXES.items()}
+        engines[id(car)] = ServoEngine(axes)
+        engines[id(car)].start()
+    return engines[id(car)]
@@ -0,0 +1,123 @@
+"""
+Cached text overlay for the car stats drawn on every video frame.
+
+Drawing the stats with cv2.putText costs five text rasterisations per frame,
+although the stats change only a few times a second. StatsOverlay keeps the
+rasterised text as a small panel with a mask of the text pixels, re-rendering
+only the lines whose text changed, and on every frame copies just the masked
+pixels onto the frame with cv2.copyTo.
+
+The text is aliased, as annotate_frame always drew it, so it needs no
+blending. Blending anti-aliased text over the panel, even only where its mask
+is set, costs more than the putText calls it replaces.
+"""
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+
+def overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class StatsOverlay:
+    """
+    Args:
+        layout (callable): Turns a stats dict into a list of (text, (x, y)) pairs,
+            positions being text baselines relative to the panel origin.
+        position (tuple): (x, y) of the panel origin on the frame.
+        color (tuple): BGR text colour.
+        font_scale (float): cv2.putText font scale.
+        thickness (int): cv2.putText line thickness.
+    """
+
+    def __init__(self, layout, position=(0, 0), color=(255, 255, 255), font_scale=0.6, thickness=1):
+        self.layout = layout
+        self.position = position
+        self.color = color
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.items = None
+        self.boxes = None
+        self.bounds = None  # Panel (left, top, right, bottom) relative to the origin
+        self.mask = None  # 255 where there is text, uint8 height x width
+        self.tile = None  # Text in colour over black, uint8 height x width x 3
+        self.renders = 0
+
+    def text_box(self, text, origin):
+        (width, height), baseline = cv2.getTextSize(text, FONT, self.font_scale, self.thickness)
+        x, y = origin
+        # Strokes reach a thickness beyond the nominal size
+        return (x - self.thickness, y - height - self.thickness,
+                x + width + self.thickness, y + baseline + self.thickness)
+
+    def render(self, items):
+        boxes = [self.text_box(text, origin) for text, origin in items]
+        same_layout = self.items is not None and [o for _, o in items] == [o for _, o in self.items]
+        if same_layout and all(self.inside(box) for box in boxes):
+            dirty = [(min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                     for old, new, a, b in zip(self.items, items, self.boxes, boxes) if old != new]
+        else:
+            bounds = [min(box[0] for box in boxes), min(box[1] for box in boxes),
+                      max(box[2] for box in boxes), max(box[3] for box in boxes)]
+            if same_layout:
+                # Only grow, so a reading that gets a digit longer and shorter again doesn't re-layout each time
+                bounds = [min(bounds[0], self.bounds[0]), min(bounds[1], self.bounds[1]),
+                          max(bounds[2], self.bounds[2]), max(bounds[3], self.bounds[3])]
+            self.bounds = tuple(bounds)
+            shape = (bounds[3] - bounds[1], bounds[2] - bounds[0])
+            self.mask = np.zeros(shape, np.uint8)
+            self.tile = np.zeros(shape + (3,), np.uint8)
+            dirty = [self.bounds]
+        self.items, self.boxes = items, boxes
+        for box in dirty:
+            self.redraw(box)
+        self.renders += 1
+
+    def inside(self, box):
+        return (box[0] >= self.bounds[0] and box[1] >= self.bounds[1]
+                and box[2] <= self.bounds[2] and box[3] <= self.bounds[3])
+
+    def redraw(self, box):
+        left, top = self.bounds[:2]
+        area = (slice(box[1] - top, box[3] - top), slice(box[0] - left, box[2] - left))
+        mask, tile = self.mask[area], self.tile[area]
+        mask[:] = 0
+        tile[:] = 0
+        # Neighbouring lines can reach into the cleared box, so redraw everything that overlaps it
+        for (text, (x, y)), text_box in zip(self.items, self.boxes):
+            if overlaps(box, text_box):
+                origin = (x - box[0], y - box[1])
+                cv2.putText(mask, text, origin, FONT, self.font_scale, 255, self.thickness)
+                cv2.putText(tile, text, origin, FONT, self.font_scale, self.color, self.thickness)
+
+    def draw(self, frame, stats, position=None):
+        """
+        Draws the stats onto a BGR frame in place.
+
+        Args:
+            frame (numpy.ndarray): Frame to draw on.
+            stats (dict): Values passed to layout; text is only re-rendered when it changes.
+            position (tuple): (x, y) panel origin for this frame, defaults to the overlay's position.
+
+        Returns:
+            numpy.ndarray: The frame.
+        """
+        # Keyed on the laid out text, so e.g. a battery reading that rounds to the same value costs nothing
+        items = tuple(self.layout(stats))
+        if items != self.items:
+            self.render(items)
+
+        x, y = position or self.position
+        x, y = x + self.bounds[0], y + self.bounds[1]
+        height, width = self.mask.shape
+        # Clip the panel to the frame
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, frame.shape[1]), min(y + height, frame.shape[0])
+        if x0 >= x1 or y0 >= y1:
+            return frame
+        panel = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+        # Writes into the frame region in place; only the text pixels are touched
+        cv2.copyTo(self.tile[panel], self.mask[panel], frame[y0:y1, x0:x1])
+        return frame
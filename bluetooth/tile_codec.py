@@ -0,0 +1,171 @@
+"""
+Delta (changed-tile) video encoding for the Bluetooth video link.
+
+Frames are split into TILE x TILE blocks. A keyframe is a plain JPEG of the whole
+frame, so receivers that don't know about deltas still show every keyframe. A
+delta frame only carries the tiles that changed since they were last sent:
+
+    magic    4s       DELTA_MAGIC
+    width    uint16   frame width in pixels
+    height   uint16   frame height in pixels
+    tile     uint16   tile size in pixels
+    count    uint16   number of tiles that follow
+    indices  uint16[count]   tile index, row * columns + column
+    strip             JPEG of the changed tiles stacked vertically (tile wide)
+
+All fields are little-endian. Edge tiles that stick out of the frame are
+zero-padded in the strip and cropped again when pasted.
+
+The encoder compares each frame with the pixels it last sent for every tile,
+rather than with the previous frame, so slow changes add up until they are
+sent and nothing drifts.
+"""
+import struct
+
+import cv2
+import numpy as np
+
+DELTA_MAGIC = b"TDLT"
+DELTA_HEADER = struct.Struct("<4sHHHH")
+TILE = 16  # Matches the JPEG macroblock size, so tiles don't bleed into each other in the strip
+
+
+def is_delta(data):
+    """
+    Returns:
+        bool: True if data is a delta frame, False for a keyframe.
+    """
+    return bytes(data[:len(DELTA_MAGIC)]) == DELTA_MAGIC
+
+
+class TileEncoder:
+    """
+    Args:
+        tile (int): Tile size in pixels.
+        keyframe_interval (int): Frames between forced keyframes.
+        pixel_threshold (int): Per-channel difference for a pixel to count as changed.
+        min_changed_pixels (int): Changed pixels needed for a tile to be sent.
+        max_changed_fraction (float): Above this fraction of changed tiles a keyframe is sent instead.
+    """
+
+    def __init__(self, tile=TILE, keyframe_interval=30, pixel_threshold=24, min_changed_pixels=4,
+                 max_changed_fraction=0.5):
+        self.tile = tile
+        self.keyframe_interval = keyframe_interval
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_pixels = min_changed_pixels
+        self.max_changed_fraction = max_changed_fraction
+        self.reference = None  # Padded copy of the pixels the decoder has, per tile
+        self.frames_since_keyframe = 0
+        self.keyframes = 0
+        self.deltas = 0
+
+    def encode(self, frame, quality):
+        """
+        Encodes a BGR frame as a keyframe or a delta frame.
+
+        Args:
+            frame (numpy.ndarray): BGR image, height x width x 3.
+            quality (int): JPEG quality.
+
+        Returns:
+            bytes: Keyframe JPEG or delta frame.
+        """
+        height, width = frame.shape[:2]
+        tile = self.tile
+        rows, columns = -(-height // tile), -(-width // tile)
+        padded = np.zeros((rows * tile, columns * tile, 3), np.uint8)
+        padded[:height, :width] = frame
+
+        if (self.reference is None or self.reference.shape != padded.shape
+                or self.frames_since_keyframe >= self.keyframe_interval):
+            return self.encode_keyframe(frame, padded, quality)
+
+        # Per tile and channel, count pixels that differ by more than the threshold. A 255/0 mask
+        # area-averaged down to one value per tile is that count scaled by 255 / (tile * tile).
+        _, mask = cv2.threshold(cv2.absdiff(padded, self.reference), self.pixel_threshold, 255, cv2.THRESH_BINARY)
+        means = cv2.resize(mask, (columns, rows), interpolation=cv2.INTER_AREA)
+        changed_pixels = means.max(axis=2).astype(np.int32) * (tile * tile) // 255
+        indices = np.flatnonzero(changed_pixels >= self.min_changed_pixels)
+        if len(indices) > self.max_changed_fraction * rows * columns:
+            return self.encode_keyframe(frame, padded, quality)
+
+        self.frames_since_keyframe += 1
+        self.deltas += 1
+        header = DELTA_HEADER.pack(DELTA_MAGIC, width, height, tile, len(indices))
+        if len(indices) == 0:
+            return header
+
+        # Gather the changed tiles into a (count * tile) x tile strip
+        tiles = padded.reshape(rows, tile, columns, tile, 3).swapaxes(1, 2).reshape(rows * columns, tile, tile, 3)
+        strip = tiles[indices].reshape(len(indices) * tile, tile, 3)
+        _, buffer = cv2.imencode('.jpg', strip, [cv2.IMWRITE_JPEG_QUALITY, quality])
+
+        reference_tiles = self.reference.reshape(rows, tile, columns, tile, 3).swapaxes(1, 2)
+        for index in indices:
+            reference_tiles[index // columns, index % columns] = tiles[index]
+        return header + indices.astype("<u2").tobytes() + buffer.tobytes()
+
+    def encode_keyframe(self, frame, padded, quality):
+        self.reference = padded
+        self.frames_since_keyframe = 0
+        self.keyframes += 1
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes()
+
+    def stats(self):
+        return {"keyframes": self.keyframes, "deltas": self.deltas}
+
+
+class TileDecoder:
+    """
+    Rebuilds frames from keyframes and delta frames produced by TileEncoder.
+    """
+
+    def __init__(self):
+        self.frame = None
+
+    def reset(self):
+        """
+        Forgets the current frame, e.g. after deltas were skipped; decoding resumes at the next keyframe.
+        """
+        self.frame = None
+
+    def decode(self, data):
+        """
+        Decodes a received frame.
+
+        Args:
+            data (bytes-like): Keyframe JPEG or delta frame.
+
+        Returns:
+            numpy.ndarray: The current BGR frame, or None if there is nothing to
+            show yet (a delta before the first keyframe, or undecodable data).
+            The array is updated in place by later deltas, so copy it to keep it.
+        """
+        if not is_delta(data):
+            frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                self.frame = frame
+            return frame
+
+        if len(data) < DELTA_HEADER.size:
+            return None
+        _, width, height, tile, count = DELTA_HEADER.unpack_from(data)
+        if self.frame is None or self.frame.shape[:2] != (height, width):
+            return None  # Wait for the next keyframe
+        if count == 0:
+            return self.frame
+
+        indices = np.frombuffer(data, "<u2", count, DELTA_HEADER.size)
+        strip_data = np.frombuffer(data, np.uint8, offset=DELTA_HEADER.size + 2 * count)
+        strip = cv2.imdecode(strip_data, cv2.IMREAD_COLOR)
+        if strip is None:
+            return None
+
+        columns = -(-width // tile)
+        for position, index in enumerate(indices):
+            y, x = (int(index) // columns) * tile, (int(index) % columns) * tile
+            target = self.frame[y:y + tile, x:x + tile]
+            target[:] = strip[position * tile:position * tile + target.shape[0], :target.shape[1]]
+        return self.frame
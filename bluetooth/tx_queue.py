@@ -0,0 +1,167 @@
+"""
+Bounded, thread-safe transmit queue for the RFCOMM RPC sockets.
+
+Replaces the `tx_lock.acquire(blocking=False)` pattern, which silently dropped
+messages whenever the lock was busy. When the queue is full the overflow policy
+decides what happens:
+
+    block         the producer waits for room (optionally with a timeout)
+    drop_oldest   the oldest queued message is discarded to make room
+
+Independently of the policy, a message put with a `key` replaces any queued
+message with the same key instead of being appended, so a burst of slider
+updates for one servo collapses into the latest value.
+"""
+import threading
+from collections import OrderedDict
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+
+
+class QueueFull(Exception):
+    """
+    Raised by put() when the queue is still full after the block timeout.
+    """
+
+
+class TxQueue:
+    """
+    Args:
+        maxsize (int): Maximum number of queued messages.
+        policy (str): BLOCK or DROP_OLDEST.
+        on_put (callable): Called after every successful put, e.g. to wake the sender.
+        on_drop (callable): Called with each message discarded by DROP_OLDEST or replaced by coalescing.
+    """
+
+    def __init__(self, maxsize=1024, policy=BLOCK, on_put=None, on_drop=None):
+        if policy not in (BLOCK, DROP_OLDEST):
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_put = on_put
+        self.on_drop = on_drop
+        # Keyed messages use their key, others a unique sequence number, so order is kept
+        self.messages = OrderedDict()
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        self.counters = {"enqueued": 0, "coalesced": 0, "dropped": 0, "sent": 0}
+
+    def __len__(self):
+        return len(self.messages)
+
+    def put(self, message, key=None, timeout=None):
+        """
+        Queues a message.
+
+        Args:
+            message: Message to queue.
+            key (hashable): Coalescing key; replaces a queued message with the same key.
+            timeout (float): Seconds the BLOCK policy waits for room, or None to wait forever.
+
+        Raises:
+            QueueFull: The BLOCK policy timed out.
+        """
+        with self.lock:
+            discarded = self.insert(message, key, timeout)
+            self.counters["enqueued"] += 1
+
+        for message in discarded:
+            if self.on_drop is not None:
+                self.on_drop(message)
+        if self.on_put is not None:
+            self.on_put()
+
+    def put_many(self, messages, timeout=None):
+        """
+        Queues several unkeyed messages at once.
+
+        They are queued under one hold of the lock and on_put is called once, so
+        a sender woken by on_put drains them together. With BLOCK the call waits
+        until there is room for the whole batch, unless it is larger than the queue.
+
+        Args:
+            messages (list): Messages to queue, in order.
+            timeout (float): Seconds the BLOCK policy waits for room, or None to wait forever.
+
+        Raises:
+            QueueFull: The BLOCK policy timed out.
+        """
+        discarded = []
+        with self.lock:
+            if self.policy == BLOCK and len(messages) <= self.maxsize:
+                if not self.not_full.wait_for(lambda: len(self.messages) + len(messages) <= self.maxsize, timeout):
+                    raise QueueFull(f"Transmit queue full ({self.maxsize} messages)")
+            for message in messages:
+                discarded += self.insert(message, None, timeout)
+            self.counters["enqueued"] += len(messages)
+
+        for message in discarded:
+            if self.on_drop is not None:
+                self.on_drop(message)
+        if self.on_put is not None:
+            self.on_put()
+
+    def insert(self, message, key, timeout):
+        # Called with the lock held; returns the messages replaced or dropped to make room
+        def queued():
+            return key is not None and ("key", key) in self.messages
+
+        if not queued() and len(self.messages) >= self.maxsize:
+            if self.policy == DROP_OLDEST:
+                _, dropped = self.messages.popitem(last=False)
+                self.counters["dropped"] += 1
+                self.append(message, key)
+                return [dropped]
+            if not self.not_full.wait_for(lambda: queued() or len(self.messages) < self.maxsize, timeout):
+                raise QueueFull(f"Transmit queue full ({self.maxsize} messages)")
+
+        # Checked again after waiting: another thread may have queued the same key meanwhile
+        if queued():
+            # Replace in place: the update keeps its original position in the queue
+            replaced = self.messages[("key", key)]
+            self.messages[("key", key)] = message
+            self.counters["coalesced"] += 1
+            return [replaced]
+        self.append(message, key)
+        return []
+
+    def append(self, message, key):
+        if key is None:
+            self.sequence += 1
+            self.messages[("seq", self.sequence)] = message
+        else:
+            self.messages[("key", key)] = message
+
+    def drain(self):
+        """
+        Removes and returns every queued message, oldest first, and counts them as sent.
+
+        Returns:
+            list: Queued messages.
+        """
+        with self.lock:
+            messages = list(self.messages.values())
+            self.messages.clear()
+            self.counters["sent"] += len(messages)
+            self.not_full.notify_all()
+        return messages
+
+    def clear(self):
+        """
+        Removes and returns every queued message without counting them as sent.
+        """
+        with self.lock:
+            messages = list(self.messages.values())
+            self.messages.clear()
+            self.not_full.notify_all()
+        return messages
+
+    def stats(self):
+        """
+        Returns:
+            dict: enqueued, coalesced, dropped and sent message counts, plus the current depth.
+        """
+        with self.lock:
+            return {**self.counters, "queued": len(self.messages)}
@@ -0,0 +1,159 @@
+"""
+Multi-stage frame pipeline used by bluetooth_server.handle_video_feed.
+
+Each stage runs on its own thread and hands its output to the next stage through
+a small LatestQueue. A full queue drops its oldest item instead of blocking the
+producer, so a slow stage (usually transmit) always gets the newest frame and
+throughput is limited by the slowest stage rather than by the sum of all of them.
+"""
+import threading
+import time
+from collections import deque
+
+
+class LatestQueue:
+    """
+    Bounded queue that discards its oldest item when a new one arrives while full.
+
+    Args:
+        maxsize (int): Maximum number of queued items.
+    """
+
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.items = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self):
+        """
+        Waits for the next item.
+
+        Returns:
+            The oldest queued item, or None once the queue is closed.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.items or self.closed)
+            if self.items:
+                return self.items.popleft()
+            return None
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class Stage:
+    """
+    One pipeline stage: a thread applying `func` to every item from `source`.
+
+    The first stage has no source and calls `func()` repeatedly. A stage whose
+    func returns None produces nothing for that item.
+    """
+
+    def __init__(self, name, func, source=None, sink=None):
+        self.name = name
+        self.func = func
+        self.source = source
+        self.sink = sink
+        self.thread = None
+        self.frames = 0
+        self.latency = 0.0  # Exponential moving average, in seconds
+        self.started = None
+
+    def record(self, elapsed):
+        self.frames += 1
+        self.latency = elapsed if self.frames == 1 else 0.9 * self.latency + 0.1 * elapsed
+
+    def stats(self):
+        running = time.monotonic() - self.started if self.started else 0
+        return {
+            "fps": round(self.frames / running, 2) if running else 0.0,
+            "latency_ms": round(self.latency * 1000, 2),
+            "queue_depth": len(self.source) if self.source is not None else 0,
+            "dropped": self.source.dropped if self.source is not None else 0,
+        }
+
+
+class VideoPipeline:
+    """
+    Runs a chain of stages, e.g. capture -> annotate -> encode -> transmit.
+
+    Args:
+        stages (list): (name, func) pairs in order. The first func takes no
+            arguments and produces items; each later func takes the previous
+            stage's output.
+        queue_size (int): Capacity of the queue in front of each stage.
+    """
+
+    def __init__(self, stages, queue_size=1):
+        self.stop_event = threading.Event()
+        self.error = None
+        self.stages = []
+        source = None
+        for index, (name, func) in enumerate(stages):
+            sink = LatestQueue(queue_size) if index < len(stages) - 1 else None
+            self.stages.append(Stage(name, func, source, sink))
+            source = sink
+
+    def start(self):
+        for stage in self.stages:
+            stage.started = time.monotonic()
+            stage.thread = threading.Thread(target=self.run_stage, args=(stage,), name=f"video-{stage.name}")
+            stage.thread.daemon = True
+            stage.thread.start()
+
+    def run_stage(self, stage):
+        try:
+            while not self.stop_event.is_set():
+                if stage.source is None:
+                    start = time.perf_counter()
+                    result = stage.func()
+                else:
+                    item = stage.source.get()
+                    if item is None:
+                        break
+                    start = time.perf_counter()
+                    result = stage.func(item)
+                stage.record(time.perf_counter() - start)
+                if result is not None and stage.sink is not None:
+                    stage.sink.put(result)
+        except Exception as e:
+            self.error = e
+            print(f"Video pipeline stage {stage.name} failed: {e}")
+            self.stop()
+
+    def stop(self):
+        self.stop_event.set()
+        for stage in self.stages:
+            if stage.source is not None:
+                stage.source.close()
+
+    def wait(self):
+        """
+        Blocks until the pipeline is stopped, e.g. by a failing stage.
+        """
+        self.stop_event.wait()
+        for stage in self.stages:
+            if stage.thread is not threading.current_thread():
+                stage.thread.join(1.0)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per-stage fps, average latency, depth and drop count of its input queue.
+        """
+        return {stage.name: stage.stats() for stage in self.stages}
@@ -0,0 +1,111 @@
+"""
+Receive -> decode -> render pipeline for the Bluetooth video feed.
+
+The network thread only reassembles frame and stats messages (see
+frame_reader.py) and queues them. The decode thread takes everything queued
+since its last pass, skips straight to the newest keyframe, applies the delta
+frames after it (see tile_codec.py), converts only the final frame and hands it
+to the renderer. Rendering may block; messages keep queueing meanwhile and the
+next pass catches up in one go, so a slow renderer costs frame rate, not latency.
+"""
+import json
+import threading
+from collections import deque
+
+from frame_reader import FrameReader
+from tile_codec import TileDecoder, is_delta
+
+
+class VideoReceiver:
+    """
+    Args:
+        sock: Connected socket carrying bluetooth_server's video feed.
+        render (callable): Called on the decode thread with (image, stats) for
+            every displayed frame; it may block until the frame is shown.
+        convert (callable): Turns a decoded BGR frame into whatever render takes.
+            The frame is updated in place by later deltas, so convert must copy it.
+        max_pending (int): Queued messages after which undecoded deltas are dropped
+            and decoding waits for the next keyframe.
+        on_close (callable): Called on the decode thread once the feed has ended.
+    """
+
+    def __init__(self, sock, render, convert=lambda frame: frame.copy(), max_pending=60, on_close=None):
+        self.sock = sock
+        self.render = render
+        self.convert = convert
+        self.on_close = on_close
+        self.max_pending = max_pending
+        self.decoder = TileDecoder()
+        self.pending = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.error = None
+        self.skipped = 0
+        self.network_thread = threading.Thread(target=self.receive, name="video-receive", daemon=True)
+        self.decode_thread = threading.Thread(target=self.decode, name="video-decode", daemon=True)
+
+    def start(self):
+        self.network_thread.start()
+        self.decode_thread.start()
+
+    def join(self):
+        self.network_thread.join()
+        self.decode_thread.join()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def receive(self):
+        reader = FrameReader(self.sock)
+        try:
+            while not self.closed:
+                # The reader reuses its buffer, so each message is copied once to hand it over
+                frame_data = bytes(reader.read_message())
+                stats_data = bytes(reader.read_message())
+                with self.cond:
+                    self.pending.append((frame_data, stats_data))
+                    self.cond.notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.close()
+
+    def take_pending(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending or self.closed)
+            messages = list(self.pending)
+            self.pending.clear()
+        # Everything before the newest keyframe is superseded by it
+        for index in range(len(messages) - 1, -1, -1):
+            if not is_delta(messages[index][0]):
+                self.skipped += index
+                return messages[index:]
+        if len(messages) > self.max_pending:
+            self.skipped += len(messages)
+            self.decoder.reset()
+            return []
+        return messages
+
+    def decode(self):
+        try:
+            self.decode_frames()
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    def decode_frames(self):
+        while True:
+            messages = self.take_pending()
+            if not messages:
+                if self.closed:
+                    return
+                continue
+            frame = None
+            for frame_data, _ in messages:
+                frame = self.decoder.decode(frame_data)
+            if frame is None:
+                continue
+            stats = json.loads(str(messages[-1][1], 'utf-8'))
+            self.render(self.convert(frame), stats)
@@ -1,25 +1,51 @@
 import socket
+import selectors
 import threading
+import heapq
+import itertools
 from collections import deque
+from concurrent.futures import Future, InvalidStateError
 import signal
 import time
+import rpc_protocol
+from tx_queue import TxQueue, BLOCK
 
 server_addr = "D8:3A:DD:E9:35:3E"
 server_port = 1
 
 buf_size = 1024
 
+# Negotiate the binary protocol on connect; set to False to stay in text mode
+use_binary = True
+negotiation_timeout = 2.0 # Seconds to wait for the server to accept binary mode
+
 client_sock = None
 server_sock = None
 sock = None
 
 exit_event = threading.Event()
 
-tx_message_deque = deque([])
-output = ""
+# Writing to wakeup_send interrupts the select() in run_client when calls are queued or on shutdown
+wakeup_recv, wakeup_send = socket.socketpair()
+wakeup_send.setblocking(False)
+select_timeout = 1.0 # Backstop for a missed wakeup, in seconds
+
+tx_queue_size = 256
+
+default_timeout = 2.0 # Seconds before an unanswered call fails with TimeoutError
 
-tx_lock = threading.Lock()
-rx_lock = threading.Lock()
+# Futures of sent calls awaiting a response: by request id in binary mode, in send order in text mode
+pending_calls = {}
+pending_text_calls = deque([])
+call_deadlines = [] # Heap of (deadline, sequence, future, req_id)
+call_sequence = itertools.count()
+
+# Fire-and-forget setter calls are coalesced: only the latest queued value of each is sent
+coalesced_funcs = {
+    "set_camera_pan_angle",
+    "set_camera_tilt_angle",
+    "set_direction_servo_angle",
+}
 
 supported_funcs = [
     "get_battery_voltage",
@@ -33,6 +59,8 @@ supported_funcs = [
     "forward",
     "backward",
     "stop",
+    "subscribe",
+    "unsubscribe",
 ]
 
 rx_retvals = {
@@ -43,36 +71,167 @@ rx_retvals = {
     "camera_tilt_angle": None,
     "direction_servo_angle": None,
     "motor_pwm_percentage": None,
+    "subscription": None,
 }
 
+# Called from the client thread with a dict of the values in each pushed telemetry message
+telemetry_callbacks = []
+
 def send_supported_func(func_name, *args):
+    """
+    Queues a call without waiting for it; the result is also stored in rx_retvals.
+
+    Calls to coalesced_funcs replace any queued call to the same function, whose
+    future is then cancelled.
+
+    Returns:
+        Future: Resolves to the call's return value, or None for an unsupported function.
+    """
     if func_name not in supported_funcs:
         print(f"Cannot send unsupported function: {func_name}")
-        return
+        return None
 
-    if not args:
-        message = func_name + "\r\n"
-    else:
-        message = func_name + ' ' + " ".join([str(arg) for arg in args]) + "\r\n"
+    # Calls are encoded when sent, once the protocol has been negotiated
+    # print(f"Queueing message {func_name} {args}")
+    future = Future()
+    key = func_name if func_name in coalesced_funcs else None
+    tx_queue.put((func_name, args, future, time.monotonic() + default_timeout), key=key)
+    return future
 
-    if tx_lock.acquire(blocking=False):
-        # print(f"Queueing message {message}")
-        tx_message_deque.append(message)
-        tx_lock.release()
+def call(func_name, *args, timeout=default_timeout):
+    """
+    Queues a call and returns a future for its result.
 
+    The future can be waited on with result(), given a done callback, cancelled
+    before it is answered, or awaited with asyncio.wrap_future().
 
-def handler(signum, frame):
+    Args:
+        func_name (str): Supported function to call.
+        *args: Function arguments.
+        timeout (float): Seconds before the future fails with TimeoutError, or None to wait forever.
+
+    Returns:
+        Future: Resolves to the call's return value.
+    """
+    return call_batch([(func_name, *args)], timeout)[0]
+
+def call_batch(calls, timeout=default_timeout):
+    """
+    Queues several calls so that they go out in a single write.
+
+    Args:
+        calls (list): (func_name, *args) tuples.
+        timeout (float): Seconds before each future fails with TimeoutError, or None to wait forever.
+
+    Returns:
+        list: One Future per call, in order.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    futures = []
+    queued = []
+    for func_name, *args in calls:
+        future = Future()
+        if func_name in supported_funcs:
+            queued.append((func_name, tuple(args), future, deadline))
+        else:
+            future.set_exception(ValueError(f"Unsupported function: {func_name}"))
+        futures.append(future)
+
+    # Queued together and the sender woken once, so it can't write out part of the batch
+    if queued:
+        tx_queue.put_many(queued)
+    return futures
+
+def subscribe(names, interval=0.2, deadband=0.0, callback=None, timeout=default_timeout):
+    """
+    Asks the server to push telemetry instead of being polled.
+
+    Pushed values land in rx_retvals and are passed to every callback in
+    telemetry_callbacks. Values are sampled every `interval` seconds and pushed
+    when they move by more than `deadband`, with a periodic full refresh.
+
+    Args:
+        names (list): Values to push, from rpc_protocol.TELEMETRY_VALUES.
+        interval (float): Sampling interval, in seconds.
+        deadband (float): Minimum change of a numeric value worth pushing.
+        callback (callable): Added to telemetry_callbacks if given.
+
+    Returns:
+        Future: Resolves to the subscription mask the server accepted.
+    """
+    if callback is not None:
+        telemetry_callbacks.append(callback)
+    mask = rpc_protocol.telemetry_mask(names)
+    return call("subscribe", mask, int(interval * 1000), deadband, timeout=timeout)
+
+def handle_telemetry(values):
+    if isinstance(values, list):
+        # Text mode: ["name=value", ...]
+        values = dict(field.split("=", 1) for field in values)
+    rx_retvals.update(values)
+    for callback in telemetry_callbacks:
+        callback(values)
+
+def gather(futures, timeout=None):
+    """
+    Waits for every future, e.g. from call_batch.
+
+    Returns:
+        list: Results in the same order; the first failure is raised.
+    """
+    return [future.result(timeout) for future in futures]
+
+def resolve(future, value=None, error=None):
+    try:
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+    except InvalidStateError:
+        pass    # Already cancelled or timed out
+
+def expire_calls():
+    """
+    Fails calls whose deadline has passed.
+
+    Returns:
+        float: Seconds until the next deadline, or None if no call has one.
+    """
+    now = time.monotonic()
+    while call_deadlines and call_deadlines[0][0] <= now:
+        _, _, future, req_id = heapq.heappop(call_deadlines)
+        if not future.done():
+            resolve(future, error=TimeoutError("No response from the server"))
+        if req_id is not None and pending_calls.get(req_id) is future:
+            del pending_calls[req_id]
+    if call_deadlines:
+        return call_deadlines[0][0] - now
+    return None
+
+def wakeup():
+    try:
+        wakeup_send.send(b"\0")
+    except OSError:
+        pass    # A wakeup is already pending
+
+def stop_client():
     exit_event.set()
+    wakeup()
+
+# Cancels the future of a queued call that was superseded or dropped
+def cancel_message(message):
+    message[2].cancel()
+
+tx_queue = TxQueue(maxsize=tx_queue_size, policy=BLOCK, on_put=wakeup, on_drop=cancel_message)
+
+
+def handler(signum, frame):
+    stop_client()
 
 signal.signal(signal.SIGINT, handler)
 
 def start_client():
     global sock
-    global tx_lock
-    global rx_lock
-    global exit_event
-    global tx_message_deque
-    global output
     global server_addr
     global server_port
 
@@ -81,43 +240,163 @@ def start_client():
 
     sock.connect((server_addr,server_port))
     sock.settimeout(None)
+    run_client(sock)
+
+def run_client(sock, telemetry_sock=None):
+    """
+    Sends queued calls and stores received return values until exit_event is set.
+
+    The loop sleeps in select() until the socket is readable, writable with data
+    pending, or woken by send_supported_func/stop_client, so it uses no CPU while idle.
+
+    If use_binary is set the client first asks the server for binary mode and
+    holds queued calls until it answers, falling back to text mode on timeout.
+
+    Args:
+        sock: Connected socket carrying calls and responses.
+        telemetry_sock: Socket the server pushes telemetry on, e.g. the TELEMETRY
+            channel of a mux_transport.Multiplexer. By default telemetry arrives on sock.
+    """
+    global exit_event
+
+    parser = rpc_protocol.MessageParser(responses=True, switch_line=rpc_protocol.ACK_BINARY)
+    binary = False
+    negotiating = use_binary
+    negotiation_deadline = time.monotonic() + negotiation_timeout
+    next_req_id = 0
+    pending = b""
+    if negotiating:
+        pending = rpc_protocol.encode_text_request(rpc_protocol.HELLO_BINARY)
+
     sock.setblocking(False)
+    selector = selectors.DefaultSelector()
+    selector.register(sock, selectors.EVENT_READ)
+    selector.register(wakeup_recv, selectors.EVENT_READ)
+    events = selectors.EVENT_READ
+    if telemetry_sock is not None:
+        # Telemetry is only pushed after subscribe(), so its encoding follows the negotiated mode
+        telemetry_parser = rpc_protocol.MessageParser(responses=True, switch_line=None)
+        telemetry_sock.setblocking(False)
+        selector.register(telemetry_sock, selectors.EVENT_READ)
 
     while not exit_event.is_set():
-        if tx_lock.acquire(blocking=False):
-            if(len(tx_message_deque) > 0):
-                try:
-                    sent = sock.send(bytes(tx_message_deque[0], 'utf-8'))
-                except Exception as e:
-                    exit_event.set()
+        # Encode every queued call into one write
+        # Calls stay in tx_queue, where they can still be coalesced, until the socket has room
+        if not pending and not negotiating and len(tx_queue) > 0:
+            calls = []
+            for func_name, args, future, deadline in tx_queue.drain():
+                # Skip calls cancelled or timed out before they were sent
+                if future.done():
                     continue
-                if sent < len(tx_message_deque[0]):
-                    tx_message_deque[0] = tx_message_deque[0][sent:]
+                req_id = None
+                if binary:
+                    req_id = next_req_id
+                    next_req_id = (next_req_id + 1) & 0xFFFF
+                    pending_calls[req_id] = future
+                    calls.append(rpc_protocol.encode_request(func_name, req_id, *args))
                 else:
-                    tx_message_deque.popleft()
-            tx_lock.release()
+                    pending_text_calls.append(future)
+                    calls.append(rpc_protocol.encode_text_request(func_name, *args))
+                if deadline is not None:
+                    heapq.heappush(call_deadlines, (deadline, next(call_sequence), future, req_id))
+            pending = b"".join(calls)
 
-        if rx_lock.acquire(blocking=False):
-            data = ""
+        if pending:
             try:
-                data = sock.recv(1024).decode("utf-8")
-            except socket.error as e:
-                pass
-                #no data
+                sent = sock.send(pending)
+            except BlockingIOError:
+                sent = 0
             except Exception as e:
                 exit_event.set()
+                break
+            pending = pending[sent:]
+
+        # Only wait for writability while the socket has refused part of a write
+        wanted = selectors.EVENT_READ | (selectors.EVENT_WRITE if pending else 0)
+        if wanted != events:
+            selector.modify(sock, wanted)
+            events = wanted
+
+        timeout = select_timeout
+        next_deadline = expire_calls()
+        if next_deadline is not None:
+            timeout = min(timeout, next_deadline)
+        if negotiating:
+            timeout = max(0.0, min(timeout, negotiation_deadline - time.monotonic()))
+
+        for key, mask in selector.select(timeout):
+            if key.fileobj is wakeup_recv:
+                try:
+                    wakeup_recv.recv(buf_size)
+                except BlockingIOError:
+                    pass
                 continue
 
-            output += data
-            output_split = output.split("\r\n")
-            for rx_message in output_split[:-1]:
-                rx_message_parts = rx_message.split(" ")
-                func_name = rx_message_parts.pop(0)
-                retval = rx_message_parts.pop(0)
-                rx_retvals[func_name] = retval
-            output = output_split[-1]
-            rx_lock.release()
+            if key.fileobj is telemetry_sock:
+                try:
+                    data = telemetry_sock.recv(buf_size)
+                except BlockingIOError:
+                    continue
+                except Exception as e:
+                    exit_event.set()
+                    break
+                if not data:
+                    exit_event.set()
+                    break
+                telemetry_parser.binary = binary
+                for _, _, values in telemetry_parser.feed(data):
+                    handle_telemetry(values)
+                continue
+
+            if mask & selectors.EVENT_READ:
+                try:
+                    data = sock.recv(buf_size)
+                except BlockingIOError:
+                    continue
+                except Exception as e:
+                    exit_event.set()
+                    break
+                if not data:
+                    exit_event.set()
+                    break
+                for retval_name, req_id, values in parser.feed(data):
+                    if retval_name == rpc_protocol.ACK_BINARY:
+                        binary = True
+                        negotiating = False
+                        continue
+                    if retval_name == rpc_protocol.TELEMETRY:
+                        handle_telemetry(values)
+                        continue
+
+                    # Match the response to its call
+                    if req_id is None:
+                        future = pending_text_calls.popleft() if pending_text_calls else None
+                    else:
+                        future = pending_calls.pop(req_id, None)
+
+                    if retval_name is None:
+                        print(f"Server rejected request {req_id}")
+                        if future is not None:
+                            resolve(future, error=ValueError("Server rejected the call"))
+                    else:
+                        value = values[0] if values else None
+                        rx_retvals[retval_name] = value
+                        if future is not None:
+                            resolve(future, value)
 
+        if negotiating and time.monotonic() > negotiation_deadline:
+            print("Server did not accept binary mode, using text mode")
+            negotiating = False
+
+    # Fail everything still waiting for an answer
+    unsent = [message[2] for message in tx_queue.clear()]
+    for future in [*pending_calls.values(), *pending_text_calls, *unsent]:
+        resolve(future, error=ConnectionError("Client stopped"))
+    pending_calls.clear()
+    pending_text_calls.clear()
+    call_deadlines.clear()
+
+    selector.close()
     sock.close()
     print("client thread end")
 
@@ -140,18 +419,19 @@ if __name__ == "__main__":
     time.sleep(2.0)
     print(rx_retvals)
 
+    # The server pushes these whenever they change instead of being polled
+    subscribe(
+        ["battery_voltage", "cliff_status", "motor_pwm_percentage", "direction_servo_angle", "ultrasonic_distance"],
+        interval=0.2,
+        deadband=0.5,
+        callback=print,
+    )
+
     while not exit_event.is_set():
-        if len(output) == 0:
-            send_supported_func("get_battery_voltage")
-            send_supported_func("get_cliff_status")
-            send_supported_func("get_motor_pwm_percentage")
-            send_supported_func("get_direction_servo_angle")
-            send_supported_func("get_ultrasonic_distance")
-            print(rx_retvals)
         time.sleep(2)
 
     print("Disconnected.")
-    exit_event.set()
+    stop_client()
 
     print("All done.")
     exit()
\ No newline at end of file
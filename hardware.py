@@ -0,0 +1,416 @@
+"""
+Hardware abstraction layer shared by the PiCar servers.
+
+Every server talks to the car through a `Car` (drive, steering, camera pan/tilt,
+sensors, battery) and a `Camera`, so the same code runs on either car or on an
+ordinary Linux box. Backends:
+
+    picarx  SunFounder PiCar-X (picarx, robot_hat, picamera2)
+    4wd     SunFounder PiCar-4WD (picar_4wd, picamera2)
+    sim     Deterministic simulated car with configurable sensor latency and
+            jitter and synthetic camera frames
+
+The backend is picked at startup from the PICAR_BACKEND environment variable,
+falling back to the default passed by each server. The simulated backend reads
+PICAR_SIM_LATENCY, PICAR_SIM_JITTER (seconds) and PICAR_SIM_SEED.
+"""
+import math
+import os
+import random
+import threading
+import time
+
+BACKEND_ENV = "PICAR_BACKEND"
+
+
+class Camera:
+    """
+    Camera interface.
+    """
+
+    def capture_array(self):
+        """
+        Blocks until the next frame is available.
+
+        Returns:
+            numpy.ndarray: Frame as an (height, width, 3) uint8 array.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Car:
+    """
+    Car interface. Speeds are duty cycle percentages, angles are in degrees.
+    """
+
+    def forward(self, speed):
+        raise NotImplementedError
+
+    def backward(self, speed):
+        raise NotImplementedError
+
+    def turn_left(self, speed):
+        raise NotImplementedError
+
+    def turn_right(self, speed):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def set_dir_servo_angle(self, angle):
+        raise NotImplementedError
+
+    def get_dir_servo_angle(self):
+        raise NotImplementedError
+
+    def set_cam_pan_angle(self, angle):
+        raise NotImplementedError
+
+    def set_cam_tilt_angle(self, angle):
+        raise NotImplementedError
+
+    def get_motor_pwm_percentage(self):
+        raise NotImplementedError
+
+    def get_distance(self):
+        """
+        Returns:
+            float: Ultrasonic distance, in centimeters.
+        """
+        raise NotImplementedError
+
+    def get_grayscale_data(self):
+        """
+        Returns:
+            list: One reading per grayscale sensor, left to right.
+        """
+        raise NotImplementedError
+
+    def get_cliff_status(self):
+        """
+        Returns:
+            bool: True if a cliff is detected, False otherwise.
+        """
+        raise NotImplementedError
+
+    def get_battery_voltage(self):
+        raise NotImplementedError
+
+    def open_camera(self, size):
+        """
+        Starts the camera.
+
+        Args:
+            size (tuple): Frame (width, height).
+
+        Returns:
+            Camera: The started camera.
+        """
+        raise NotImplementedError
+
+
+class PiCamera(Camera):
+    def __init__(self, size):
+        from picamera2 import Picamera2
+        self.picam2 = Picamera2()
+        config = self.picam2.create_preview_configuration(main={"size": size, "format": "RGB888"})
+        self.picam2.configure(config)
+        self.picam2.start()
+
+    def capture_array(self):
+        return self.picam2.capture_array()
+
+    def close(self):
+        self.picam2.close()
+
+
+class PicarXCar(Car):
+    """
+    SunFounder PiCar-X, steered by the direction servo.
+    """
+
+    TURN_ANGLE = 30
+
+    def __init__(self):
+        from picarx import Picarx
+        from robot_hat import utils
+        self.px = Picarx()
+        self.utils = utils
+
+    def forward(self, speed):
+        self.px.forward(speed)
+
+    def backward(self, speed):
+        self.px.backward(speed)
+
+    def turn_left(self, speed):
+        self.px.set_dir_servo_angle(-self.TURN_ANGLE)
+        self.px.forward(speed)
+
+    def turn_right(self, speed):
+        self.px.set_dir_servo_angle(self.TURN_ANGLE)
+        self.px.forward(speed)
+
+    def stop(self):
+        self.px.stop()
+
+    def set_dir_servo_angle(self, angle):
+        self.px.set_dir_servo_angle(angle)
+
+    def get_dir_servo_angle(self):
+        return self.px.dir_current_angle
+
+    def set_cam_pan_angle(self, angle):
+        self.px.set_cam_pan_angle(angle)
+
+    def set_cam_tilt_angle(self, angle):
+        self.px.set_cam_tilt_angle(angle)
+
+    def get_motor_pwm_percentage(self):
+        # The right motor's percentage is inverted, so report the left one
+        return self.px.motor_speed_pins[1].pulse_width_percent()
+
+    def get_distance(self):
+        return self.px.get_distance()
+
+    def get_grayscale_data(self):
+        return self.px.get_grayscale_data()
+
+    def get_cliff_status(self):
+        return self.px.get_cliff_status(self.px.get_grayscale_data())
+
+    def get_battery_voltage(self):
+        return self.utils.get_battery_voltage()
+
+    def open_camera(self, size):
+        return PiCamera(size)
+
+
+class Picar4WDCar(Car):
+    """
+    SunFounder PiCar-4WD, steered by driving the wheel pairs in opposite directions.
+    It has no steering or camera pan/tilt servos.
+    """
+
+    CLIFF_REFERENCE = 110  # Grayscale readings below this are treated as an edge
+
+    def __init__(self):
+        import picar_4wd
+        self.fc = picar_4wd
+        self.speed = 0
+
+    def forward(self, speed):
+        self.speed = speed
+        self.fc.forward(speed)
+
+    def backward(self, speed):
+        self.speed = -speed
+        self.fc.backward(speed)
+
+    def turn_left(self, speed):
+        self.speed = speed
+        self.fc.turn_left(speed)
+
+    def turn_right(self, speed):
+        self.speed = speed
+        self.fc.turn_right(speed)
+
+    def stop(self):
+        self.speed = 0
+        self.fc.stop()
+
+    def set_dir_servo_angle(self, angle):
+        raise NotImplementedError("The PiCar-4WD has no steering servo")
+
+    def get_dir_servo_angle(self):
+        return 0
+
+    def set_cam_pan_angle(self, angle):
+        raise NotImplementedError("The PiCar-4WD has no camera pan servo")
+
+    def set_cam_tilt_angle(self, angle):
+        raise NotImplementedError("The PiCar-4WD has no camera tilt servo")
+
+    def get_motor_pwm_percentage(self):
+        return self.speed
+
+    def get_distance(self):
+        return self.fc.us.get_distance()
+
+    def get_grayscale_data(self):
+        return self.fc.get_grayscale_list()
+
+    def get_cliff_status(self):
+        return any(value < self.CLIFF_REFERENCE for value in self.get_grayscale_data())
+
+    def get_battery_voltage(self):
+        return self.fc.power_read()
+
+    def open_camera(self, size):
+        return PiCamera(size)
+
+
+class SimulatedCamera(Camera):
+    """
+    Produces deterministic synthetic frames at a fixed frame rate: a static
+    gradient with a bright block sweeping across it.
+    """
+
+    def __init__(self, size, fps=30):
+        import numpy as np
+        self.np = np
+        self.width, self.height = size
+        self.period = 1.0 / fps
+        self.frame_count = 0
+        self.next_frame_time = time.monotonic()
+        gradient = np.linspace(0, 255, self.width, dtype=np.uint8)
+        self.background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.background[:, :, 0] = gradient
+        self.background[:, :, 1] = gradient[::-1]
+        self.background[:, :, 2] = 96
+
+    def capture_array(self):
+        # Block like a real sensor until the next frame period
+        delay = self.next_frame_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        self.next_frame_time = max(self.next_frame_time + self.period, time.monotonic())
+
+        frame = self.background.copy()
+        block = max(8, self.height // 8)
+        x = (self.frame_count * 4) % max(1, self.width - block)
+        y = (self.height - block) // 2
+        frame[y:y + block, x:x + block] = 255
+        self.frame_count += 1
+        return frame
+
+
+class SimulatedCar(Car):
+    """
+    Deterministic simulated car.
+
+    Sensor reads sleep for `sensor_latency` plus up to `jitter` seconds, drawn from
+    a generator seeded with `seed`. Readings are smooth functions of time so that
+    change-driven code paths see realistic behaviour.
+
+    Args:
+        sensor_latency (float): Base time taken by every sensor read, in seconds.
+        jitter (float): Maximum extra random read time, in seconds.
+        seed (int): Seed for the latency and noise generator.
+        fps (int): Frame rate of cameras opened on this car.
+    """
+
+    def __init__(self, sensor_latency=0.0, jitter=0.0, seed=0, fps=30):
+        self.sensor_latency = sensor_latency
+        self.jitter = jitter
+        self.fps = fps
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.speed = 0
+        self.dir_angle = 0
+        self.pan_angle = 0
+        self.tilt_angle = 0
+
+    def read_delay(self):
+        with self.random_lock:
+            delay = self.sensor_latency + self.random.uniform(0, self.jitter)
+            noise = self.random.uniform(-0.5, 0.5)
+        if delay > 0:
+            time.sleep(delay)
+        return noise
+
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+    def forward(self, speed):
+        self.speed = speed
+
+    def backward(self, speed):
+        self.speed = -speed
+
+    def turn_left(self, speed):
+        self.dir_angle = -30
+        self.speed = speed
+
+    def turn_right(self, speed):
+        self.dir_angle = 30
+        self.speed = speed
+
+    def stop(self):
+        self.speed = 0
+
+    def set_dir_servo_angle(self, angle):
+        self.dir_angle = angle
+
+    def get_dir_servo_angle(self):
+        return self.dir_angle
+
+    def set_cam_pan_angle(self, angle):
+        self.pan_angle = angle
+
+    def set_cam_tilt_angle(self, angle):
+        self.tilt_angle = angle
+
+    def get_motor_pwm_percentage(self):
+        return self.speed
+
+    def get_distance(self):
+        noise = self.read_delay()
+        return round(50 + 40 * math.sin(self.elapsed() / 3) + noise, 2)
+
+    def get_grayscale_data(self):
+        noise = self.read_delay()
+        base = 600 + 300 * math.sin(self.elapsed() / 5)
+        return [int(base + offset + noise * 10) for offset in (-50, 0, 50)]
+
+    def get_cliff_status(self):
+        return min(self.get_grayscale_data()) < 110
+
+    def get_battery_voltage(self):
+        self.read_delay()
+        return round(max(6.0, 8.4 - self.elapsed() / 3600), 2)
+
+    def open_camera(self, size):
+        return SimulatedCamera(size, self.fps)
+
+
+BACKENDS = {
+    "picarx": PicarXCar,
+    "4wd": Picar4WDCar,
+    "sim": lambda: SimulatedCar(
+        sensor_latency=float(os.environ.get("PICAR_SIM_LATENCY", 0.0)),
+        jitter=float(os.environ.get("PICAR_SIM_JITTER", 0.0)),
+        seed=int(os.environ.get("PICAR_SIM_SEED", 0)),
+    ),
+}
+
+
+# Cars created so far, by backend name
+cars = {}
+
+def create_car(default):
+    """
+    Instantiates the car backend selected by PICAR_BACKEND.
+
+    The instance is shared: modules running in one process (e.g. pi_socket and
+    bluetooth_server under multiplexed_server) get the same car rather than two
+    drivers for the same hardware.
+
+    Args:
+        default (str): Backend to use when PICAR_BACKEND is not set.
+
+    Returns:
+        Car: The selected backend.
+    """
+    name = os.environ.get(BACKEND_ENV, default)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown {BACKEND_ENV} '{name}', expected one of: {', '.join(BACKENDS)}")
+    if name not in cars:
+        print(f"Using {name} hardware backend")
+        cars[name] = BACKENDS[name]()
+    return cars[name]
@@ -0,0 +1,172 @@
+"""
+Benchmarks the wifi_server.py TCP control channel against the simulated hardware backend.
+
+Compares the one-shot mode (one TCP connection per command) with the persistent
+mode (one connection, commands pipelined as newline-delimited frames) and reports
+commands per second and round-trip percentiles for each.
+
+With --clients N it instead acts as a load generator: N persistent clients drive
+commands concurrently while a handful of stalled clients hold half-open
+connections, and a one-shot 'stop' is timed in the middle of the load.
+
+Usage:
+    python benchmark_control.py [--commands 2000] [--depth 16] [--sensor-latency 0.0]
+    python benchmark_control.py --clients 500 [--per-client 20] [--stalled 10]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import socket
+import threading
+import time
+
+HOST = "127.0.0.1"
+
+
+# Runs wifi_server on the simulated hardware backend
+def import_server(sensor_latency):
+    os.environ["PICAR_BACKEND"] = "sim"
+    os.environ["PICAR_SIM_LATENCY"] = str(sensor_latency)
+    import wifi_server
+    wifi_server.sensor_sampler.start()
+    return wifi_server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# One TCP connection per command, as the original index.js client did
+def run_one_shot(port, commands):
+    rtts = []
+    for command in commands:
+        start = time.perf_counter()
+        with socket.create_connection((HOST, port)) as s:
+            s.sendall(f"{command}\r\n".encode())
+            while s.recv(4096):
+                pass
+        rtts.append(time.perf_counter() - start)
+    return rtts
+
+
+# One persistent connection with up to `depth` commands in flight
+def run_persistent(port, commands, depth):
+    rtts = []
+    sent_at = []
+    with socket.create_connection((HOST, port)) as s:
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = s.makefile("rb")
+        s.sendall(b"persist\n")
+        reader.readline()
+
+        next_to_send = 0
+        for received in range(len(commands)):
+            while next_to_send < len(commands) and next_to_send - received < depth:
+                sent_at.append(time.perf_counter())
+                s.sendall(f"{commands[next_to_send]}\n".encode())
+                next_to_send += 1
+            reader.readline()
+            rtts.append(time.perf_counter() - sent_at[received])
+    return rtts
+
+
+async def load_client(port, count, rtts):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(b"persist\n")
+    await reader.readline()
+    for _ in range(count):
+        start = time.perf_counter()
+        writer.write(random.choice([b"forward\n", b"getData\n", b"left\n"]))
+        await reader.readline()
+        rtts.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def stalled_client(port, hold):
+    # Connects and sends half a command, then goes quiet
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(b"persist\nforw")
+    await asyncio.sleep(hold)
+    writer.close()
+
+
+async def timed_stop(port, delay):
+    await asyncio.sleep(delay)
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(HOST, port)
+    writer.write(b"stop\r\n")
+    await reader.read()
+    writer.close()
+    return time.perf_counter() - start
+
+
+async def run_load(port, clients, per_client, stalled):
+    rtts = []
+    stallers = [asyncio.create_task(stalled_client(port, 30)) for _ in range(stalled)]
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    stop_task = asyncio.create_task(timed_stop(port, 0.2))
+    await asyncio.gather(*(load_client(port, per_client, rtts) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    stop_rtt = await stop_task
+    for task in stallers:
+        task.cancel()
+    return rtts, elapsed, stop_rtt
+
+
+def report(name, rtts, elapsed):
+    print(f"{name:<12} {len(rtts) / elapsed:>10.0f} cmd/s   "
+          f"p50 {percentile(rtts, 50) * 1000:7.2f} ms   "
+          f"p99 {percentile(rtts, 99) * 1000:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--commands", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=16, help="pipeline depth for persistent mode")
+    parser.add_argument("--sensor-latency", type=float, default=0.0, help="simulated sensor read time, in seconds")
+    parser.add_argument("--clients", type=int, default=0, help="run the concurrent load generator with this many clients")
+    parser.add_argument("--per-client", type=int, default=20, help="commands sent by each load client")
+    parser.add_argument("--stalled", type=int, default=10, help="half-open clients held during the load run")
+    args = parser.parse_args()
+
+    server = import_server(args.sensor_latency)
+    port = free_port()
+    threading.Thread(target=server.run_server, args=(HOST, port), daemon=True).start()
+    time.sleep(0.2)
+
+    if args.clients:
+        with contextlib.redirect_stdout(io.StringIO()):
+            rtts, elapsed, stop_rtt = asyncio.run(run_load(port, args.clients, args.per_client, args.stalled))
+        print(f"{args.clients} clients, {args.stalled} stalled: {len(rtts)} commands served")
+        report("load", rtts, elapsed)
+        print(f"{'stop':<12} {stop_rtt * 1000:>10.2f} ms round trip during load")
+        return
+
+    commands = [random.choice(["forward", "stop", "getData", "left", "right"]) for _ in range(args.commands)]
+    results = {}
+
+    # The server logs every command; keep that out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, run in (("one-shot", lambda: run_one_shot(port, commands)),
+                          ("persistent", lambda: run_persistent(port, commands, args.depth))):
+            start = time.perf_counter()
+            rtts = run()
+            results[name] = (rtts, time.perf_counter() - start)
+
+    for name, (rtts, elapsed) in results.items():
+        report(name, rtts, elapsed)
+
+
+if __name__ == "__main__":
+    main()
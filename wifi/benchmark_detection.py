@@ -0,0 +1,111 @@
+"""
+Checks that object detection doesn't slow down the video stream.
+
+Captures from the simulated camera onto a FrameBus and streams it through a
+MJPEG Rendition as wifi_server does, first without detection and then with a
+DetectionWorker running. Reports the capture and stream frame rates and
+latency of both runs, and for the detection run how often results arrived,
+how many frames each skipped and how old its frame was by then.
+
+Usage:
+    python benchmark_detection.py [--seconds 10] [--fps 30] [--model hog]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from detection_worker import DetectionWorker, MODELS
+from frame_bus import FrameBus
+from video_renditions import Rendition
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import hardware
+
+SIZE = (640, 480)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(seconds, fps, model):
+    bus = FrameBus()
+    camera = hardware.SimulatedCamera(SIZE, fps=fps)
+    stop = threading.Event()
+    published = {}
+
+    def capture():
+        while not stop.is_set():
+            frame = camera.capture_array()
+            now = time.monotonic()
+            published[bus.publish(frame, now)] = now
+
+    stream = Rendition(bus, (SIZE[0], 80, 30))
+    streamed = []  # Latency of every streamed frame
+
+    def view():
+        last_seq = 0
+        while not stop.is_set():
+            seq, _ = stream.wait(last_seq, timeout=0.5)
+            if seq is not None:
+                streamed.append(time.monotonic() - published[seq])
+                last_seq = seq
+
+    results = []
+
+    def watch(detector):
+        last_index = 0
+        while not stop.is_set():
+            last_index, result = detector.wait(last_index, timeout=0.5)
+            if result is not None:
+                results.append(result)
+
+    threads = [threading.Thread(target=capture), threading.Thread(target=view)]
+    detector = None
+    if model is not None:
+        detector = DetectionWorker(bus, model)
+        detector.start()
+        threads.append(threading.Thread(target=watch, args=(detector,)))
+    stream.start()
+    for thread in threads:
+        thread.start()
+    time.sleep(1.0)  # Warm up, including the detection process start
+    streamed.clear()
+    results.clear()
+    first_seq = bus.latest()[0]
+    time.sleep(seconds)
+    captured = bus.latest()[0] - first_seq
+    stop.set()
+    stream.stop()
+    for thread in threads:
+        thread.join()
+    if detector is not None:
+        detector.stop()
+    return captured / seconds, streamed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=float, default=30.0, help="simulated camera frame rate")
+    parser.add_argument("--model", default="hog", choices=sorted(MODELS))
+    args = parser.parse_args()
+
+    print(f"{'detection':<11}{'capture fps':>12}{'stream fps':>11}{'p50 ms':>8}{'p99 ms':>8}")
+    for model in (None, args.model):
+        capture_fps, streamed, results = run(args.seconds, args.fps, model)
+        print(f"{model or 'off':<11}{capture_fps:>12.1f}{len(streamed) / args.seconds:>11.1f}"
+              f"{percentile(streamed, 50) * 1000:>8.1f}{percentile(streamed, 99) * 1000:>8.1f}")
+    if results:
+        seqs = [result["seq"] for result in results]
+        skipped = [b - a - 1 for a, b in zip(seqs, seqs[1:])]
+        ages = [result["age"] for result in results]
+        print(f"detections: {len(results) / args.seconds:.1f}/s, {sum(skipped) / max(1, len(skipped)):.1f} frames "
+              f"skipped between results, result age p50 {percentile(ages, 50) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
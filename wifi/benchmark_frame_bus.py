@@ -0,0 +1,119 @@
+"""
+Compares frame delivery from the camera to consumers through frame_bus with the old sleep loops.
+
+The old wifi_server loops slept 30 ms after every capture and after every frame
+sent to a viewer, so both ran below the camera rate and beat against each
+other. This runs a simulated camera at --fps, once with those two loops and
+once with capture_frames publishing on a FrameBus that --consumers threads
+wait on, and reports for each consumer the frames delivered per second, the
+repeats (a frame delivered twice) and the latency from capture to delivery.
+
+Usage:
+    python benchmark_frame_bus.py [--seconds 5] [--fps 30] [--consumers 3]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+from frame_bus import FrameBus
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import hardware
+
+SIZE = (640, 480)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Consumer:
+    def __init__(self):
+        self.latencies = []
+        self.frames = 0
+        self.repeats = 0
+        self.last_seq = 0
+
+    def deliver(self, seq, timestamp):
+        if seq == self.last_seq:
+            self.repeats += 1
+        else:
+            self.frames += 1
+            self.latencies.append(time.monotonic() - timestamp)
+        self.last_seq = seq
+
+
+def run_sleep_loops(camera, consumers, seconds):
+    latest = [0, None, None]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def capture():
+        while not stop.is_set():
+            frame = camera.capture_array()
+            with lock:
+                latest[:] = [latest[0] + 1, time.monotonic(), frame]
+            time.sleep(0.03)
+
+    def consume(consumer):
+        while not stop.is_set():
+            with lock:
+                seq, timestamp, frame = latest
+            if frame is not None:
+                consumer.deliver(seq, timestamp)
+            time.sleep(0.03)
+
+    return run(capture, consume, consumers, seconds, stop)
+
+
+def run_frame_bus(camera, consumers, seconds):
+    bus = FrameBus()
+    stop = threading.Event()
+
+    def capture():
+        while not stop.is_set():
+            bus.publish(camera.capture_array())
+        bus.close()
+
+    def consume(consumer):
+        while True:
+            seq, timestamp, frame = bus.wait(consumer.last_seq)
+            if frame is None:
+                return
+            consumer.deliver(seq, timestamp)
+
+    return run(capture, consume, consumers, seconds, stop)
+
+
+def run(capture, consume, consumers, seconds, stop):
+    threads = [threading.Thread(target=capture)]
+    threads += [threading.Thread(target=consume, args=(consumer,)) for consumer in consumers]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--fps", type=float, default=30.0, help="simulated camera frame rate")
+    parser.add_argument("--consumers", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'mode':<14}{'consumer':>9}{'fps':>7}{'repeats':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for label, method in (("sleep loops", run_sleep_loops), ("frame bus", run_frame_bus)):
+        consumers = [Consumer() for _ in range(args.consumers)]
+        method(hardware.SimulatedCamera(SIZE, fps=args.fps), consumers, args.seconds)
+        for i, consumer in enumerate(consumers):
+            print(f"{label:<14}{i:>9}{consumer.frames / args.seconds:>7.1f}{consumer.repeats:>9}"
+                  f"{percentile(consumer.latencies, 50) * 1000:>9.1f}{percentile(consumer.latencies, 99) * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
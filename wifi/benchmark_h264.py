@@ -0,0 +1,149 @@
+"""
+Compares the H.264 stream of /video_h264 with the MJPEG stream of /video_feed on a replayed clip.
+
+Replays a clip into a FrameBus in real time and streams it through each path's
+encoder as wifi_server does: a 640 px, quality 80 Rendition for MJPEG, and
+H264Stream for H.264. Reports the bandwidth, the encoder CPU time per frame
+(process CPU time minus that of replaying alone), and the latency from a
+frame being published to its encoded bytes being ready to send.
+
+Without --clip a synthetic clip is used: a textured scene panning slowly,
+with a moving block and sensor noise.
+
+Usage:
+    python benchmark_h264.py [--clip recording.mp4] [--frames 150] [--fps 30]
+"""
+import argparse
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import h264_stream
+from frame_bus import FrameBus
+from video_renditions import Rendition
+
+SIZE = (640, 480)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def load_clip(path, count):
+    capture = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frames.append(cv2.resize(frame, SIZE, interpolation=cv2.INTER_AREA))
+    return frames
+
+
+def synthetic_clip(count):
+    rng = np.random.default_rng(0)
+    width, height = SIZE
+    # Smooth random texture, wider than the frame so the view can pan across it
+    scene = cv2.resize(rng.integers(0, 256, (height // 8, width // 4, 3), dtype=np.uint8), (width * 2, height),
+                       interpolation=cv2.INTER_CUBIC)
+    frames = []
+    for i in range(count):
+        frame = scene[:, i * 2 % width:i * 2 % width + width].copy()
+        x = i * 6 % (width - 80)
+        frame[200:280, x:x + 80] = (40, 200, 240)
+        noise = rng.integers(-4, 5, frame.shape, dtype=np.int16)
+        frames.append(np.clip(frame + noise, 0, 255).astype(np.uint8))
+    return frames
+
+
+class Replay:
+    def __init__(self, frames, fps):
+        self.bus = FrameBus()
+        self.frames = frames
+        self.period = 1.0 / fps
+        self.published = {}  # Publish time by seq
+        self.done = threading.Event()
+
+    def run(self):
+        next_time = time.monotonic()
+        for frame in self.frames:
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_time += self.period
+            now = time.monotonic()
+            seq = self.bus.publish(frame, now)
+            self.published[seq] = now
+        time.sleep(0.2)  # Let the encoder finish the last frames
+        self.done.set()
+
+
+def measure(frames, fps, consume):
+    replay = Replay(frames, fps)
+    received = []  # (seq, bytes, time ready)
+    thread = threading.Thread(target=consume, args=(replay, received), daemon=True)
+    thread.start()
+    time.sleep(0.2)
+    cpu = time.process_time()
+    replay.run()
+    cpu = time.process_time() - cpu
+    latencies = [ready - replay.published[seq] for seq, _, ready in received if seq in replay.published]
+    return cpu, sum(size for _, size, _ in received), len(received), latencies
+
+
+def consume_none(replay, received):
+    replay.done.wait()
+
+
+def consume_mjpeg(replay, received):
+    rendition = Rendition(replay.bus, (SIZE[0], 80, 30))
+    rendition.start()
+    last_seq = 0
+    while not replay.done.is_set():
+        seq, jpeg = rendition.wait(last_seq, timeout=0.5)
+        if seq is not None:
+            received.append((seq, len(jpeg), time.monotonic()))
+            last_seq = seq
+    rendition.stop()
+
+
+def consume_h264(replay, received):
+    stream = h264_stream.H264Stream(replay.bus)
+    stream.acquire()
+    received.append((0, len(stream.wait_init(timeout=5.0) or b""), time.monotonic()))
+    last_index = 0
+    while not replay.done.is_set():
+        for last_index, seq, fragment in stream.fragments(last_index, timeout=0.5):
+            received.append((seq, len(fragment), time.monotonic()))
+    stream.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clip", help="video file to replay instead of the synthetic clip")
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--fps", type=float, default=30.0)
+    args = parser.parse_args()
+
+    frames = load_clip(args.clip, args.frames) if args.clip else synthetic_clip(args.frames)
+    seconds = len(frames) / args.fps
+    paths = [("MJPEG q80", consume_mjpeg)]
+    if h264_stream.available():
+        paths.append(("H.264 fMP4", consume_h264))
+    else:
+        print("PyAV not installed; skipping H.264")
+
+    baseline, _, _, _ = measure(frames, args.fps, consume_none)
+    print(f"{'path':<12}{'frames':>7}{'kB/frame':>10}{'Mbit/s':>8}{'CPU ms/frame':>14}{'p50 ms':>8}{'p99 ms':>8}")
+    for label, consume in paths:
+        cpu, size, count, latencies = measure(frames, args.fps, consume)
+        cpu_per_frame = (cpu - baseline) / len(frames) * 1000
+        print(f"{label:<12}{len(latencies):>7}{size / max(1, count) / 1000:>10.1f}{size * 8 / seconds / 1e6:>8.2f}"
+              f"{cpu_per_frame:>14.2f}{percentile(latencies, 50) * 1000:>8.1f}{percentile(latencies, 99) * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
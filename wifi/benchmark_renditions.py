@@ -0,0 +1,102 @@
+"""
+Checks that /video_feed encode cost follows the number of profiles, not viewers, and that slow viewers skip frames.
+
+Runs wifi_server's Flask app and capture thread on the simulated hardware
+backend, connects --viewers viewers spread over a few stream profiles plus one
+slow viewer that reads at --slow-rate bytes per second, and reports frames
+per second and bandwidth per profile, the frames encoded per profile, and
+what the slow viewer received.
+
+Usage:
+    python benchmark_renditions.py [--seconds 5] [--viewers 12] [--slow-rate 100000]
+"""
+import argparse
+import os
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+HOST = "127.0.0.1"
+PROFILES = ["", "?w=320&q=50&fps=15", "?w=160&q=30&fps=5"]
+BOUNDARY = b"--frame\r\n"
+
+
+class Viewer:
+    def __init__(self, port, query, rate=None):
+        self.query = query
+        self.rate = rate  # Bytes per second, None to read as fast as possible
+        self.frames = 0
+        self.bytes = 0
+        self.sock = socket.create_connection((HOST, port))
+        if rate is not None:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+        self.sock.sendall(f"GET /video_feed{query} HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode())
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.read, daemon=True)
+        self.thread.start()
+
+    def read(self):
+        tail = b""
+        chunk = 4096
+        while not self.stop.is_set():
+            data = self.sock.recv(chunk)
+            if not data:
+                return
+            self.bytes += len(data)
+            # Count boundaries, including ones split across reads
+            self.frames += (tail + data).count(BOUNDARY)
+            tail = data[-(len(BOUNDARY) - 1):]
+            if self.rate is not None:
+                time.sleep(len(data) / self.rate)
+
+    def close(self):
+        self.stop.set()
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--viewers", type=int, default=12)
+    parser.add_argument("--slow-rate", type=int, default=100000, help="bytes per second the slow viewer reads")
+    args = parser.parse_args()
+
+    os.environ["PICAR_BACKEND"] = "sim"
+    import wifi_server
+
+    threading.Thread(target=wifi_server.capture_frames, args=(wifi_server.initialize_camera(),), daemon=True).start()
+    server = make_server(HOST, 0, wifi_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    viewers = [Viewer(server.port, PROFILES[i % len(PROFILES)]) for i in range(args.viewers)]
+    slow = Viewer(server.port, PROFILES[0], rate=args.slow_rate)
+    time.sleep(1.0)
+    for viewer in viewers + [slow]:
+        viewer.frames = viewer.bytes = 0
+    encoded = {profile: stats["encoded"] for profile, stats in wifi_server.renditions.stats().items()}
+    time.sleep(args.seconds)
+    stats = wifi_server.renditions.stats()
+
+    print(f"{'profile':<22}{'viewers':>8}{'encoded/s':>11}{'fps':>7}{'kB/s':>9}")
+    for query in PROFILES:
+        group = [viewer for viewer in viewers if viewer.query == query]
+        fps = sum(viewer.frames for viewer in group) / len(group) / args.seconds
+        rate = sum(viewer.bytes for viewer in group) / len(group) / args.seconds / 1000
+        print(f"{query or '(default)':<22}{len(group):>8}{'':>11}{fps:>7.1f}{rate:>9.1f}")
+    for profile, values in stats.items():
+        per_second = (values["encoded"] - encoded.get(profile, 0)) / args.seconds
+        print(f"{'encoder ' + profile:<22}{values['viewers']:>8}{per_second:>11.1f}")
+    print(f"{'slow viewer':<22}{1:>8}{'':>11}{slow.frames / args.seconds:>7.1f}"
+          f"{slow.bytes / args.seconds / 1000:>9.1f}")
+
+    for viewer in viewers + [slow]:
+        viewer.close()
+    time.sleep(0.5)
+    print(f"encoders left after all viewers closed: {len(wifi_server.renditions.stats())}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
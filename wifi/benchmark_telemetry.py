@@ -0,0 +1,141 @@
+"""
+Compares the /telemetry push channel with polling getData over the control channel.
+
+Runs wifi_server on the simulated hardware backend with --clients dashboards
+wanting updates at --rate per second, once by polling getData on a new TCP
+connection each time (what a live dashboard on the old index.js needed) and
+once by subscribing to /telemetry. Reports per client the messages, bytes
+and connections per second, the average number of values per message (delta
+suppression sends only the changed ones), and the sensor reads per second,
+which stay the same however many clients there are.
+
+Usage:
+    python benchmark_telemetry.py [--seconds 5] [--clients 20] [--rate 10]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+HOST = "127.0.0.1"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+class Client:
+    def __init__(self):
+        self.messages = 0
+        self.values = 0
+        self.bytes = 0
+        self.connections = 0
+
+
+def poll(port, rate, client, stop):
+    while not stop.is_set():
+        start = time.monotonic()
+        with socket.create_connection((HOST, port)) as s:
+            client.connections += 1
+            s.sendall(b"getData\r\n")
+            reply = b""
+            while True:
+                data = s.recv(4096)
+                if not data:
+                    break
+                reply += data
+        client.bytes += len(reply)
+        client.messages += 1
+        client.values += len(json.loads(reply))
+        stop.wait(max(0.0, 1.0 / rate - (time.monotonic() - start)))
+
+
+def subscribe(port, rate, client, stop):
+    with socket.create_connection((HOST, port)) as s:
+        client.connections += 1
+        s.sendall(f"GET /telemetry?rate={rate} HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode())
+        s.settimeout(0.5)
+        reader = s.makefile("rb")
+        while not stop.is_set():
+            try:
+                line = reader.readline()
+            except socket.timeout:
+                continue
+            if not line:
+                return
+            client.bytes += len(line)
+            if line.startswith(b"data: "):
+                client.messages += 1
+                client.values += len(json.loads(line[6:]))
+
+
+def run(target, port, clients, rate, seconds, reads):
+    stop = threading.Event()
+    results = [Client() for _ in range(clients)]
+    threads = [threading.Thread(target=target, args=(port, rate, client, stop)) for client in results]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)
+    for client in results:
+        client.messages = client.values = client.bytes = client.connections = 0
+    reads_before = sum(reads.values())
+    time.sleep(seconds)
+    sensor_reads = sum(reads.values()) - reads_before
+    totals = {field: sum(getattr(client, field) for client in results)
+              for field in ("messages", "values", "bytes", "connections")}
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return totals, sensor_reads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=10.0, help="updates per second each client wants")
+    args = parser.parse_args()
+
+    os.environ["PICAR_BACKEND"] = "sim"
+    import wifi_server
+
+    # Count sensor reads; the sampler calls whatever its sensors table holds
+    reads = {}
+    for name, (read, interval) in list(wifi_server.sensor_sampler.sensors.items()):
+        reads[name] = 0
+
+        def counted(read=read, name=name):
+            reads[name] += 1
+            return read()
+        wifi_server.sensor_sampler.sensors[name] = (counted, interval)
+    wifi_server.sensor_sampler.start()
+
+    control_port = free_port()
+    threading.Thread(target=wifi_server.run_server, args=(HOST, control_port), daemon=True).start()
+    server = make_server(HOST, 0, wifi_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    time.sleep(0.2)
+
+    print(f"{args.clients} clients wanting {args.rate:g} updates/s, per client:")
+    print(f"{'mode':<12}{'msgs/s':>8}{'values/msg':>12}{'bytes/s':>9}{'conns/s':>9}{'sensor reads/s':>16}")
+    for label, target, port in (("polling", poll, control_port), ("telemetry", subscribe, server.port)):
+        # The control server logs every command; keep that out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            totals, sensor_reads = run(target, port, args.clients, args.rate, args.seconds, reads)
+        per_client = args.clients * args.seconds
+        print(f"{label:<12}{totals['messages'] / per_client:>8.1f}"
+              f"{totals['values'] / max(1, totals['messages']):>12.2f}{totals['bytes'] / per_client:>9.0f}"
+              f"{totals['connections'] / per_client:>9.2f}{sensor_reads / args.seconds:>16.1f}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
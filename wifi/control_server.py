@@ -0,0 +1,154 @@
+"""
+asyncio TCP control server used by wifi_server.py.
+
+Every connection is a coroutine on one event loop, so a slow or half-open client
+only ever holds its own connection. Commands are passed to `handle_command` on a
+dedicated hardware thread so blocking fc.* calls never stall the event loop; the
+thread serves 'stop' ahead of any other queued command.
+
+The wire protocol is unchanged: a connection whose first line is the persist
+command stays open and answers every newline-delimited line in order (empty ones
+with an error), anything else is answered once and closed.
+"""
+import asyncio
+import itertools
+import json
+import queue
+import threading
+from concurrent.futures import Future
+
+READ_TIMEOUT = 10       # Seconds to wait for the first command on a new connection
+IDLE_TIMEOUT = 120      # Seconds a persistent connection may stay silent before it is closed
+WRITE_TIMEOUT = 10      # Seconds to wait for a client to drain its responses
+MAX_LINE = 1024         # Longest accepted command, in bytes
+WRITE_HIGH_WATER = 64 * 1024  # Unsent response bytes before a connection stops reading
+
+PRIORITY_COMMANDS = {"stop"}
+EMPTY_COMMAND_REPLY = json.dumps({"error": "Empty command"}) + '\n'
+
+
+class HardwareWorker:
+    """
+    Runs blocking hardware calls on a single thread, in priority order.
+
+    Commands in PRIORITY_COMMANDS are served before anything else that is queued,
+    otherwise commands run in submission order.
+    """
+
+    def __init__(self):
+        self.jobs = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.thread = threading.Thread(target=self.run, name="hardware-worker")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, func, command):
+        """
+        Queues `func(command)` for the hardware thread.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the return value of `func`.
+        """
+        future = Future()
+        priority = 0 if command in PRIORITY_COMMANDS else 1
+        self.jobs.put((priority, next(self.counter), future, func, command))
+        return future
+
+    def run(self):
+        while True:
+            _, _, future, func, command = self.jobs.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(command))
+            except Exception as e:
+                future.set_exception(e)
+
+
+class ControlServer:
+    """
+    Serves the newline-delimited control protocol to many concurrent clients.
+
+    Args:
+        handle_command (callable): Maps a command string to a response string.
+        host (str): Address to bind.
+        port (int): Port to bind.
+        persist_command (str): First line that switches a connection to persistent mode.
+    """
+
+    def __init__(self, handle_command, host, port, persist_command="persist",
+                 read_timeout=READ_TIMEOUT, idle_timeout=IDLE_TIMEOUT):
+        self.handle_command = handle_command
+        self.host = host
+        self.port = port
+        self.persist_command = persist_command
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.worker = HardwareWorker()
+        self.connections = 0
+
+    async def run_command(self, command):
+        return await asyncio.wrap_future(self.worker.submit(self.handle_command, command))
+
+    async def send(self, writer, data):
+        writer.write(data)
+        # Backpressure: stop reading from this client until it accepts our responses
+        await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        try:
+            writer.transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+            data = await asyncio.wait_for(reader.read(MAX_LINE), self.read_timeout)
+            lines = data.split(b'\n')
+
+            if lines[0].decode().strip() != self.persist_command:
+                command = data.decode().strip()
+                if command:
+                    response = await self.run_command(command)
+                    await self.send(writer, response.encode())
+                return
+
+            ack = json.dumps({"status": "Persistent connection"}) + '\n'
+            await self.send(writer, ack.encode())
+            buffer = b'\n'.join(lines[1:])
+            while True:
+                *commands, buffer = buffer.split(b'\n')
+                if len(buffer) > MAX_LINE:
+                    print(f"Closing connection: command longer than {MAX_LINE} bytes")
+                    return
+                responses = []
+                for command in commands:
+                    command = command.decode().strip()
+                    if command:
+                        responses.append(await self.run_command(command) + '\n')
+                    else:
+                        # Every line gets a reply, or clients matching them up in order go out of step
+                        responses.append(EMPTY_COMMAND_REPLY)
+                if responses:
+                    await self.send(writer, ''.join(responses).encode())
+                data = await asyncio.wait_for(reader.read(4096), self.idle_timeout)
+                if not data:
+                    return
+                buffer += data
+        except asyncio.TimeoutError:
+            pass
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Connection error: {e}")
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve_forever(self):
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                            reuse_address=True, backlog=1024)
+        print(f"Server listening on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(handle_command, host, port, persist_command="persist"):
+    """
+    Runs a ControlServer on a new event loop until the process exits.
+    """
+    asyncio.run(ControlServer(handle_command, host, port, persist_command).serve_forever())
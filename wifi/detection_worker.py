@@ -0,0 +1,182 @@
+"""
+Object detection for wifi_server.py, in a separate process fed from the frame bus.
+
+DetectionWorker runs this file as a child process and hands it frames through
+shared memory. A feeder thread copies the latest frame from the bus into
+the shared buffer and sends the child its sequence number, then waits for the
+result. Frames captured while the model is busy are skipped, so detection runs
+as fast as the model allows and never holds up capture or encoding. The child
+runs at a lower priority and with one OpenCV thread, so it only uses CPU that
+the video path leaves free.
+
+The child is started as a script rather than with multiprocessing: spawning
+would re-import wifi_server, car hardware included, in the child.
+
+Results are dicts with the sequence number of the frame they were computed
+from, published for wifi_server's push channel:
+
+    {"seq": 1234, "detected": true, "class_name": "person", "class_score": 0.87,
+     "box": [x, y, w, h], "age": 0.21}
+
+Usage (started by DetectionWorker, not by hand):
+    python detection_worker.py <shared memory name> <height> <width> [--model hog]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+def hog_detector():
+    """
+    OpenCV's HOG + linear SVM pedestrian detector; runs on any CPU without model files.
+
+    Returns:
+        callable: Takes a BGR frame and returns the result dict for it.
+    """
+    hog = cv2.HOGDescriptor()
+    hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def detect(frame):
+        boxes, weights = hog.detectMultiScale(frame, winStride=(8, 8), padding=(8, 8), scale=1.1)
+        if len(boxes) == 0:
+            return {"detected": False}
+        best = int(np.argmax(weights))
+        return {"detected": True, "class_name": "person", "class_score": round(float(weights[best]), 2),
+                "box": [int(v) for v in boxes[best]]}
+    return detect
+
+
+MODELS = {"hog": hog_detector}
+
+
+class DetectionWorker:
+    """
+    Runs detection on the frames of a FrameBus in a child process.
+
+    Args:
+        bus (FrameBus): Source of camera frames.
+        model (str): Name of the model in MODELS.
+    """
+
+    def __init__(self, bus, model="hog"):
+        self.bus = bus
+        self.model = model
+        self.cond = threading.Condition()
+        self.result = {"seq": 0, "detected": False}  # Latest result
+        self.index = 0  # Incremented on every result, for waiters
+        self.detections = 0
+        self.running = False
+        self.process = None
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="detection-feeder")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the child process and frees the shared memory.
+        """
+        self.running = False
+        if self.process is not None:
+            self.process.kill()
+        if self.thread is not None:
+            self.thread.join()
+
+    def run(self):
+        memory = shared = None
+        try:
+            last_seq = 0
+            while self.running:
+                seq, timestamp, frame = self.bus.wait(last_seq, timeout=1.0)
+                if seq is None:
+                    continue
+                last_seq = seq
+                if memory is None:
+                    memory = shared_memory.SharedMemory(create=True, size=frame.nbytes)
+                    shared = np.ndarray(frame.shape, frame.dtype, buffer=memory.buf)
+                    self.process = subprocess.Popen(
+                        [sys.executable, os.path.abspath(__file__), memory.name, str(frame.shape[0]),
+                         str(frame.shape[1]), "--model", self.model],
+                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1)
+                # The child only reads the buffer between getting a seq and answering it
+                np.copyto(shared, frame)
+                self.process.stdin.write(f"{seq}\n")
+                line = self.process.stdout.readline()
+                if not line:
+                    raise RuntimeError(f"detection process exited with {self.process.wait()}")
+                self.publish(json.loads(line), timestamp)
+        except Exception as e:
+            if self.running:
+                print(f"Detection stopped: {e}")
+        finally:
+            if self.process is not None:
+                self.process.kill()
+                self.process.wait()
+            if memory is not None:
+                shared = None  # Release the view so the segment can be closed
+                memory.close()
+                memory.unlink()
+
+    def publish(self, result, timestamp):
+        result["age"] = round(time.monotonic() - timestamp, 3)
+        with self.cond:
+            self.result = result
+            self.index += 1
+            self.detections += 1
+            self.cond.notify_all()
+
+    def latest(self):
+        with self.cond:
+            return self.result
+
+    def wait(self, after=0, timeout=None):
+        """
+        Blocks until a result newer than the `after`-th one is published.
+
+        Returns:
+            tuple: (index, result) of the latest result, (after, None) on timeout.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.index > after, timeout):
+                return after, None
+            return self.index, self.result
+
+
+# Child process: detects on each frame whose seq arrives on stdin, one JSON result per line on stdout
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("memory")
+    parser.add_argument("height", type=int)
+    parser.add_argument("width", type=int)
+    parser.add_argument("--model", default="hog", choices=sorted(MODELS))
+    args = parser.parse_args()
+
+    os.nice(10)
+    cv2.setNumThreads(1)
+    memory = shared_memory.SharedMemory(args.memory)
+    # The parent owns the segment; stop this process's resource tracker from unlinking it on exit
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(memory._name, "shared_memory")
+    frame = np.ndarray((args.height, args.width, 3), np.uint8, buffer=memory.buf)
+    detect = MODELS[args.model]()
+
+    for line in sys.stdin:
+        result = detect(frame)
+        result["seq"] = int(line)
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Camera frame bus for wifi_server.py.
+
+The capture thread publishes every frame into a small ring of preallocated
+slots, each tagged with a sequence number and the capture time. Consumers
+(the JPEG encoder, a recorder, a detector) block until a frame newer than the
+last one they saw exists, instead of polling on a timer, and all of them read
+the same slot without copying it.
+
+A slot is only rewritten after `slots - 1` newer frames have been published,
+so a consumer can work on the frame it got for that long. Consumers that may
+fall further behind copy it.
+"""
+import threading
+import time
+
+import numpy as np
+
+
+class FrameBus:
+    """
+    Args:
+        slots (int): Frames kept in the ring; at least 2, so the latest frame
+            is never the one being written.
+    """
+
+    def __init__(self, slots=4):
+        if slots < 2:
+            raise ValueError("FrameBus needs at least 2 slots")
+        self.frames = [None] * slots  # Allocated on the first publish, once the frame shape is known
+        self.seqs = [0] * slots
+        self.timestamps = [0.0] * slots
+        self.seq = 0  # Sequence number of the latest complete frame
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def publish(self, frame, timestamp=None):
+        """
+        Copies a frame into the next slot and wakes every waiting consumer.
+
+        Args:
+            frame (numpy.ndarray): The captured frame.
+            timestamp (float): time.monotonic() of the capture, defaults to now.
+
+        Returns:
+            int: The frame's sequence number.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic()
+        with self.cond:
+            seq = self.seq + 1
+        index = seq % len(self.frames)
+        slot = self.frames[index]
+        if slot is None or slot.shape != frame.shape or slot.dtype != frame.dtype:
+            slot = self.frames[index] = np.empty_like(frame)
+        # Copy outside the lock; no consumer is handed this slot until seq is published
+        np.copyto(slot, frame)
+        with self.cond:
+            self.seqs[index] = seq
+            self.timestamps[index] = timestamp
+            self.seq = seq
+            self.cond.notify_all()
+        return seq
+
+    def wait(self, after=0, timeout=None):
+        """
+        Blocks until a frame newer than `after` is published.
+
+        Args:
+            after (int): Sequence number of the last frame the consumer has seen.
+            timeout (float): Seconds to wait, None for no limit.
+
+        Returns:
+            tuple: (seq, timestamp, frame) of the latest frame; frames published in
+                between are skipped. (None, None, None) on timeout or once closed.
+                The frame is shared, not a copy, and must not be modified.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after or self.closed, timeout) or self.seq <= after:
+                return None, None, None
+            index = self.seq % len(self.frames)
+            return self.seq, self.timestamps[index], self.frames[index]
+
+    def latest(self):
+        """
+        Returns:
+            tuple: (seq, timestamp, frame) of the latest frame without waiting,
+                (0, None, None) before the first one.
+        """
+        with self.cond:
+            if self.seq == 0:
+                return 0, None, None
+            index = self.seq % len(self.frames)
+            return self.seq, self.timestamps[index], self.frames[index]
+
+    def close(self):
+        """
+        Wakes every waiting consumer with no frame.
+        """
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
@@ -0,0 +1,249 @@
+"""
+H.264 stream of the camera feed in fragmented MP4, for wifi_server.py's /video_h264.
+
+MJPEG compresses every frame on its own. H.264 sends mostly the changes
+between frames, at a fraction of the bandwidth. The frames from the frame bus
+are encoded with PyAV, using the Raspberry Pi's hardware encoder when it is
+there and libx264 otherwise. They are muxed as fragmented MP4 with one frame per
+fragment, which the Electron page plays through Media Source Extensions.
+
+One encoder is shared by every viewer. It starts with the first viewer and
+stops with the last. A new viewer gets the init segment (ftyp + moov), then
+the fragments since the last keyframe. A viewer that falls behind can't skip
+single frames of an inter-frame stream. Once the fragments it still needs have
+been dropped, it resumes at the latest keyframe.
+
+The MP4 muxer writes a fragment when the next frame arrives, as the sample
+duration is only known then. That adds one frame period of latency.
+
+PyAV is optional: without it `available()` is False and only MJPEG is served.
+"""
+import fractions
+import threading
+
+# Tried in order: the Raspberry Pi's V4L2 hardware encoder, then software x264
+ENCODERS = ("h264_v4l2m2m", "libx264")
+TIME_BASE = fractions.Fraction(1, 90000)
+
+
+def available():
+    try:
+        import av  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def codec_string(extradata):
+    """
+    Returns the RFC 6381 codec string (avc1.PPCCLL) for H.264 codec extradata.
+
+    Args:
+        extradata (bytes): Either an avcC record or Annex B parameter sets.
+    """
+    if extradata[0] == 1:
+        profile = extradata[1:4]  # avcC: profile, constraint flags, level
+    else:
+        sps = extradata.index(b"\x00\x00\x01\x67") + 4  # Annex B: first SPS NAL unit
+        profile = extradata[sps:sps + 3]
+    return "avc1." + profile.hex()
+
+
+class FragmentSink:
+    """
+    File-like object the MP4 muxer writes to; collects what each mux call produced.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class H264Stream:
+    """
+    Encodes the frames of a FrameBus to fragmented MP4 on a background thread.
+
+    Args:
+        bus (FrameBus): Source of camera frames.
+        fps (int): Maximum encoded frame rate; also the keyframe interval, so one keyframe a second.
+        bitrate (int): Target bits per second.
+        encoders (tuple): Encoder names to try, in order.
+    """
+
+    def __init__(self, bus, fps=30, bitrate=1_000_000, encoders=ENCODERS):
+        self.bus = bus
+        self.fps = fps
+        self.bitrate = bitrate
+        self.encoders = encoders
+        self.cond = threading.Condition()
+        self.init = None  # ftyp + moov of the running encoder
+        self.codec = None  # e.g. "avc1.42c01e"
+        self.encoder = None  # Name of the encoder in use
+        self.gop = []  # (index, frame seq, fragment) since the last keyframe
+        self.index = 0  # Index of the latest fragment
+        self.viewers = 0
+        self.encoded = 0
+        self.stop_event = None  # Set to stop the current encoder thread; None while stopped
+        self.error = None
+
+    def acquire(self):
+        """
+        Registers a viewer, starting the encoder for the first one.
+        """
+        with self.cond:
+            self.viewers += 1
+            if self.stop_event is None:
+                self.stop_event = threading.Event()
+                self.init = self.codec = self.error = None
+                self.gop = []
+                # A thread still winding down from the last session has its own, already set, event
+                thread = threading.Thread(target=self.run, args=(self.stop_event,), name="h264-stream")
+                thread.daemon = True
+                thread.start()
+
+    def release(self):
+        """
+        Unregisters a viewer, stopping the encoder after the last one.
+        """
+        with self.cond:
+            self.viewers -= 1
+            if self.viewers == 0:
+                self.stop_event.set()
+                self.stop_event = None
+                self.cond.notify_all()
+
+    def active(self):
+        return self.stop_event is not None and self.error is None
+
+    def wait_init(self, timeout=None):
+        """
+        Blocks until the encoder has produced its init segment.
+
+        Returns:
+            bytes: The init segment, or None if the encoder failed or the timeout expired.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.init is not None or not self.active(), timeout)
+            return self.init if self.active() else None
+
+    def fragments(self, after=0, timeout=None):
+        """
+        Blocks until there are fragments after the one with index `after`.
+
+        Args:
+            after (int): Index of the last fragment the viewer got, 0 for a new viewer.
+            timeout (float): Seconds to wait, None for no limit.
+
+        Returns:
+            list: (index, frame seq, fragment) tuples to send next, starting at the last
+                keyframe if the viewer is new or has fallen too far behind. Empty on timeout
+                or once the encoder has stopped.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.index > after or not self.active(), timeout)
+            if not self.active() or not self.gop or self.index <= after:
+                return []
+            if after + 1 < self.gop[0][0]:
+                # The fragments this viewer needs next are gone; restart it at the keyframe
+                return list(self.gop)
+            return [fragment for fragment in self.gop if fragment[0] > after]
+
+    def open(self, width, height):
+        import av
+        for name in self.encoders:
+            # Probe first: opening fails where e.g. the hardware encoder has no device
+            try:
+                probe = av.CodecContext.create(name, "w")
+                probe.width, probe.height, probe.pix_fmt, probe.time_base = width, height, "yuv420p", TIME_BASE
+                probe.open()
+            except (av.error.FFmpegError, ValueError) as e:
+                print(f"H.264 encoder {name} unavailable: {e}")
+                continue
+
+            sink = FragmentSink()
+            container = av.open(sink, "w", format="mp4",
+                                options={"movflags": "empty_moov+default_base_moof+frag_every_frame"})
+            stream = container.add_stream(name, rate=self.fps)
+            stream.width, stream.height, stream.pix_fmt = width, height, "yuv420p"
+            stream.bit_rate = self.bitrate
+            stream.codec_context.time_base = TIME_BASE
+            stream.codec_context.gop_size = self.fps
+            if name == "libx264":
+                stream.options = {"preset": "ultrafast", "tune": "zerolatency", "profile": "baseline"}
+            self.encoder = name
+            return container, stream, sink
+        raise RuntimeError(f"No H.264 encoder available out of {', '.join(self.encoders)}")
+
+    def run(self, stop_event):
+        import av
+        container = None
+        try:
+            last_seq = 0
+            last_time = None
+            start_time = None
+            pending = {}  # Frame seq and keyframe flag by pts, until the muxer writes the fragment
+            previous_pts = None
+            while not stop_event.is_set():
+                seq, timestamp, frame = self.bus.wait(last_seq, timeout=1.0)
+                if seq is None:
+                    continue
+                last_seq = seq
+                if last_time is not None and timestamp - last_time < 0.9 / self.fps:
+                    continue
+                last_time = timestamp
+
+                if container is None:
+                    container, stream, sink = self.open(frame.shape[1], frame.shape[0])
+                    start_time = timestamp
+                video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+                video_frame.pts = round((timestamp - start_time) / TIME_BASE)
+                video_frame.time_base = TIME_BASE
+                for packet in stream.encode(video_frame):
+                    pending[packet.pts] = (seq, packet.is_keyframe)
+                    container.mux(packet)
+                    # Each mux writes out the fragment of the packet before it
+                    self.publish(stop_event, sink.take(), stream, pending.pop(previous_pts, None))
+                    previous_pts = packet.pts
+        except Exception as e:
+            print(f"H.264 stream stopped: {e}")
+            with self.cond:
+                if self.stop_event is stop_event:
+                    self.error = e
+                    self.cond.notify_all()
+        finally:
+            if container is not None:
+                try:
+                    container.close()
+                except Exception:
+                    pass
+
+    def publish(self, stop_event, data, stream, frame):
+        with self.cond:
+            if stop_event is not self.stop_event:
+                # From a thread of an earlier session still winding down; acquire() has reset the state
+                return
+            if self.init is None:
+                # The first mux writes ftyp + moov only
+                self.init = data
+                self.codec = codec_string(bytes(stream.codec_context.extradata))
+            elif data and frame is not None:
+                seq, keyframe = frame
+                self.index += 1
+                if keyframe:
+                    self.gop = []
+                if self.gop or keyframe:
+                    self.gop.append((self.index, seq, data))
+                self.encoded += 1
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {"encoder": self.encoder, "codec": self.codec, "viewers": self.viewers, "encoded": self.encoded}
@@ -1,51 +1,92 @@
 var server_port = 65432;
 var server_addr = "10.0.0.22";   // the IP address of your Raspberry PI
 
-// Function to connect to the server and send a message
-function client(message){
-    console.log("Client function called with message:", message);
-    const net = require('net'); // Require the 'net' module to create a TCP connection
-    var input = message || document.getElementById("myName").value; // Get input from the user, or use the provided message parameter
+const net = require('net'); // Require the 'net' module to create a TCP connection
 
-    console.log("Attempting to connect to:", server_addr, "on port:", server_port);
+// Persistent connection to the Raspberry Pi server, shared by every command
+var connection = null;
+var pendingReplies = []; // Response handlers, in the order their commands were sent
+var rxBuffer = "";
+
+// Opens the persistent connection on first use. Responses are newline-delimited
+// and arrive in the same order as the commands, so they are matched up FIFO.
+function getConnection() {
+    if (connection) {
+        return connection;
+    }
 
-    // Create a TCP connection to the Raspberry Pi server
-    const client = net.createConnection({ port: server_port, host: server_addr }, () => {
+    console.log("Attempting to connect to:", server_addr, "on port:", server_port);
+    connection = net.createConnection({ port: server_port, host: server_addr }, () => {
         console.log('Connected to server!');
-        client.write(`${input}\r\n`);
-        console.log("Sent message to server:", input);
     });
-    
-    // Handle data received from the server
-    client.on('data', (data) => {
-        console.log("Received data from server:", data.toString());
-
-         // parse the data from the server and update the display
-        try {
-            const parsedData = JSON.parse(data);
-            if (parsedData.greeting) {
-                document.getElementById("greet_from_server").innerHTML = parsedData.greeting;
-            } else if (parsedData.status) {
-                document.getElementById("greet_from_server").innerHTML = parsedData.status;
-                updateDataDisplay(parsedData);
-            } else {
-                updateDataDisplay(parsedData);
+    connection.setNoDelay(true);
+
+    // Switch the server into persistent mode; its acknowledgement is ignored
+    connection.write("persist\n");
+    pendingReplies.push(() => {});
+
+    connection.on('data', (data) => {
+        rxBuffer += data.toString();
+        let newline;
+        while ((newline = rxBuffer.indexOf('\n')) >= 0) {
+            const line = rxBuffer.slice(0, newline);
+            rxBuffer = rxBuffer.slice(newline + 1);
+            const onReply = pendingReplies.shift();
+            if (onReply) {
+                onReply(line);
             }
-        // Handle any errors during data parsing
-        } catch (error) {
-            console.error("Error parsing server response:", error);
-            document.getElementById("greet_from_server").innerHTML = "Error processing server response";
         }
-        client.end();
     });
 
-    client.on('end', () => {
+    connection.on('close', () => {
         console.log('Disconnected from server');
+        connection = null;
+        pendingReplies = [];
+        rxBuffer = "";
     });
 
-    client.on('error', (err) => {
+    connection.on('error', (err) => {
         console.error('Connection error:', err);
     });
+
+    return connection;
+}
+
+// Function to send a message to the server over the persistent connection
+function client(message){
+    console.log("Client function called with message:", message);
+    var input = message || document.getElementById("myName").value; // Get input from the user, or use the provided message parameter
+    input = input.replace(/[\r\n]/g, ' ');
+    if (!input.trim()) {
+        console.log("Not sending an empty command");
+        return;
+    }
+
+    pendingReplies.push(handleResponse);
+    getConnection().write(`${input}\n`);
+    console.log("Sent message to server:", input);
+}
+
+// Handle data received from the server
+function handleResponse(data) {
+    console.log("Received data from server:", data);
+
+     // parse the data from the server and update the display
+    try {
+        const parsedData = JSON.parse(data);
+        if (parsedData.greeting) {
+            document.getElementById("greet_from_server").innerHTML = parsedData.greeting;
+        } else if (parsedData.status) {
+            document.getElementById("greet_from_server").innerHTML = parsedData.status;
+            updateDataDisplay(parsedData);
+        } else {
+            updateDataDisplay(parsedData);
+        }
+    // Handle any errors during data parsing
+    } catch (error) {
+        console.error("Error parsing server response:", error);
+        document.getElementById("greet_from_server").innerHTML = "Error processing server response";
+    }
 }
 
 function sendCommand(command) {
@@ -64,18 +105,102 @@ function updateDataDisplay(data) {
     }
 }
 
+// Seconds the H.264 player may fall behind the newest received frame before it skips ahead
+const MAX_VIDEO_LAG = 0.3;
+
+// Plays the H.264 stream from /video_h264 through Media Source Extensions.
+// Resolves to false if the browser or the server can't do H.264, so the caller can fall back to MJPEG.
+async function startH264Video(videoFeed) {
+    if (!window.MediaSource) {
+        return false;
+    }
+    let response;
+    try {
+        response = await fetch(`http://${server_addr}:9000/video_h264`);
+    } catch (error) {
+        console.error('H.264 stream unavailable:', error);
+        return false;
+    }
+    // The server names the codec it is encoding with, e.g. video/mp4; codecs="avc1.42c01e"
+    const mimeType = response.headers.get('Content-Type');
+    if (!response.ok || !MediaSource.isTypeSupported(mimeType)) {
+        console.log('H.264 stream not playable:', response.status, mimeType);
+        response.body.cancel();
+        return false;
+    }
+
+    const video = document.createElement('video');
+    video.muted = true;
+    video.autoplay = true;
+    video.playsInline = true;
+    const mediaSource = new MediaSource();
+    video.src = URL.createObjectURL(mediaSource);
+    videoFeed.appendChild(video);
+    await new Promise(resolve => mediaSource.addEventListener('sourceopen', resolve, { once: true }));
+
+    const sourceBuffer = mediaSource.addSourceBuffer(mimeType);
+    const queue = [];
+    const appendNext = () => {
+        if (queue.length && !sourceBuffer.updating) {
+            sourceBuffer.appendBuffer(queue.shift());
+        }
+    };
+    sourceBuffer.addEventListener('updateend', () => {
+        const buffered = sourceBuffer.buffered;
+        if (buffered.length) {
+            // Stay at the live edge; the server skips to a keyframe if this viewer falls behind
+            const end = buffered.end(buffered.length - 1);
+            if (end - video.currentTime > MAX_VIDEO_LAG) {
+                video.currentTime = end - 0.05;
+            }
+            // Drop what has been played; the next updateend carries on appending
+            if (video.currentTime - buffered.start(0) > 10) {
+                sourceBuffer.remove(buffered.start(0), video.currentTime - 5);
+                return;
+            }
+        }
+        appendNext();
+    });
+
+    const reader = response.body.getReader();
+    (async () => {
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                console.log('H.264 stream ended');
+                break;
+            }
+            queue.push(value);
+            appendNext();
+        }
+    })();
+    return true;
+}
+
+// Shows the MJPEG stream from /video_feed
+function startMjpegVideo(videoFeed) {
+    const img = document.createElement('img');
+    img.src = `http://${server_addr}:9000/video_feed`;
+    img.alt = "Camera Feed";
+    videoFeed.appendChild(img);
+}
+
 // Function to toggle the video feed display
+var videoStarted = false;
 function toggleVideo() {
     const videoFeed = document.getElementById("videoFeed");
     const toggleBtn = document.getElementById("toggleVideoBtn");
     if (videoFeed.style.display === "none") {
         videoFeed.style.display = "block";
         toggleBtn.textContent = "Hide Video";
-        if (!videoFeed.querySelector('img')) {
-            const img = document.createElement('img');
-            img.src = `http://${server_addr}:9000/video_feed`;
-            img.alt = "Camera Feed";
-            videoFeed.appendChild(img);
+        if (!videoStarted) {
+            videoStarted = true;
+            // Prefer H.264, which needs far less Wi-Fi bandwidth, and fall back to MJPEG
+            startH264Video(videoFeed).then((playing) => {
+                if (!playing) {
+                    startMjpegVideo(videoFeed);
+                }
+            });
         }
     } else {
         videoFeed.style.display = "none";
@@ -83,21 +208,34 @@ function toggleVideo() {
     }
 }
 
-// function getDetectionResult() {
-//     fetch(`http://${server_addr}:9000/detection_result`)
-//         .then(response => response.json())
-//         .then(data => {
-//             const detectionResult = document.getElementById('detectionResult');
-//             if (data.detected) {
-//                 detectionResult.textContent = `Detection: ${data.class_name} (Score: ${data.class_score.toFixed(2)})`;
-//             } else {
-//                 detectionResult.textContent = 'No object detected';
-//             }
-//         })
-//         .catch(error => console.error('Error fetching detection result:', error));
-// }
-
-// setInterval(getDetectionResult, 1000);
+// Keeps the car data display live from /telemetry. The server pushes only the values that
+// changed, so they are merged into the latest known values before being shown.
+function subscribeTelemetry() {
+    const latest = {};
+    const events = new EventSource(`http://${server_addr}:9000/telemetry`);
+    events.onmessage = (event) => {
+        Object.assign(latest, JSON.parse(event.data));
+        updateDataDisplay(latest);
+    };
+    // EventSource reconnects by itself after an error, and the first message then has every value again
+    events.onerror = (error) => console.error('Telemetry events error:', error);
+}
+
+// Shows detection results as the server pushes them, instead of polling /detection_result
+function subscribeDetections() {
+    const events = new EventSource(`http://${server_addr}:9000/detection_events`);
+    events.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        const detectionResult = document.getElementById('detectionResult');
+        if (data.detected) {
+            detectionResult.textContent = `Detection: ${data.class_name} (Score: ${data.class_score.toFixed(2)})`;
+        } else {
+            detectionResult.textContent = 'No object detected';
+        }
+    };
+    // EventSource reconnects by itself after an error
+    events.onerror = (error) => console.error('Detection events error:', error);
+}
 
 // Function to greet the user based on the input name
 function greeting(){
@@ -123,4 +261,6 @@ function setupEventListeners() {
     document.getElementById("speedDown").addEventListener('click', () => sendCommand('speedDown'));
 }
 
-document.addEventListener('DOMContentLoaded', setupEventListeners);
\ No newline at end of file
+document.addEventListener('DOMContentLoaded', setupEventListeners);
+document.addEventListener('DOMContentLoaded', subscribeTelemetry);
+document.addEventListener('DOMContentLoaded', subscribeDetections);
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+Background sensor sampler for wifi_server.py.
+
+Each sensor is polled on its own thread at its own rate and the results are
+published as an immutable snapshot. Readers just take a reference to the
+current snapshot, so answering a command never waits on sensor I/O.
+Subscribers can also block until a value actually changes (see `wait`).
+"""
+import threading
+import time
+
+
+class SensorSampler:
+    """
+    Polls a set of sensors in the background into a timestamped snapshot.
+
+    Args:
+        sensors (dict): Maps a value name to a (read_function, interval_seconds) pair.
+    """
+
+    def __init__(self, sensors):
+        self.sensors = sensors
+        # Replaced wholesale on every update and never mutated, so readers need no lock
+        self.snapshot = {"values": {}, "timestamps": {}}
+        self.update_lock = threading.Lock()  # Serializes writers only
+        self.version = 0  # Incremented whenever a value changes
+        self.changed = threading.Condition(self.update_lock)
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for name, (read, interval) in self.sensors.items():
+            thread = threading.Thread(target=self.poll, args=(name, read, interval), name=f"sensor-{name}")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def poll(self, name, read, interval):
+        while not self.stop_event.is_set():
+            start = time.monotonic()
+            self.sample(name, read)
+            self.stop_event.wait(max(0.0, interval - (time.monotonic() - start)))
+
+    def sample(self, name, read):
+        try:
+            value = read()
+        except Exception as e:
+            print(f"Error reading {name}: {e}")
+            return
+        self.update(name, value)
+
+    def update(self, name, value):
+        """
+        Publishes a value, polled or set by the caller (e.g. the speed setting).
+        """
+        now = time.monotonic()
+        with self.update_lock:
+            current = self.snapshot
+            self.snapshot = {
+                "values": {**current["values"], name: value},
+                "timestamps": {**current["timestamps"], name: now},
+            }
+            if name not in current["values"] or current["values"][name] != value:
+                self.version += 1
+                self.changed.notify_all()
+
+    def wait(self, version=None, timeout=None):
+        """
+        Blocks until a value has changed since `version`.
+
+        Args:
+            version (int): Version returned by the previous call, None to return at once.
+            timeout (float): Seconds to wait, None for no limit.
+
+        Returns:
+            int: The current version, unchanged if the timeout expired.
+        """
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def read(self, fresh=False):
+        """
+        Returns the latest value of every sensor.
+
+        Args:
+            fresh (bool): Read every sensor synchronously first instead of using the cache.
+
+        Returns:
+            dict: Sensor values by name, plus "age": seconds since the oldest value
+                in the snapshot was sampled (None until every sensor has reported).
+        """
+        if fresh:
+            for name, (read, _) in self.sensors.items():
+                self.sample(name, read)
+
+        snapshot = self.snapshot
+        values = dict(snapshot["values"])
+        # Only polled sensors age; values set through update() don't
+        timestamps = [snapshot["timestamps"][name] for name in self.sensors if name in snapshot["timestamps"]]
+        if len(timestamps) == len(self.sensors):
+            values["age"] = round(time.monotonic() - min(timestamps), 3)
+        else:
+            values["age"] = None
+        return values
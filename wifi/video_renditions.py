@@ -0,0 +1,156 @@
+"""
+Shared JPEG renditions of the camera feed for wifi_server.py's /video_feed.
+
+A viewer asks for a width, JPEG quality and frame rate, which are snapped to a
+small set of supported values. Every distinct (width, quality, fps) profile is
+encoded by one thread, shared by all viewers of that profile, and stopped when
+its last viewer disconnects, so encoding cost follows the number of profiles in
+use rather than the number of viewers.
+
+Each rendition only keeps its latest encoded frame. A viewer that can't keep up
+gets the newest frame whenever it is ready for one and skips the rest, so no
+backlog builds up for a slow connection.
+"""
+import threading
+
+import cv2
+
+WIDTHS = (160, 320, 480, 640)
+QUALITIES = (30, 50, 65, 80)
+FRAME_RATES = (5, 10, 15, 30)
+DEFAULT_PROFILE = (640, 80, 30)
+
+
+def nearest(value, choices):
+    return min(choices, key=lambda choice: abs(choice - value))
+
+
+def parse_profile(width=None, quality=None, fps=None):
+    """
+    Snaps requested stream parameters to a supported profile.
+
+    Args:
+        width (int): Frame width in pixels, None for the default.
+        quality (int): JPEG quality, None for the default.
+        fps (int): Frames per second, None for the default.
+
+    Returns:
+        tuple: (width, quality, fps).
+    """
+    default_width, default_quality, default_fps = DEFAULT_PROFILE
+    return (nearest(width, WIDTHS) if width else default_width,
+            nearest(quality, QUALITIES) if quality else default_quality,
+            nearest(fps, FRAME_RATES) if fps else default_fps)
+
+
+class Rendition:
+    """
+    Encodes the frames of a FrameBus for one profile on a background thread.
+
+    Args:
+        bus (FrameBus): Source of camera frames.
+        profile (tuple): (width, quality, fps) as returned by parse_profile.
+    """
+
+    def __init__(self, bus, profile):
+        self.bus = bus
+        self.profile = profile
+        self.width, self.quality, fps = profile
+        self.period = 1.0 / fps
+        self.cond = threading.Condition()
+        self.frame = None  # Latest encoded JPEG
+        self.seq = 0  # Bus sequence number of the frame in self.frame
+        self.viewers = 0
+        self.encoded = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name=f"rendition-{self.width}-{self.quality}")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        last_seq = 0
+        last_time = None
+        while self.running:
+            seq, timestamp, frame = self.bus.wait(last_seq, timeout=1.0)
+            if seq is None:
+                continue
+            last_seq = seq
+            # Thin the camera rate down to the profile's; allow for a little capture jitter
+            if last_time is not None and timestamp - last_time < self.period * 0.9:
+                continue
+            last_time = timestamp
+
+            height, width = frame.shape[:2]
+            if self.width < width:
+                size = (self.width, round(height * self.width / width))
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            with self.cond:
+                self.frame = buffer.tobytes()
+                self.seq = seq
+                self.encoded += 1
+                self.cond.notify_all()
+
+    def wait(self, after=0, timeout=None):
+        """
+        Blocks until a frame newer than `after` has been encoded.
+
+        Returns:
+            tuple: (seq, jpeg bytes) of the latest encoded frame, (None, None) on timeout.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after, timeout):
+                return None, None
+            return self.seq, self.frame
+
+
+class Renditions:
+    """
+    The renditions currently being watched, by profile.
+
+    Args:
+        bus (FrameBus): Source of camera frames.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.renditions = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, profile):
+        """
+        Returns the rendition for a profile, starting its encoder for the first viewer.
+        """
+        with self.lock:
+            rendition = self.renditions.get(profile)
+            if rendition is None:
+                rendition = self.renditions[profile] = Rendition(self.bus, profile)
+                rendition.start()
+            rendition.viewers += 1
+            return rendition
+
+    def release(self, rendition):
+        """
+        Stops a rendition's encoder once its last viewer has gone.
+        """
+        with self.lock:
+            rendition.viewers -= 1
+            if rendition.viewers == 0:
+                rendition.stop()
+                del self.renditions[rendition.profile]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Viewers and frames encoded so far, by "width/quality/fps" profile.
+        """
+        with self.lock:
+            return {"/".join(map(str, profile)): {"viewers": r.viewers, "encoded": r.encoded}
+                    for profile, r in self.renditions.items()}
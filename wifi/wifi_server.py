@@ -1,24 +1,53 @@
-import socket
+import os
+import sys
 import json
-import picar_4wd as fc
-from flask import Flask, Response
-from picamera2 import Picamera2
-import cv2
+from flask import Flask, Response, request, jsonify
 import threading
 import time
-# from image_recognition import get_latest_frame, get_latest_detection
+import control_server
+from sensor_sampler import SensorSampler
+from frame_bus import FrameBus
+from video_renditions import Renditions, parse_profile
+import h264_stream
+from detection_worker import DetectionWorker
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import hardware
 
 HOST = "10.0.0.22" # IP address of your Raspberry PI
 PORT = 65432          # Port to listen on (non-privileged ports are > 1023)
+PERSIST_COMMAND = "persist" # First line that switches a control connection to persistent mode
+DISTANCE_INTERVAL = 0.1 # Seconds between ultrasonic reads
+GRAYSCALE_INTERVAL = 0.05 # Seconds between grayscale reads
+TELEMETRY_RATE = 10 # Default maximum /telemetry updates per second per subscriber
+# Set PICAR_DETECTION=off to run without on-board object detection
+DETECTION_ENABLED = os.environ.get("PICAR_DETECTION", "on") != "off"
 
 # Flask app
 app = Flask(__name__)
 
 
-latest_frame = None
-frame_lock = threading.Lock()
+# Ring of recent camera frames; consumers block for the next frame instead of polling
+frame_bus = FrameBus()
+
+# One shared encoder per (width, quality, fps) profile being watched on /video_feed
+renditions = Renditions(frame_bus)
+# H.264 in fragmented MP4 for /video_h264, one encoder shared by every viewer
+h264 = h264_stream.H264Stream(frame_bus)
+# Object detection in a child process, on whichever frame is latest when the model is free
+detector = DetectionWorker(frame_bus)
 speed = 25 # Initial speed of the car
 
+# PiCar-4WD by default; set PICAR_BACKEND=sim to run off the car
+car = hardware.create_car("4wd")
+
+# Polls the sensors in the background so commands never wait on sensor I/O
+sensor_sampler = SensorSampler({
+    "distance": (car.get_distance, DISTANCE_INTERVAL),
+    "grayscale": (car.get_grayscale_data, GRAYSCALE_INTERVAL),
+})
+sensor_sampler.update("speed", speed) # Published alongside the sensors for /telemetry
+
 
 """
     Handles incoming commands from the client and controls the car accordingly.
@@ -33,27 +62,31 @@ def handle_command(command):
     global speed
     print(f"Received command: {command}")
     if command == 'forward':
-        fc.forward(speed)
+        car.forward(speed)
         return json.dumps({"status": "Moving forward", **get_car_data()})
     elif command == 'backward':
-        fc.backward(speed)
+        car.backward(speed)
         return json.dumps({"status": "Moving backward", **get_car_data()})
     elif command == 'left':
-        fc.turn_left(speed)
+        car.turn_left(speed)
         return json.dumps({"status": "Turning left", **get_car_data()})
     elif command == 'right':
-        fc.turn_right(speed)
+        car.turn_right(speed)
         return json.dumps({"status": "Turning right", **get_car_data()})
     elif command == 'stop':
-        fc.stop()
+        car.stop()
         return json.dumps({"status": "Stopped", **get_car_data()})
     elif command == 'getData':
         return json.dumps(get_car_data())
+    elif command == 'getFreshData':
+        return json.dumps(get_car_data(fresh=True))
     elif command == 'speedUp':
         speed = min(speed + 5, 100)
+        sensor_sampler.update("speed", speed)
         return json.dumps({"status": "Speed increased", "speed": speed})
     elif command == 'speedDown':
         speed = max(speed - 5, 0)
+        sensor_sampler.update("speed", speed)
         return json.dumps({"status": "Speed decreased", "speed": speed})
     else:
         return json.dumps({"greeting": f"Hello {command} from the server!"})
@@ -61,106 +94,178 @@ def handle_command(command):
 """
     Retrieves the current data from the car's sensors.
 
+    Values come from the background sensor snapshot unless fresh is set.
+
+    Args:
+        fresh (bool): Read the sensors synchronously instead of using the snapshot.
+
     Returns:
-        dict: A dictionary containing distance, grayscale sensor values, and speed.
+        dict: A dictionary containing distance, grayscale sensor values, speed,
+            and the age of the sensor snapshot in seconds.
 """
-def get_car_data():
+def get_car_data(fresh=False):
     return {
         # "speed": fc.speed_val(),
-        "distance": fc.us.get_distance(),
-        "grayscale": fc.get_grayscale_list(),
+        **sensor_sampler.read(fresh),
         "speed": speed
     }
 
-# Initializes the PiCamera2 for capturing video frames
+# Initializes the camera for capturing video frames
 def initialize_camera():
-    picam2 = Picamera2()
-    config = picam2.create_preview_configuration(main={"size": (640, 480), "format": "RGB888"})
-    picam2.configure(config)
-    picam2.start()
-    return picam2
+    return car.open_camera((640, 480))
 
-# Continuously captures frames from the camera and updates the latest_frame variable.
+# Continuously captures frames from the camera and publishes them on frame_bus.
+# capture_array() blocks until the sensor delivers the next frame, so this runs at the camera's frame rate.
 def capture_frames(picam2):
-    global latest_frame
     while True:
-        frame = picam2.capture_array()
-        with frame_lock: # Acquire the lock before updating latest_frame
-            latest_frame = frame
-        time.sleep(0.03)  # 30 FPS
+        frame_bus.publish(picam2.capture_array())
+
+# Generates encoded JPEG frames of one profile for a /video_feed viewer.
+# Each viewer takes the latest frame whenever it is ready for one, so a slow viewer skips frames
+# instead of queueing them, and no frame is sent twice.
+def generate_frames(profile):
+    rendition = renditions.acquire(profile)
+    try:
+        last_seq = 0
+        while True:
+            last_seq, frame = rendition.wait(last_seq)
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+    finally:
+        # Runs when the viewer disconnects and Flask closes the generator
+        renditions.release(rendition)
+
+# Generates the fragmented MP4 stream for a /video_h264 viewer, starting with the init segment.
+def generate_h264(init):
+    yield init
+    last_index = 0
+    while True:
+        fragments = h264.fragments(last_index, timeout=5.0)
+        if not fragments:
+            return # Encoder stopped or stalled
+        for last_index, _, fragment in fragments:
+            yield fragment
+
+# Formats a Server-Sent Events message carrying a JSON payload
+def sse_event(data):
+    return f"data: {json.dumps(data)}\n\n"
 
-# Generates encoded JPEG frames for the video feed.
-def generate_frames():
+# Rounds telemetry values to the sensors' resolution, so noise below it isn't sent as a change
+def compact(value):
+    if isinstance(value, float):
+        return round(value, 1)
+    if isinstance(value, (list, tuple)):
+        return [compact(item) for item in value]
+    return value
+
+# Pushes sensor snapshots to a /telemetry subscriber, at most `rate` a second.
+# Every subscriber shares sensor_sampler; each message only carries the values that changed
+# since the last one sent to this subscriber, and nothing is sent while nothing changes.
+def generate_telemetry(rate):
+    sent = {}
+    version = None
+    last_message = time.monotonic()
     while True:
-        with frame_lock: # Acquire the lock before updating latest_frame
-            if latest_frame is not None:
-                _, buffer = cv2.imencode('.jpg', latest_frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                frame = buffer.tobytes()
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        time.sleep(0.03)  # 30 FPS
-
-# def generate_frames():
-#     while True:
-#         frame = get_latest_frame()
-#         if frame is not None:
-#             detection = get_latest_detection()
-#             if detection['detected']:
-#                 label = f"{detection['class_name']}: {detection['class_score']:.2f}"
-#                 cv2.putText(frame, label, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-#             _, buffer = cv2.imencode('.jpg', frame)
-#             frame = buffer.tobytes()
-#             yield (b'--frame\r\n'
-#                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-#         else:
-#             time.sleep(0.1)
+        version = sensor_sampler.wait(version, timeout=15.0)
+        values = {name: compact(value) for name, value in sensor_sampler.snapshot["values"].items()}
+        delta = {name: value for name, value in values.items() if name not in sent or sent[name] != value}
+        if delta:
+            sent.update(delta)
+            yield sse_event(delta)
+        elif time.monotonic() - last_message > 15.0:
+            yield ": keepalive\n\n" # Lets a dead connection fail and end this generator
+        else:
+            continue
+        last_message = time.monotonic()
+        # Changes made in the meantime are coalesced into the next message
+        time.sleep(1.0 / rate)
 
+# Pushes every new detection result to a /detection_events subscriber
+def generate_detection_events():
+    yield sse_event(detector.latest())
+    last_index = 0
+    while True:
+        index, result = detector.wait(last_index, timeout=15.0)
+        if result is None:
+            yield ": keepalive\n\n" # Lets a dead connection fail and end this generator
+            continue
+        last_index = index
+        yield sse_event(result)
 
+
+# Optional query parameters pick the stream profile, e.g. /video_feed?w=320&q=50&fps=10.
+# Values are snapped to the nearest supported profile (see video_renditions.py).
 @app.route('/video_feed')
 def video_feed():
-    return Response(generate_frames(),
+    profile = parse_profile(request.args.get('w', type=int), request.args.get('q', type=int),
+                            request.args.get('fps', type=int))
+    return Response(generate_frames(profile),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
     
-# For object recognition
-# @app.route('/detection_result')
-# def detection_result():
-#     return jsonify(get_latest_detection())
+# H.264 alternative to /video_feed at a fraction of the bandwidth, for Media Source Extensions.
+# Answers 503 when PyAV or an H.264 encoder isn't available, so clients can fall back to MJPEG.
+@app.route('/video_h264')
+def video_h264():
+    if not h264_stream.available():
+        return Response("H.264 streaming needs PyAV", status=503)
+    h264.acquire()
+    init = h264.wait_init(timeout=5.0)
+    if init is None:
+        h264.release()
+        return Response("H.264 encoder unavailable", status=503)
+    response = Response(generate_h264(init), mimetype=f'video/mp4; codecs="{h264.codec}"')
+    # The Electron page is loaded from a file:// URL
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    # Runs when the viewer disconnects, even if the stream never started
+    response.call_on_close(h264.release)
+    return response
 
-# Runs the TCP server that listens for incoming connections and handles commands.
-def run_server():
-    host = "10.0.0.22"
-    port = 65432
+# Latest object detection result, tagged with the seq of the frame it came from
+@app.route('/detection_result')
+def detection_result():
+    response = jsonify(detector.latest())
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
 
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind((host, port)) # Bind the socket to the address and port
-        s.listen() # Start listening for incoming connections
-        print(f"Server listening on {host}:{port}")
+# Server-Sent Events stream of detection results, pushed as soon as each one is ready
+@app.route('/detection_events')
+def detection_events():
+    response = Response(generate_detection_events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
 
-        while True:
-            client, clientInfo = s.accept()
-            print("Server received connection from:", clientInfo)
-            data = client.recv(1024).decode().strip()
-            print(f"Received data: {data}")
+# Server-Sent Events stream of sensor values and speed; the first message has every value,
+# later ones only what changed. The rate (updates per second) can be set with ?rate=.
+@app.route('/telemetry')
+def telemetry():
+    rate = min(max(request.args.get('rate', TELEMETRY_RATE, type=float), 0.1), 50)
+    response = Response(generate_telemetry(rate), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
 
-            if data:
-                response = handle_command(data)
-                print(f"Sending response: {response}")
-                client.sendall(response.encode())
-            
-            client.close()
+# Runs the TCP control server that listens for incoming connections and handles commands.
+# See control_server.py: connections are served concurrently on an asyncio event loop
+# and handle_command runs on a dedicated hardware thread.
+def run_server(host=HOST, port=PORT):
+    control_server.run_server(handle_command, host, port, PERSIST_COMMAND)
 
 
 
 # The use of separate threads for capturing frames and running the Flask server allows the server to handle multiple tasks concurrently without blocking.
 if __name__ == '__main__':
     picam2 = initialize_camera()
-
+    sensor_sampler.start()
 
     # Start a separate thread to capture frames continuously
     frame_thread = threading.Thread(target=capture_frames, args=(picam2,))
     frame_thread.daemon = True
     frame_thread.start()
 
+    if DETECTION_ENABLED:
+        detector.start()
+
     # Start the Flask server in a separate thread
     flask_thread = threading.Thread(target=lambda: app.run(host='0.0.0.0', port=9000, threaded=True))
     flask_thread.daemon = True